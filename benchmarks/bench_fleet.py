@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Fan-out check for ``shifter-toolkit fleet`` against local agents.
+
+A child process serves one agent app (``create_agent_app``) on ``--agents``
+loopback ports, using the fake commands and fixture configs from
+``bench_suite``. Each port stands in for one host. The controller then runs
+``fleet status``, ``fleet apply --plan`` and an ``apply`` of an unchanged
+document across all of them, plus ``--dead`` ports where nothing listens to
+exercise timeouts and retries. The script reports the wall time of each round
+and exits non-zero if a live agent failed or a dead one did not. Run from the
+repository root:
+
+    PYTHONPATH=src python benchmarks/bench_fleet.py [--agents 200] [--dead 2] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bcrypt
+
+from bench_suite import install_fake_commands, redirect_paths, write_fixtures
+from shifter import fleet
+from shifter.services import gost
+from shifter.web.auth import AuthManager
+
+
+async def _serve(root, count):
+    from aiohttp import web
+    from shifter.web.app import create_agent_app
+
+    redirect_paths(root)
+    runner = web.AppRunner(create_agent_app(AuthManager(Path(root) / "auth.json")))
+    await runner.setup()
+    ports = []
+    for _ in range(count):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(128)
+        await web.SockSite(runner, sock).start()
+        ports.append(sock.getsockname()[1])
+    print(json.dumps(ports), flush=True)
+    # Serve until the parent closes our stdin.
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    await runner.cleanup()
+
+
+def _dead_ports(count):
+    ports = []
+    for _ in range(count):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            ports.append(sock.getsockname()[1])
+    return ports
+
+
+def _round(name, func, expect_ok, expect_failed):
+    started = time.perf_counter()
+    results = func()
+    wall = time.perf_counter() - started
+    summary = fleet.summary(results)
+    slowest = max(result.elapsed for result in results)
+    print(f"  {name:<28} {wall * 1000:9.1f} ms wall   slowest host {slowest * 1000:8.1f} ms   "
+          f"{summary['ok']} ok / {summary['failed']} failed")
+    bad = [r for r in results if r.ok != (r.host not in expect_failed)]
+    for result in bad[:5]:
+        print(f"    unexpected: {result.host} ok={result.ok} {result.error}")
+    return not bad and summary["ok"] == expect_ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=200, help="Loopback ports serving the agent API.")
+    parser.add_argument("--dead", type=int, default=2, help="Extra hosts where nothing listens.")
+    parser.add_argument("--concurrency", type=int, default=fleet.DEFAULT_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--tunnels", type=int, default=100, help="Fixture size on the agents.")
+    parser.add_argument("--serve", metavar="ROOT", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        asyncio.run(_serve(args.serve, args.agents))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="shifter-fleet-") as root:
+        install_fake_commands(root)
+        paths = redirect_paths(root)
+        write_fixtures(paths, root, args.tunnels)
+        auth_file = Path(root) / "auth.json"
+        auth_file.write_text(json.dumps({"username": "bench", "password_hash": bcrypt.hashpw(b"x", bcrypt.gensalt(4)).decode()}))
+        token = AuthManager(auth_file).create_api_token("bench")
+
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", root, "--agents", str(args.agents)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        try:
+            ports = json.loads(child.stdout.readline())
+            hosts = [fleet.Host(f"http://127.0.0.1:{port}", token) for port in ports]
+            dead = [fleet.Host(f"http://127.0.0.1:{port}", token) for port in _dead_ports(args.dead)]
+            options = fleet.FleetOptions(concurrency=args.concurrency, timeout=args.timeout,
+                                         retries=args.retries, backoff=0.05)
+            document = {"gost": [{"port": int(r["port"]), "destination": r["domain"]} for r in gost.list_rules()]}
+            failed = {host.name for host in dead}
+            everyone = hosts + dead
+
+            print(f"{len(hosts)} agents + {len(dead)} dead host(s), concurrency {args.concurrency}, "
+                  f"{args.retries} retr{'y' if args.retries == 1 else 'ies'}")
+            passed = all([
+                _round("fleet status", lambda: fleet.status(everyone, options), len(hosts), failed),
+                _round("fleet status (again)", lambda: fleet.status(everyone, options), len(hosts), failed),
+                _round("fleet apply --plan", lambda: fleet.apply(everyone, document, True, options), len(hosts), failed),
+                _round("fleet apply (no changes)", lambda: fleet.apply(everyone, document, False, options), len(hosts), failed),
+                _round("bad token rejected", lambda: fleet.status([fleet.Host(hosts[0].url, "shf_wrong")], options), 0,
+                       {hosts[0].name}),
+            ])
+        finally:
+            child.stdin.close()
+            child.wait(timeout=30)
+    if not passed:
+        print("FAIL: some hosts did not answer as expected")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Benchmark the haproxy.cfg model on a synthetic config with many tunnels.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_haproxy_config.py [--tunnels 10000]
+
+The legacy numbers come from the regex scan ``list_tunnels`` used before the
+structured model existed.
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from shifter.services import haproxy_config
+from shifter.services.haproxy_config import HAProxyConfig
+
+from fixtures import haproxy_cfg
+
+
+def legacy_list_tunnels(content):
+    frontend_pattern = re.compile(r"frontend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
+    backend_pattern = re.compile(r"backend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
+    frontends = {m.group(1): m.group(2) for m in frontend_pattern.finditer(content)}
+    backends = {m.group(1): m.group(2) for m in backend_pattern.finditer(content)}
+    tunnels = []
+    for fe_name, fe_config in frontends.items():
+        bind_match = re.search(r"bind\s+.*?:(\d+)", fe_config)
+        backend_match = re.search(r"default_backend\s+([^\s]+)", fe_config)
+        be_name = backend_match.group(1) if backend_match else "N/A"
+        destination = "N/A"
+        if be_name in backends:
+            server_match = re.search(r"server\s+\w+\s+([^\s]+)", backends[be_name])
+            if server_match:
+                destination = server_match.group(1)
+        tunnels.append((fe_name, bind_match.group(1) if bind_match else "N/A", destination))
+    return tunnels
+
+
+def timed(label, func, repeat=5):
+    best = float("inf")
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:10.2f} ms")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tunnels", type=int, default=10000)
+    args = parser.parse_args()
+
+    content = haproxy_cfg(args.tunnels)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "haproxy.cfg")
+        with open(path, "w") as f:
+            f.write(content)
+        print(f"{args.tunnels} tunnels, {len(content.splitlines())} lines")
+
+        timed("legacy regex list_tunnels", lambda: legacy_list_tunnels(content))
+        timed("parse + tunnels()", lambda: HAProxyConfig.parse(content).tunnels())
+        cfg = haproxy_config.load(path)
+        timed("cached load + tunnels()", lambda: haproxy_config.load(path).tunnels(), repeat=1000)
+        timed("frontend_for_port (1000 lookups)",
+              lambda: [cfg.frontend_for_port(10000 + i) for i in range(1000)])
+        timed("legacy duplicate check (substring)",
+              lambda: f"frontend tunnel-{10000 + args.tunnels - 1}" in content)
+
+        def add_and_write():
+            fresh = HAProxyConfig.from_file(path)
+            fresh.add_tunnel(60000, "192.0.2.1", 443)
+            fresh.write(path)
+            removed = HAProxyConfig.from_file(path)
+            removed.remove_section(removed.frontends["tunnel-60000"])
+            removed.remove_section(removed.backends["tunnel-192.0.2.1-443"])
+            removed.write(path)
+
+        timed("add + append write, remove + rewrite", add_and_write)
+
+
+if __name__ == "__main__":
+    main()
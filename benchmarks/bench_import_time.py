@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""Import-time regression check for ``shifter-toolkit status``.
+
+Each run starts a fresh interpreter with ``-X importtime``, imports
+``shifter.cli`` and runs ``status --json`` against the fake commands from
+``bench_suite``. It then reports the cumulative import time of
+``shifter.cli`` and the wall time of the whole process. The script exits
+non-zero when the median import time is over the budget, or when a module
+that only some commands need (aiohttp, requests) was loaded along the way.
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_import_time.py [--budget-ms 250] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_suite import install_fake_commands
+
+DEFAULT_BUDGET_MS = 250.0
+
+# Only ``serve``, the Web UI and the GOST installer need these.
+LAZY_MODULES = ("aiohttp", "requests", "jinja2", "importlib.metadata")
+
+CHILD = """
+import sys
+from shifter.cli import cli
+try:
+    cli(["status", "--json"], standalone_mode=False)
+except SystemExit:
+    pass
+print("@@" + __import__("json").dumps([m for m in %r if m in sys.modules]))
+""" % (LAZY_MODULES,)
+
+
+def _import_us(stderr, module="shifter.cli"):
+    for line in stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"{module} is missing from the -X importtime output")
+
+
+def measure_once(env):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        capture_output=True, text=True, env=env, timeout=60,
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"status run failed:\n{completed.stderr[-2000:]}")
+    marker = [line for line in completed.stdout.splitlines() if line.startswith("@@")]
+    loaded = json.loads(marker[-1][2:]) if marker else []
+    return _import_us(completed.stderr) / 1000.0, wall * 1000.0, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Fail when the median import time of shifter.cli exceeds this.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="shifter-import-") as root:
+        install_fake_commands(root)
+        env = dict(os.environ)
+        imports, walls, loaded = [], [], set()
+        for _ in range(max(args.runs, 1)):
+            import_ms, wall_ms, modules = measure_once(env)
+            imports.append(import_ms)
+            walls.append(wall_ms)
+            loaded.update(modules)
+
+    median_import = statistics.median(imports)
+    print(f"import shifter.cli   median {median_import:7.1f} ms  best {min(imports):7.1f} ms  (budget {args.budget_ms:g} ms)")
+    print(f"status --json total  median {statistics.median(walls):7.1f} ms  best {min(walls):7.1f} ms")
+
+    failed = False
+    if median_import > args.budget_ms:
+        print(f"FAIL: importing shifter.cli is over budget by {median_import - args.budget_ms:.1f} ms")
+        failed = True
+    if loaded:
+        print(f"FAIL: `status` loaded modules it does not need: {', '.join(sorted(loaded))}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""Benchmark status parsing of a synthetic iptables-save dump.
+
+Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_iptables_nat.py [--lines 50000]
+
+The dump mimics a busy Docker/k8s node: a large filter table, a nat table full
+of service DNAT rules and Shifter's own chains. ``*tables-save`` is replaced
+with ``cat`` of the dump so the numbers include reading from a pipe but not
+the kernel's cost of dumping the rules. The legacy numbers come from the
+per-line regex scan of a full ``iptables-save`` that status used before.
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from shifter.services import iptables_nat
+
+from fixtures import iptables_save
+
+
+def legacy_parse(output):
+    found = []
+    for line in output.splitlines():
+        if "-A PREROUTING" in line and "-j DNAT" in line:
+            proto_match = re.search(r"-p\s+(tcp|udp)", line)
+            dports_match = re.search(r"--dports\s+([\d,]+)", line)
+            dest_match = re.search(r"--to-destination\s+([\d\.]+)", line)
+            if proto_match and dports_match and dest_match:
+                found.append((proto_match.group(1), dports_match.group(1), dest_match.group(1)))
+    return found
+
+
+def timed(label, func, repeat=5):
+    best = float("inf")
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:10.2f} ms")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50000)
+    args = parser.parse_args()
+
+    dump = iptables_save(args.lines // 20, background=args.lines)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "iptables.dump")
+        with open(path, "w") as f:
+            f.write(dump)
+        iptables_nat.SAVE_COMMANDS["ipv4"] = ["cat", path]
+        iptables_nat.RULES_FILES["ipv4"] = path
+        print(f"{len(dump.splitlines())} lines, {len(dump) / 1e6:.1f} MB")
+
+        timed("legacy regex scan (string in memory)", lambda: legacy_parse(dump))
+        table = timed("NatTable.parse (string in memory)", lambda: iptables_nat.NatTable.parse(dump.splitlines(True)))
+        print(f"  {len(table.records)} records, {len(table.forwards())} forwards")
+        timed("stream_save (pipe + parse)", lambda: iptables_nat.stream_save("ipv4"))
+        iptables_nat.load("ipv4")
+        timed("cached load", lambda: iptables_nat.load("ipv4"), repeat=1000)
+        timed("lookup (1000 ports)", lambda: [table.lookup(port) for port in range(1000, 2000)])
+
+
+if __name__ == "__main__":
+    main()
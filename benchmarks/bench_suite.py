@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+"""Benchmark Shifter's parsers, status probes and add/remove paths end to end.
+
+Runs without root or real services. Config paths are redirected into a temp
+directory holding synthetic fixtures, and a directory of fake commands
+(``sudo``, ``systemctl``, ``iptables-save``...) is put first on
+``PATH``. The timings therefore include the real forks and file I/O, but not
+the work of the real daemons. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/bench_suite.py [--sizes 10,1000,10000,50000] \\
+        [--repeat 5] [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from shifter.services import (
+    desired,
+    gost,
+    gost_config,
+    haproxy,
+    haproxy_config,
+    iptables,
+    iptables_nat,
+    ports,
+    registry,
+    status,
+    xray,
+    xray_stats,
+)
+from shifter.services.results import ActionResult
+
+import fixtures
+
+# Fake commands. Every one accepts any arguments; state they report is static.
+FAKE_COMMANDS = {
+    "sudo": '#!/bin/sh\nexec "$@"\n',
+    "systemctl": """#!/bin/sh
+if [ "$1" = "show" ]; then
+    shift 2
+    [ "$1" = "--" ] && shift
+    for unit in "$@"; do
+        printf 'Id=%s.service\\nLoadState=loaded\\nActiveState=active\\nSubState=running\\n' "$unit"
+        printf 'UnitFileState=enabled\\nMainPID=4242\\nNRestarts=0\\nMemoryCurrent=10485760\\nCPUUsageNSec=1000000\\n\\n'
+    done
+fi
+exit 0
+""",
+    "iptables-save": '#!/bin/sh\nexec cat "$SHIFTER_BENCH_DIR/iptables.save"\n',
+    "ip6tables-save": "#!/bin/sh\nexit 0\n",
+    "iptables-restore": "#!/bin/sh\nexec cat > /dev/null\n",
+    "nft": "#!/bin/sh\nexec cat > /dev/null\n",
+}
+
+DEFAULT_SIZES = "10,1000,10000,50000"
+
+
+def install_fake_commands(root):
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, script in FAKE_COMMANDS.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+    os.environ["SHIFTER_BENCH_DIR"] = root
+    os.environ["SHIFTER_CONFIG_DIR"] = os.path.join(root, "shifter")
+
+
+def redirect_paths(root):
+    """Point every module-level config path at ``root``."""
+    paths = {
+        "GOST_SERVICE_PATH": os.path.join(root, "gost.service"),
+        "GOST_CONFIG_PATH": os.path.join(root, "gost", "config.json"),
+        "HAPROXY_CONFIG_PATH": os.path.join(root, "haproxy.cfg"),
+        "XRAY_CONFIG_PATH": os.path.join(root, "xray.json"),
+        "IPTABLES_RULES_PATH": os.path.join(root, "iptables", "rules.v4"),
+        "IPTABLES_DIR": os.path.join(root, "iptables"),
+    }
+    for module in (gost, gost_config, haproxy, iptables, ports, registry, status, xray, xray_stats):
+        for name, path in paths.items():
+            if hasattr(module, name):
+                setattr(module, name, path)
+    iptables_nat.RULES_FILES["ipv4"] = paths["IPTABLES_RULES_PATH"]
+    # The fake services cannot die after a reload, so skip the post-reload grace period.
+    gost.RELOAD_SETTLE_SECONDS = 0.0
+    xray.RESTART_SETTLE_SECONDS = 0.0
+    return paths
+
+
+def write_fixtures(paths, root, tunnels):
+    os.makedirs(os.path.dirname(paths["GOST_CONFIG_PATH"]), exist_ok=True)
+    os.makedirs(paths["IPTABLES_DIR"], exist_ok=True)
+    unit = fixtures.load_text_template("gost.service").replace("/etc/gost/config.json", paths["GOST_CONFIG_PATH"])
+    files = {
+        paths["GOST_SERVICE_PATH"]: unit,
+        paths["GOST_CONFIG_PATH"]: fixtures.gost_config(tunnels),
+        paths["HAPROXY_CONFIG_PATH"]: fixtures.haproxy_cfg(tunnels),
+        paths["XRAY_CONFIG_PATH"]: fixtures.xray_config(tunnels),
+        os.path.join(root, "iptables.save"): fixtures.iptables_save(tunnels),
+    }
+    for path, content in files.items():
+        with open(path, "w") as f:
+            f.write(content)
+    with open(paths["IPTABLES_RULES_PATH"], "w") as f:
+        f.write(files[os.path.join(root, "iptables.save")])
+
+
+def measure(func, repeat, setup=None):
+    """Time ``func`` ``repeat`` times; the first (cold) run is reported separately."""
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {
+        "first": runs[0],
+        "best": min(runs),
+        "median": statistics.median(runs),
+        "runs": len(runs),
+    }
+
+
+def cases(tunnels):
+    """Return ``{name: (func, setup)}`` for one fixture size."""
+    new_port = 65100 - 1  # above every fixture port
+    new_ip = "192.0.2.10"
+
+    def checked(result):
+        if not result.success:
+            raise RuntimeError(result.text())
+
+    def iptables_add():
+        result = ActionResult()
+        rules = iptables._load_rules(result)
+        rules.add(new_ip, str(new_port))
+        if not iptables._apply_rules(result, rules):
+            raise RuntimeError(result.text())
+
+    def unchanged_plan():
+        # The fixtures reuse ports across services, so parse each service on its own.
+        documents = {
+            "gost": [{"port": int(r["port"]), "destination": r["domain"]} for r in gost.list_rules()],
+            "haproxy": [{"port": int(t["port"]), "destination": t["destination"]}
+                        for t in haproxy.list_tunnels() if t["port"] != "N/A"],
+            "xray": [{"port": i["port"], "destination": i["destination"]} for i in xray.list_inbounds()],
+        }
+        wanted = {}
+        for service, items in documents.items():
+            wanted.update(desired.parse(json.dumps({service: items})))
+        return wanted
+
+    wanted = unchanged_plan()
+
+    def plan_unchanged():
+        plan = desired.plan(wanted)
+        if plan.changes:
+            raise RuntimeError("\n".join(plan.lines()))
+
+    return {
+        "gost.list_rules": (gost.list_rules, None),
+        "haproxy.list_tunnels": (haproxy.list_tunnels, None),
+        "haproxy.list_tunnels (uncached)": (haproxy.list_tunnels, lambda: (haproxy_config._cache.clear(), registry._entries_cache.clear())),
+        "xray.list_inbounds": (xray.list_inbounds, None),
+        "status.get_gost_status": (status.get_gost_status, None),
+        "status.get_haproxy_status": (status.get_haproxy_status, None),
+        "status.get_xray_status": (status.get_xray_status, None),
+        "status.get_iptables_status": (status.get_iptables_status, None),
+        "status.get_iptables_status (uncached)": (status.get_iptables_status, iptables_nat.invalidate),
+        "status.get_all_services_status": (status.get_all_services_status, None),
+        "ports.scan (port registry)": (ports.scan, None),
+        "registry.rebuild (import every config)": (registry.rebuild, None),
+        "desired.plan (unchanged file)": (plan_unchanged, None),
+        "gost add + remove": (
+            lambda: (checked(gost.add_port_gost("bench.example.com", new_port)),
+                     checked(gost.remove_rule_by_port(new_port))),
+            None,
+        ),
+        "haproxy add + remove": (
+            lambda: (checked(haproxy.add_frontend_backend(new_port, new_ip, 443)),
+                     checked(haproxy.remove_tunnel(f"tunnel-{new_port}"))),
+            None,
+        ),
+        "xray add + remove": (
+            lambda: (checked(xray.add_another_inbound(new_ip, new_port)),
+                     checked(xray.remove_inbound_by_port(new_port))),
+            None,
+        ),
+        "iptables add (save + restore)": (iptables_add, None),
+    }
+
+
+def run(sizes, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        install_fake_commands(root)
+        paths = redirect_paths(root)
+        for tunnels in sizes:
+            write_fixtures(paths, root, tunnels)
+            haproxy_config._cache.clear()
+            iptables_nat.invalidate()
+            results[str(tunnels)] = {}
+            print(f"\n{tunnels} tunnels")
+            for name, (func, setup) in cases(tunnels).items():
+                timing = measure(func, repeat, setup)
+                results[str(tunnels)][name] = timing
+                print(f"  {name:<42} best {timing['best'] * 1000:10.2f} ms   first {timing['first'] * 1000:10.2f} ms")
+    return results
+
+
+def compare(results, previous):
+    print("\nChange against previous run (median):")
+    for size, timings in results.items():
+        for name, timing in timings.items():
+            old = previous.get("results", {}).get(size, {}).get(name)
+            if old and old["median"] > 0:
+                ratio = timing["median"] / old["median"]
+                flag = "  <-- slower" if ratio > 1.2 else ""
+                print(f"  {size:>6} {name:<42} {ratio:6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated tunnel counts.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    parser.add_argument("--compare", help="Print the change against a previous results file.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = run(sizes, max(1, args.repeat))
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    try:
+        from importlib.metadata import version
+        report["meta"]["shifter"] = version("shifter-toolkit")
+    except Exception:
+        report["meta"]["shifter"] = "unknown"
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""Synthetic configuration fixtures shared by the benchmarks.
+
+Every generator is deterministic for a given tunnel count, so runs on
+different machines or releases work on identical inputs.
+"""
+
+import json
+
+from shifter.services import xray
+from shifter.services.config import load_json_template, load_text_template
+from shifter.services.gost_config import GostConfig
+from shifter.services.iptables_rules import NatRules
+
+BASE_PORT = 10000
+
+
+def _port(index):
+    return BASE_PORT + index % 55000
+
+
+def _ip(index):
+    return f"198.51.{index // 256 % 256}.{index % 256}"
+
+
+def haproxy_cfg(tunnels):
+    base = load_text_template("haproxy.cfg")
+    base = base.replace("$iport", "443").replace("$IP", "203.0.113.1").replace("$port", "443")
+    blocks = [base.rstrip("\n"), ""]
+    for index in range(tunnels):
+        port = _port(index)
+        ip = _ip(index)
+        blocks.append(
+            f"frontend tunnel-{port}\n"
+            f"    bind :::{port} v4v6\n"
+            f"    mode tcp\n"
+            f"    default_backend tunnel-{ip}-{port}\n"
+            f"\n"
+            f"backend tunnel-{ip}-{port}\n"
+            f"    mode tcp\n"
+            f"    server target_server {ip}:{port}\n"
+        )
+    return "\n".join(blocks)
+
+
+def gost_config(tunnels):
+    cfg = GostConfig()
+    for index in range(tunnels):
+        cfg.add_rule(f"relay{index}.example.com", _port(index))
+    return json.dumps(cfg.data, indent=2)
+
+
+def gost_unit_legacy(tunnels):
+    """A pre-migration gost.service carrying every rule as ``-L`` flags."""
+    flags = " ".join(
+        f"-L={proto}://:{_port(index)}/relay{index}.example.com:{_port(index)}"
+        for index in range(tunnels)
+        for proto in ("tcp", "udp")
+    )
+    return load_text_template("gost.service").replace("-C /etc/gost/config.json", flags)
+
+
+def xray_config(tunnels):
+    data = load_json_template("config.json")
+    data["inbounds"] = [inbound for inbound in data["inbounds"] if inbound.get("tag") == "api"]
+    data["inbounds"].extend(xray._dokodemo_inbound(_ip(index), _port(index)) for index in range(tunnels))
+    return json.dumps(data, indent=4)
+
+
+def iptables_save(tunnels, background=0):
+    """``iptables-save`` output with Shifter's chains for ``tunnels`` ports.
+
+    ``background`` adds that many unrelated filter and nat rules, as found on
+    Docker or Kubernetes nodes.
+    """
+    rules = NatRules()
+    per_destination = 50
+    for start in range(0, tunnels, per_destination):
+        ports = ",".join(str(_port(index)) for index in range(start, min(start + per_destination, tunnels)))
+        rules.add(_ip(start // per_destination), ports)
+    filter_rules = background // 2
+    out = ["*filter", ":INPUT ACCEPT [0:0]", ":FORWARD DROP [0:0]", ":OUTPUT ACCEPT [0:0]"]
+    for index in range(filter_rules):
+        out.append(
+            f"-A FORWARD -d 10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}/32 "
+            f"-p tcp -m tcp --dport {1 + index % 65535} -m comment --comment \"svc-{index}\" -j ACCEPT"
+        )
+    out += ["COMMIT", "*nat", ":PREROUTING ACCEPT [0:0]", ":POSTROUTING ACCEPT [0:0]",
+            ":SHIFTER-PREROUTING - [0:0]", ":SHIFTER-POSTROUTING - [0:0]",
+            "-A PREROUTING -j SHIFTER-PREROUTING", "-A POSTROUTING -j SHIFTER-POSTROUTING"]
+    for index in range(background - filter_rules):
+        port = 1 + index % 65535
+        if index % 3 == 0:
+            out.append(f"-A PREROUTING -p tcp -m tcp --dport {port} -j DNAT "
+                       f"--to-destination [2001:db8::{index % 65535:x}]:{port}")
+        else:
+            out.append(f"-A KUBE-SEP-{index} -p tcp -m tcp -j DNAT "
+                       f"--to-destination 10.244.{index // 256 % 256}.{index % 256}:{port}")
+    out.extend(rules.rule_lines())
+    out.append("COMMIT")
+    return "\n".join(out) + "\n"
@@ -2,11 +2,19 @@
 
 from __future__ import annotations
 
-from importlib import metadata
-
 __all__ = ["__version__"]
 
-try:
-    __version__ = metadata.version("shifter")
-except metadata.PackageNotFoundError:  # pragma: no cover - during local dev
-    __version__ = "0.0.0"
+
+def __getattr__(name: str) -> str:
+    # Resolved on first access: importlib.metadata costs more at startup than
+    # most CLI commands spend doing their actual work.
+    if name == "__version__":
+        from importlib import metadata
+
+        try:
+            version = metadata.version("shifter")
+        except metadata.PackageNotFoundError:  # pragma: no cover - during local dev
+            version = "0.0.0"
+        globals()["__version__"] = version
+        return version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,17 +4,21 @@
 
 import os
 import sys
+import json
 import secrets
+import sqlite3
 import string
+from datetime import datetime
 
 import click
-from aiohttp import web
 
-from .services import gost, haproxy, iptables, status as status_module, xray
+from .services import actions, daemon as daemon_module, desired, gost, haproxy, haproxy_config, iptables, nftables, probes, registry, reload, status as status_module, xray, xray_stats
 
 # --- Main CLI Group ---
 @click.group()
-def cli():
+@click.option('--no-wait', is_flag=True, help="With 'shifter daemon' running, return once a change is written instead of after its reload.")
+@click.pass_context
+def cli(ctx, no_wait):
     """
     Shifter: A comprehensive tool for managing network tunnels and services.
     This tool must be run with sudo privileges.
@@ -22,6 +26,7 @@ def cli():
     if os.geteuid() != 0:
         click.echo("Error: This script requires root privileges. Please run with sudo.", err=True)
         sys.exit(1)
+    ctx.obj = {"no_wait": no_wait}
 
 # --- Web UI Command ---
 def _normalize_base_path(base_path: str) -> str:
@@ -34,6 +39,20 @@ def _normalize_base_path(base_path: str) -> str:
     return "/" if normalized == "//" else normalized
 
 
+def _server_ssl_context(auth_manager):
+    """TLS context for the certificate configured in auth.json, or None to serve plain HTTP."""
+    cert_paths = auth_manager.cert_paths or {}
+    fullchain = cert_paths.get("fullchain")
+    privkey = cert_paths.get("privkey")
+    if not (fullchain and privkey and os.path.exists(fullchain) and os.path.exists(privkey)):
+        return None
+    import ssl
+
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(fullchain, privkey)
+    return ssl_context
+
+
 @cli.command()
 @click.option('--host', default='127.0.0.1', help='Host to bind the web server to.')
 @click.option('--port', default=2063, type=int, help='Port to run the web server on.')
@@ -41,6 +60,8 @@ def _normalize_base_path(base_path: str) -> str:
 def serve(host, port, base_path):
     """Launch the Shifter web UI dashboard."""
     normalized_base_path = _normalize_base_path(base_path)
+    # aiohttp is only needed here; importing it at module level slowed every command.
+    from aiohttp import web
     from .web.auth import AuthManager, AuthConfigError
     from .web.app import create_app
 
@@ -50,20 +71,10 @@ def serve(host, port, base_path):
         click.echo(f"Error: {exc}", err=True)
         sys.exit(1)
 
-    cert_paths = auth_manager.cert_paths or {}
-    fullchain = cert_paths.get("fullchain")
-    privkey = cert_paths.get("privkey")
-
-    ssl_context = None
-    scheme = "http"
-    if fullchain and privkey and os.path.exists(fullchain) and os.path.exists(privkey):
-        import ssl
-
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_context.load_cert_chain(fullchain, privkey)
-        scheme = "https"
-        if "SHIFTER_SESSION_SECURE" not in os.environ:
-            os.environ["SHIFTER_SESSION_SECURE"] = "true"
+    ssl_context = _server_ssl_context(auth_manager)
+    scheme = "https" if ssl_context else "http"
+    if ssl_context and "SHIFTER_SESSION_SECURE" not in os.environ:
+        os.environ["SHIFTER_SESSION_SECURE"] = "true"
 
     app = create_app(base_path=normalized_base_path, auth_manager=auth_manager)
     url_suffix = "" if normalized_base_path == "/" else normalized_base_path
@@ -71,6 +82,45 @@ def serve(host, port, base_path):
     web.run_app(app, host=host, port=port, ssl_context=ssl_context)
 
 
+@cli.command()
+@click.option('--host', default='0.0.0.0', show_default=True, help='Host to bind the agent API to.')
+@click.option('--port', default=2064, show_default=True, type=int, help='Port to serve the agent API on.')
+def agent(host, port):
+    """Serve the JSON API for 'shifter-toolkit fleet' controllers (API tokens only)."""
+    from aiohttp import web
+    from .web.app import create_agent_app
+    from .web.auth import AuthManager, AuthConfigError
+
+    try:
+        auth_manager = AuthManager()
+    except AuthConfigError as exc:
+        click.echo(f"Error: {exc}", err=True)
+        sys.exit(1)
+    if not auth_manager.api_tokens:
+        click.echo("Warning: no API tokens exist yet; create one with 'shifter-toolkit api-token create <name>'.", err=True)
+    ssl_context = _server_ssl_context(auth_manager)
+    if ssl_context is None:
+        click.echo("Warning: no certificate configured; tokens will be sent over plain HTTP.", err=True)
+    scheme = "https" if ssl_context else "http"
+    click.echo(f"Starting Shifter agent at {scheme}://{host}:{port}/api/v1")
+    web.run_app(create_agent_app(auth_manager), host=host, port=port, ssl_context=ssl_context, print=None)
+
+
+@cli.command(name="daemon")
+@click.option('--window', type=float, default=None, help=f"Seconds of quiet before queued changes are reloaded together (default: ${reload.WINDOW_ENV} or {reload.DEFAULT_WINDOW:g}).")
+@click.option('--socket', 'socket_path', default=None, help=f"Unix socket to listen on (default: ${daemon_module.SOCKET_ENV} or {daemon_module.DAEMON_SOCKET_PATH}).")
+def daemon(window, socket_path):
+    """Serve tunnel changes from other shifter commands, coalescing their reloads."""
+    window = reload.window_from_env() if window is None else max(window, 0.0)
+    path = socket_path or daemon_module.socket_path()
+    click.echo(f"Shifter daemon listening on {path} (reload window {window:g}s)")
+    try:
+        daemon_module.serve(path, window)
+    except (RuntimeError, OSError) as exc:
+        click.echo(f"Error: {exc}", err=True)
+        sys.exit(1)
+
+
 def _generate_password(length: int = 20) -> str:
     alphabet = string.ascii_letters + string.digits
     return "".join(secrets.choice(alphabet) for _ in range(length))
@@ -127,6 +177,78 @@ def reset_credentials(username, password, generate, length):
         click.echo(f"  Username: {username}")
         click.echo(f"  Password: {generated_password}")
 
+@cli.group(name="api-token")
+def api_token_group():
+    """Manage tokens for the Web UI's JSON API."""
+    pass
+
+def _load_auth_manager():
+    from .web.auth import AuthManager, AuthConfigError
+
+    try:
+        return AuthManager()
+    except AuthConfigError as exc:
+        click.echo(f"Error: {exc}", err=True)
+        sys.exit(1)
+
+@api_token_group.command("create")
+@click.argument("name")
+def api_token_create(name):
+    """Create a token; it is shown once and only its hash is stored."""
+    try:
+        token = _load_auth_manager().create_api_token(name)
+    except ValueError as exc:
+        click.echo(str(exc), err=True)
+        sys.exit(1)
+    click.echo(f"Created API token '{name}'. Store it securely; it cannot be shown again:")
+    click.echo(f"  {token}")
+
+@api_token_group.command("list")
+def api_token_list():
+    """List API token names and creation times."""
+    tokens = _load_auth_manager().api_tokens
+    if not tokens:
+        click.echo("No API tokens.")
+    for entry in tokens:
+        created = datetime.fromtimestamp(entry["created_at"]).isoformat(sep=" ") if entry.get("created_at") else "unknown"
+        click.echo(f"{entry['name']}  (created {created})")
+
+@api_token_group.command("revoke")
+@click.argument("name")
+def api_token_revoke(name):
+    """Revoke a token by name."""
+    if not _load_auth_manager().revoke_api_token(name):
+        click.echo(f"No API token named '{name}'.", err=True)
+        sys.exit(1)
+    click.echo(f"Revoked API token '{name}'.")
+
+# --- Result Rendering ---
+def render_result(result):
+    """Print an ActionResult and exit non-zero when the action failed."""
+    for line in result.details:
+        click.echo(line)
+    for line in result.errors:
+        click.echo(line, err=True)
+    if result.message:
+        click.echo(result.message, err=not result.success)
+    if not result.success:
+        sys.exit(1)
+
+def run_change(service, action, **params):
+    """Apply a tunnel change through 'shifter daemon' when it is listening, so its
+    reload is coalesced with other callers'; otherwise run it in-process."""
+    wait = not (click.get_current_context().find_root().obj or {}).get("no_wait")
+    result = daemon_module.submit(service, action, params, wait=wait)
+    if result is None:
+        result = actions.run_action(service, action, params)
+    render_result(result)
+
+def run_bulk(service, action, file):
+    """Apply a CSV file of entries with one write and one reload."""
+    run_change(service, action, entries=file.read())
+
+BULK_FILE_OPTION = click.option('--file', 'file', required=True, type=click.File('r'), help="CSV file, one entry per line ('-' for stdin).")
+
 # --- Status Command ---
 def print_detailed_status(service_name, status_data):
     """Helper function to print the new, detailed status output."""
@@ -136,26 +258,87 @@ def print_detailed_status(service_name, status_data):
     click.echo(click.style(f"Service: {service_name.upper()}", bold=True, fg="cyan"))
     click.echo(f"  Active:  {click.style(status_data.get('active', 'unknown'), fg=active_color)}")
     click.echo(f"  Enabled: {click.style(status_data.get('enabled', 'unknown'), fg=enabled_color)}")
+    if status_data.get('main_pid'):
+        click.echo(f"  State:   {status_data.get('sub_state', 'unknown')} (PID {status_data['main_pid']})")
+    if status_data.get('restarts'):
+        click.echo(f"  Restarts: {status_data['restarts']}")
+    if status_data.get('memory_bytes') is not None:
+        click.echo(f"  Memory:  {status_data['memory_bytes'] / (1024 * 1024):.1f} MiB")
+    if status_data.get('cpu_nsec') is not None:
+        click.echo(f"  CPU:     {status_data['cpu_nsec'] / 1e9:.2f}s")
 
     details = status_data.get('details')
     if details:
         click.echo("  Configuration Details:")
         for detail in details:
             click.echo(f"    - {detail}")
+    traffic = status_data.get('traffic')
+    if traffic:
+        click.echo("  Traffic (total up/down, rate up/down):")
+        for tag, counters in traffic.items():
+            click.echo(
+                f"    - {tag}: {xray_stats.format_bytes(counters['uplink_bytes'])} / "
+                f"{xray_stats.format_bytes(counters['downlink_bytes'])}, "
+                f"{xray_stats.format_rate(counters['uplink_rate'])} / "
+                f"{xray_stats.format_rate(counters['downlink_rate'])}"
+                + (" (counters reset)" if counters.get('reset') else "")
+            )
+    if 'probes' in status_data:
+        click.echo("  Destination Probes:")
+        if not status_data['probes']:
+            click.echo("    - No destinations to probe.")
+        for entry in status_data['probes']:
+            color = "green" if entry['last_ok'] else "red"
+            click.echo(f"    - {click.style(probes.format_summary(entry), fg=color)}")
     click.echo("-" * 20)
 
 @cli.command()
 @click.argument('service', required=False, type=click.Choice(['gost', 'haproxy', 'xray', 'iptables'], case_sensitive=False))
-def status(service):
+@click.option('--json', 'as_json', is_flag=True, help='Print the status as JSON.')
+@click.option('--probe', is_flag=True, help="Also check that every tunnel's destination answers a TCP connect.")
+@click.option('--samples', default=3, show_default=True, type=click.IntRange(1, 100), help='Probe rounds behind the latency percentiles (with --probe).')
+def status(service, as_json, probe, samples):
     """Check the detailed status of one or all managed services."""
+    probe_rounds = samples if probe else 0
     if service:
         status_func = getattr(status_module, f"get_{service}_status", None)
-        if status_func:
-            print_detailed_status(service, status_func())
+        all_status = {service: status_func(probe_rounds)} if status_func else {}
     else:
-        all_status = status_module.get_all_services_status()
-        for name, data in all_status.items():
-            print_detailed_status(name, data)
+        all_status = status_module.get_all_services_status(probe_rounds)
+    if as_json:
+        click.echo(json.dumps(all_status, indent=2))
+        return
+    for name, data in all_status.items():
+        print_detailed_status(name, data)
+
+@cli.command(name="probe")
+@click.option('--service', type=click.Choice(registry.SERVICES), help="Only probe this service's tunnels.")
+@click.option('--check', 'checks', multiple=True, type=click.Choice(probes.CHECKS), help="Check to run; repeat for several (default: tcp).")
+@click.option('--samples', default=5, show_default=True, type=click.IntRange(1, 1000), help='Probe rounds behind the percentiles.')
+@click.option('--interval', default=1.0, show_default=True, type=click.FloatRange(0), help='Seconds between rounds.')
+@click.option('--timeout', default=probes.DEFAULT_TIMEOUT, show_default=True, type=click.FloatRange(0.1), help='Seconds allowed for each check.')
+@click.option('--concurrency', default=probes.DEFAULT_CONCURRENCY, show_default=True, type=click.IntRange(1), help='Checks in flight at once.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the results as JSON.')
+def probe(service, checks, samples, interval, timeout, concurrency, as_json):
+    """Check that tunnel destinations are reachable and report connect latency.
+
+    Exits non-zero if any destination failed its last check.
+    """
+    summaries = probes.run(
+        samples, interval, (service,) if service else None,
+        checks=checks or probes.DEFAULT_CHECKS, timeout=timeout, concurrency=concurrency,
+    )
+    if as_json:
+        click.echo(json.dumps(summaries, indent=2))
+    else:
+        if not summaries:
+            click.echo("No tunnel destinations to probe.")
+        for name, entries in summaries.items():
+            click.echo(click.style(name.upper(), bold=True, fg="cyan"))
+            for entry in entries:
+                click.echo("  " + click.style(probes.format_summary(entry), fg="green" if entry['last_ok'] else "red"))
+    if any(entry['last_ok'] is False for entries in summaries.values() for entry in entries):
+        sys.exit(1)
 
 
 # --- GOST Group ---
@@ -168,28 +351,40 @@ def gost_group():
 @click.option('--domain', required=True, help='Domain or IP for the tunnel')
 @click.option('--port', required=True, type=int, help='Port for the tunnel')
 def gost_install(domain, port):
-    gost.install_gost(domain=domain, port=port)
+    render_result(gost.install_gost(domain=domain, port=port))
 
 @gost_group.command("status")
 def gost_status():
     """Show detailed status and configured forwarding rules for GOST."""
-    gost.get_gost_status_details()
+    render_result(gost.get_gost_status_details())
 
 @gost_group.command("add")
 @click.option('--domain', required=True, help='Domain or IP for the new tunnel')
 @click.option('--port', required=True, type=int, help='New port for the tunnel')
 def gost_add(domain, port):
-    gost.add_port_gost(domain=domain, port=port)
+    run_change("gost", "add", domain=domain, port=port)
 
 @gost_group.command("remove")
 @click.option('--port', required=True, type=int, help='The port number of the rule to remove.')
 def gost_remove(port):
     """Remove a forwarding rule by port number."""
-    gost.remove_rule_by_port(port)
+    run_change("gost", "remove", port=port)
+
+@gost_group.command("add-bulk")
+@BULK_FILE_OPTION
+def gost_add_bulk(file):
+    """Add many rules from a CSV file with columns: domain,port."""
+    run_bulk("gost", "add-bulk", file)
+
+@gost_group.command("remove-bulk")
+@BULK_FILE_OPTION
+def gost_remove_bulk(file):
+    """Remove many rules from a CSV file with one column: port."""
+    run_bulk("gost", "remove-bulk", file)
 
 @gost_group.command("uninstall")
 def gost_uninstall():
-    gost.uninstall_gost()
+    render_result(gost.uninstall_gost())
 
 # --- HAProxy Group ---
 @cli.group(name="haproxy")
@@ -202,28 +397,82 @@ def haproxy_group():
 @click.option('--main-server-ip', required=True, help="Destination server's IP or domain")
 @click.option('--main-server-port', required=True, type=int, help="Destination server's port")
 def haproxy_install(relay_port, main_server_ip, main_server_port):
-    haproxy.install_haproxy(relay_port, main_server_ip, main_server_port)
+    render_result(haproxy.install_haproxy(relay_port, main_server_ip, main_server_port))
 
 @haproxy_group.command("status")
 def haproxy_status():
-    haproxy.get_haproxy_status_details()
+    render_result(haproxy.get_haproxy_status_details())
 
 @haproxy_group.command("add")
 @click.option('--relay-port', required=True, type=int, help="This server's new free port")
 @click.option('--main-server-ip', required=True, help="New destination server's IP or domain")
 @click.option('--main-server-port', required=True, type=int, help="New destination server's port")
-def haproxy_add(relay_port, main_server_ip, main_server_port):
-    haproxy.add_frontend_backend(relay_port, main_server_ip, main_server_port)
+@click.option('--server', 'servers', multiple=True, metavar='HOST:PORT[,weight=N][,backup]', help="Another destination to balance across; repeat for more.")
+@click.option('--balance', type=click.Choice(haproxy_config.BALANCE_ALGORITHMS), help="Load-balancing algorithm (HAProxy's default is roundrobin).")
+@click.option('--check-inter', help="Health-check every server at this interval (e.g. 2s); failed servers get no traffic.")
+def haproxy_add(relay_port, main_server_ip, main_server_port, servers, balance, check_inter):
+    """Add a tunnel, optionally load-balanced across several destinations."""
+    run_change("haproxy", "add", relay_port=relay_port, main_server_ip=main_server_ip, main_server_port=main_server_port,
+               servers="\n".join(servers) or None, balance=balance, check_inter=check_inter)
 
 @haproxy_group.command("remove")
 @click.option('--frontend-name', required=True, help='The name of the frontend to remove.')
 def haproxy_remove(frontend_name):
     """Remove a tunnel by its frontend name."""
-    haproxy.remove_tunnel(frontend_name)
+    run_change("haproxy", "remove", frontend_name=frontend_name)
+
+@haproxy_group.command("add-bulk")
+@BULK_FILE_OPTION
+def haproxy_add_bulk(file):
+    """Add many tunnels from a CSV file with columns: relay_port,main_server_ip,main_server_port."""
+    run_bulk("haproxy", "add-bulk", file)
+
+@haproxy_group.command("remove-bulk")
+@BULK_FILE_OPTION
+def haproxy_remove_bulk(file):
+    """Remove many tunnels from a CSV file with one column: frontend_name."""
+    run_bulk("haproxy", "remove-bulk", file)
+
+@haproxy_group.command("set-destination")
+@click.option('--frontend-name', required=True, help='The name of the frontend to repoint.')
+@click.option('--main-server-ip', required=True, help="New destination server's IP or domain")
+@click.option('--main-server-port', required=True, type=int, help="New destination server's port")
+def haproxy_set_destination(frontend_name, main_server_ip, main_server_port):
+    """Change a tunnel's destination live via the HAProxy runtime API."""
+    run_change("haproxy", "set-destination", frontend_name=frontend_name, main_server_ip=main_server_ip, main_server_port=main_server_port)
+
+@haproxy_group.command("server-state")
+@click.option('--frontend-name', required=True, help='The name of the frontend whose server to change.')
+@click.option('--state', required=True, type=click.Choice(['ready', 'drain', 'maint']), help='ready enables, drain stops new connections, maint disables.')
+def haproxy_server_state(frontend_name, state):
+    """Enable, drain or disable a tunnel's server via the runtime API."""
+    run_change("haproxy", "server-state", frontend_name=frontend_name, state=state)
+
+@haproxy_group.command("add-server")
+@click.option('--frontend-name', required=True, help='The tunnel to add a destination to.')
+@click.option('--server', required=True, metavar='HOST:PORT[,weight=N][,backup]', help="The destination to add.")
+def haproxy_add_server(frontend_name, server):
+    """Add a destination server to a tunnel without touching other tunnels."""
+    run_change("haproxy", "add-server", frontend_name=frontend_name, server=server)
+
+@haproxy_group.command("remove-server")
+@click.option('--frontend-name', required=True, help='The tunnel to remove a destination from.')
+@click.option('--server', 'address', required=True, metavar='HOST:PORT', help="The destination to remove.")
+def haproxy_remove_server(frontend_name, address):
+    """Remove one destination server from a tunnel."""
+    run_change("haproxy", "remove-server", frontend_name=frontend_name, server=address)
+
+@haproxy_group.command("set-balance")
+@click.option('--frontend-name', required=True, help='The tunnel to change.')
+@click.option('--balance', type=click.Choice(haproxy_config.BALANCE_ALGORITHMS), help="Load-balancing algorithm.")
+@click.option('--check-inter', help="Health-check interval for every server (e.g. 2s), or 'off'.")
+def haproxy_set_balance(frontend_name, balance, check_inter):
+    """Change a tunnel's load-balancing algorithm or health checks."""
+    run_change("haproxy", "set-balance", frontend_name=frontend_name, balance=balance, check_inter=check_inter)
 
 @haproxy_group.command("uninstall")
 def haproxy_uninstall():
-    haproxy.uninstall_haproxy()
+    render_result(haproxy.uninstall_haproxy())
 
 # --- Xray Group ---
 @cli.group(name="xray")
@@ -235,28 +484,40 @@ def xray_group():
 @click.option('--address', required=True, help='Domain or IP for the inbound')
 @click.option('--port', required=True, type=int, help='Port for the inbound')
 def xray_install(address, port):
-    xray.install_xray(address=address, port=port)
+    render_result(xray.install_xray(address=address, port=port))
 
 @xray_group.command("status")
 def xray_status():
     """Show detailed status and configured inbounds for Xray."""
-    xray.get_xray_status_details()
+    render_result(xray.get_xray_status_details())
 
 @xray_group.command("add")
 @click.option('--address', required=True, help='Domain or IP for the new inbound')
 @click.option('--port', required=True, type=int, help='New port for the inbound')
 def xray_add(address, port):
-    xray.add_another_inbound(address=address, port=port)
+    run_change("xray", "add", address=address, port=port)
 
 @xray_group.command("remove")
 @click.option('--port', required=True, type=int, help='The port number of the inbound to remove.')
 def xray_remove(port):
     """Remove an inbound by its port number."""
-    xray.remove_inbound_by_port(port)
+    run_change("xray", "remove", port=port)
+
+@xray_group.command("add-bulk")
+@BULK_FILE_OPTION
+def xray_add_bulk(file):
+    """Add many inbounds from a CSV file with columns: address,port."""
+    run_bulk("xray", "add-bulk", file)
+
+@xray_group.command("remove-bulk")
+@BULK_FILE_OPTION
+def xray_remove_bulk(file):
+    """Remove many inbounds from a CSV file with one column: port."""
+    run_bulk("xray", "remove-bulk", file)
 
 @xray_group.command("uninstall")
 def xray_uninstall():
-    xray.uninstall_xray()
+    render_result(xray.uninstall_xray())
 
 # --- IPTables Group ---
 @cli.group(name="iptables")
@@ -264,20 +525,202 @@ def iptables_group():
     """Manage IPTables rules."""
     pass
 
+BACKEND_OPTION = click.option('--backend', type=click.Choice(['iptables', 'nft'], case_sensitive=False), default='iptables', show_default=True, help="Firewall backend: iptables chains or an nftables table with port maps.")
+
 @iptables_group.command("install")
 @click.option('--main-server-ip', required=True, help="Destination server's IP")
-@click.option('--ports', required=True, help="Comma-separated list of ports (e.g., 80,443)")
-def iptables_install(main_server_ip, ports):
-    iptables.install_iptables(main_server_ip, ports)
+@click.option('--ports', required=True, help="Comma-separated list of ports or ranges (e.g., 80,443,1000:2000)")
+@BACKEND_OPTION
+def iptables_install(main_server_ip, ports, backend):
+    if backend == 'nft':
+        render_result(nftables.install_nftables(main_server_ip, ports))
+    else:
+        render_result(iptables.install_iptables(main_server_ip, ports))
 
 @iptables_group.command("status")
-def iptables_status():
+@BACKEND_OPTION
+def iptables_status(backend):
     """Show detailed status and configured forwarding rules for IPTables."""
-    iptables.get_iptables_status_details()
+    if backend == 'nft':
+        render_result(nftables.get_nftables_status_details())
+    else:
+        render_result(iptables.get_iptables_status_details())
 
 @iptables_group.command("uninstall")
-def iptables_uninstall():
-    iptables.uninstall_iptables()
+@BACKEND_OPTION
+def iptables_uninstall(backend):
+    if backend == 'nft':
+        render_result(nftables.uninstall_nftables())
+    else:
+        render_result(iptables.uninstall_iptables())
+
+# --- Declarative Apply ---
+@cli.command()
+@click.argument('desired_file', type=click.Path(dir_okay=False))
+@click.option('--plan', 'plan_only', is_flag=True, help="Show the changes without applying them.")
+@click.option('--json', 'as_json', is_flag=True, help='Print the plan (or the result) as JSON.')
+def apply(desired_file, plan_only, as_json):
+    """Make the tunnels match DESIRED_FILE (YAML or JSON), changing only what differs.
+
+    Each service named in the file gets exactly the tunnels listed for it;
+    services not named are left alone. Affected services get one config
+    write and at most one reload; an unchanged file changes nothing.
+    """
+    try:
+        plan = desired.plan(desired.load(desired_file))
+    except desired.DesiredStateError as exc:
+        click.echo(f"Error: {exc}", err=True)
+        sys.exit(1)
+    if plan_only:
+        if as_json:
+            click.echo(json.dumps(plan.to_dict(), indent=2))
+        else:
+            for line in plan.lines():
+                click.echo(line)
+            for line in plan.conflicts:
+                click.echo(f"Conflict: {line}", err=True)
+        sys.exit(1 if plan.conflicts else 0)
+    result = desired.apply(plan)
+    if as_json:
+        click.echo(json.dumps(result.to_dict(), indent=2))
+        sys.exit(0 if result.success else 1)
+    render_result(result)
+
+# --- Fleet Group ---
+@cli.group(name="fleet")
+def fleet_group():
+    """Run status or apply on many 'shifter-toolkit agent' hosts at once."""
+    pass
+
+def fleet_options(func):
+    options = [
+        click.option('--hosts', 'hosts_file', required=True, type=click.File('r'), help="Hosts file: one agent URL per line, optionally followed by its token."),
+        click.option('--token', envvar='SHIFTER_FLEET_TOKEN', default='', help="API token for hosts without one in the hosts file (default: $SHIFTER_FLEET_TOKEN)."),
+        click.option('--concurrency', default=50, show_default=True, type=click.IntRange(1), help="Requests in flight at once."),
+        click.option('--timeout', type=float, default=None, help="Seconds per attempt per host (default: 10 for status, 60 for apply)."),
+        click.option('--retries', default=2, show_default=True, type=click.IntRange(0), help="Retries after a timeout, connection error, 429 or 5xx."),
+        click.option('--insecure', is_flag=True, help="Do not verify the agents' TLS certificates."),
+        click.option('--ca-file', type=click.Path(exists=True, dir_okay=False), help="CA bundle to verify the agents' certificates with."),
+        click.option('--json', 'as_json', is_flag=True, help='Print every host\'s result as JSON.'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def _fleet_setup(hosts_file, token, concurrency, timeout, retries, insecure, ca_file, default_timeout):
+    from . import fleet
+
+    try:
+        hosts = fleet.parse_hosts(hosts_file.read(), token)
+    except ValueError as exc:
+        click.echo(f"Error: {hosts_file.name}: {exc}", err=True)
+        sys.exit(1)
+    if not hosts:
+        click.echo(f"Error: {hosts_file.name} lists no hosts.", err=True)
+        sys.exit(1)
+    options = fleet.FleetOptions(
+        concurrency=concurrency,
+        timeout=default_timeout if timeout is None else timeout,
+        retries=retries,
+        verify_tls=not insecure,
+        ca_file=ca_file,
+    )
+    return fleet, hosts, options
+
+def _fleet_report(fleet, results, as_json, describe):
+    summary = fleet.summary(results)
+    if as_json:
+        click.echo(json.dumps(summary, indent=2))
+    else:
+        width = max(len(result.host) for result in results)
+        for result in results:
+            state = click.style("ok", fg="green") if result.ok else click.style("FAILED", fg="red")
+            detail = describe(result.data) if result.ok else result.error
+            retried = f" after {result.attempts} attempts" if result.attempts > 1 else ""
+            click.echo(f"{result.host:<{width}}  {state:<6}  {detail}  ({result.elapsed:.2f}s{retried})")
+        click.echo(f"{summary['ok']} of {len(results)} host(s) ok, {summary['failed']} failed.")
+    if summary["failed"]:
+        sys.exit(1)
+
+@fleet_group.command("status")
+@fleet_options
+def fleet_status(hosts_file, token, concurrency, timeout, retries, insecure, ca_file, as_json):
+    """Show every agent's service states."""
+    fleet, hosts, options = _fleet_setup(hosts_file, token, concurrency, timeout, retries, insecure, ca_file, 10.0)
+
+    def describe(data):
+        services = data.get("services", {})
+        return " ".join(f"{name}={state.get('active', 'unknown')}" for name, state in services.items())
+
+    _fleet_report(fleet, fleet.status(hosts, options), as_json, describe)
+
+@fleet_group.command("apply")
+@click.argument('desired_file', type=click.Path(dir_okay=False))
+@click.option('--plan', 'plan_only', is_flag=True, help="Only show each host's changes.")
+@fleet_options
+def fleet_apply(desired_file, plan_only, hosts_file, token, concurrency, timeout, retries, insecure, ca_file, as_json):
+    """Apply one desired-state file (see 'apply') on every agent."""
+    try:
+        with open(desired_file, "r") as f:
+            document = desired.decode(f.read(), desired_file)
+        # Catch mistakes once here instead of once per host.
+        desired.validate(document, desired_file)
+    except OSError as exc:
+        click.echo(f"Error: could not read {desired_file}: {exc}", err=True)
+        sys.exit(1)
+    except desired.DesiredStateError as exc:
+        click.echo(f"Error: {exc}", err=True)
+        sys.exit(1)
+    fleet, hosts, options = _fleet_setup(hosts_file, token, concurrency, timeout, retries, insecure, ca_file, 60.0)
+
+    def describe(data):
+        plan = data.get("plan") or data.get("data", {}).get("plan", {})
+        changes = plan.get("changes", [])
+        counts = {action: sum(1 for change in changes if change["action"] == action) for action in ("add", "change", "remove")}
+        text = f"+{counts['add']} ~{counts['change']} -{counts['remove']}"
+        if plan.get("conflicts"):
+            text += f", {len(plan['conflicts'])} conflict(s)"
+        return text if plan_only else f"{text}: {data.get('message', '')}"
+
+    _fleet_report(fleet, fleet.apply(hosts, document or {}, plan_only, options), as_json, describe)
+
+# --- Tunnel Registry Group ---
+@cli.group(name="registry")
+def registry_group():
+    """Inspect or rebuild the tunnel registry (tunnels.db in the config directory)."""
+    pass
+
+@registry_group.command("import")
+@click.option('--service', type=click.Choice(registry.SERVICES), help="Re-import only this service.")
+def registry_import(service):
+    """Rebuild the registry from the native config files."""
+    try:
+        counts = registry.rebuild((service,) if service else registry.SERVICES)
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        click.echo(f"Error: could not rebuild {registry.db_path()}: {exc}", err=True)
+        sys.exit(1)
+    for name, count in counts.items():
+        click.echo(f"{name:<10} {count} tunnel(s)")
+    click.echo(f"Registry: {registry.db_path()}")
+
+@registry_group.command("list")
+@click.option('--service', type=click.Choice(registry.SERVICES), help="Only list this service's tunnels.")
+@click.option('--port', type=int, help="Only list tunnels listening on this port.")
+@click.option('--json', 'as_json', is_flag=True, help='Print the tunnels as JSON.')
+def registry_list(service, port, as_json):
+    """List registered tunnels, optionally by service or listen port."""
+    if port is not None:
+        tunnels = [t for t in registry.lookup(port) if not service or t["service"] == service]
+        tunnels = [{"service": t["service"], "key": t["key"], "ports": [str(port)], "destination": t["destination"], "protocols": t["protocols"]} for t in tunnels]
+    else:
+        tunnels = registry.tunnels(service)
+    if as_json:
+        click.echo(json.dumps(tunnels, indent=2))
+        return
+    if not tunnels:
+        click.echo("No tunnels registered.")
+    for tunnel in tunnels:
+        click.echo(f"{tunnel['service']:<9} {tunnel['key']:<28} {','.join(tunnel['ports']):<12} {tunnel['protocols']:<8} -> {tunnel['destination']}")
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,210 @@
+"""Fleet controller: run ``status`` and ``apply`` on many Shifter agents at once.
+
+Every host runs ``shifter-toolkit agent``, which serves the ``/api/v1`` JSON
+API with token authentication. The controller sends the same request to every
+host over one pooled aiohttp session. A semaphore bounds how many requests are
+in flight, each attempt has its own timeout, and connection errors, timeouts,
+429 and 5xx answers are retried with jittered exponential backoff. One slow or
+dead host therefore costs its own timeout budget and never holds up the others.
+Results come back in hosts-file order, one :class:`HostResult` per host.
+
+The hosts file lists one agent per line, optionally followed by its token::
+
+    # url                              token (default: --token / SHIFTER_FLEET_TOKEN)
+    https://relay1.example.com:2064
+    relay2.example.com                 shf_...
+    http://127.0.0.1:20641
+
+A bare ``host`` or ``host:port`` means ``https://`` on ``DEFAULT_AGENT_PORT``
+or on the given port.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import ssl
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+
+DEFAULT_AGENT_PORT = 2064
+DEFAULT_CONCURRENCY = 50
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+TOKEN_ENV = "SHIFTER_FLEET_TOKEN"
+
+# Answers that say "try again later" rather than "this request is wrong".
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class Host:
+    url: str
+    token: str = ""
+
+    @property
+    def name(self) -> str:
+        return self.url.split("://", 1)[-1].rstrip("/")
+
+
+@dataclass
+class HostResult:
+    """One host's answer: ``ok`` is True for a 2xx response with a JSON body."""
+
+    host: str
+    ok: bool
+    status: Optional[int] = None
+    data: Any = None
+    error: str = ""
+    attempts: int = 0
+    elapsed: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class FleetOptions:
+    concurrency: int = DEFAULT_CONCURRENCY
+    timeout: float = DEFAULT_TIMEOUT
+    retries: int = DEFAULT_RETRIES
+    backoff: float = DEFAULT_BACKOFF
+    verify_tls: bool = True
+    ca_file: Optional[str] = None
+    extra_headers: Dict[str, str] = field(default_factory=dict)
+
+
+def _normalize_url(value: str) -> str:
+    if "://" not in value:
+        host = value.rstrip("/")
+        # "host" or "host:port"; IPv6 literals need brackets: "[2001:db8::1]:2064".
+        has_port = host.rpartition(":")[2].isdigit() and (host.count(":") == 1 or host.startswith("["))
+        value = f"https://{host}" if has_port else f"https://{host}:{DEFAULT_AGENT_PORT}"
+    return value.rstrip("/")
+
+
+def parse_hosts(text: str, default_token: str = "") -> List[Host]:
+    """Parse a hosts file: ``URL [TOKEN]`` per line, ``#`` comments, duplicates dropped."""
+    hosts: Dict[str, Host] = {}
+    for number, line in enumerate(text.splitlines(), start=1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) > 2:
+            raise ValueError(f"line {number}: expected 'URL [TOKEN]', got {line.strip()!r}")
+        url = _normalize_url(fields[0])
+        hosts.setdefault(url, Host(url, fields[1] if len(fields) > 1 else default_token))
+    return list(hosts.values())
+
+
+def _ssl_context(options: FleetOptions):
+    if not options.verify_tls:
+        return False
+    if options.ca_file:
+        return ssl.create_default_context(cafile=options.ca_file)
+    return None
+
+
+class FleetClient:
+    """A pooled HTTP client that sends one request to many agents concurrently."""
+
+    def __init__(self, options: Optional[FleetOptions] = None):
+        self.options = options or FleetOptions()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "FleetClient":
+        concurrency = max(self.options.concurrency, 1)
+        connector = aiohttp.TCPConnector(limit=concurrency, ssl=_ssl_context(self.options), ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.options.extra_headers)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, host: Host, method: str, path: str, json: Any = None) -> HostResult:
+        """Send one request to ``host``, retrying transient failures."""
+        options = self.options
+        headers = {"Authorization": f"Bearer {host.token}"} if host.token else {}
+        timeout = aiohttp.ClientTimeout(total=options.timeout)
+        result = HostResult(host.name, ok=False)
+        started = time.monotonic()
+        for attempt in range(max(options.retries, 0) + 1):
+            if attempt:
+                delay = options.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            result.attempts = attempt + 1
+            async with self._semaphore:
+                try:
+                    async with self._session.request(method, host.url + path, json=json, headers=headers, timeout=timeout) as response:
+                        result.status = response.status
+                        try:
+                            result.data = await response.json(content_type=None)
+                        except ValueError:
+                            result.data = None
+                except asyncio.TimeoutError:
+                    result.status, result.error = None, f"timed out after {options.timeout:g}s"
+                    continue
+                except aiohttp.ClientError as exc:
+                    result.status, result.error = None, str(exc) or exc.__class__.__name__
+                    continue
+            if result.status in RETRY_STATUSES:
+                result.error = _error_text(result)
+                continue
+            break
+        result.ok = result.status is not None and 200 <= result.status < 300 and result.data is not None
+        if result.ok:
+            result.error = ""
+        elif result.status is not None:
+            result.error = _error_text(result)
+        result.elapsed = time.monotonic() - started
+        return result
+
+    async def fan_out(self, hosts: Sequence[Host], method: str, path: str, json: Any = None) -> List[HostResult]:
+        """Send the same request to every host; results are in ``hosts`` order."""
+        return list(await asyncio.gather(*(self.request(host, method, path, json) for host in hosts)))
+
+
+def _error_text(result: HostResult) -> str:
+    if isinstance(result.data, dict):
+        message = result.data.get("error") or result.data.get("message")
+        if message:
+            return f"HTTP {result.status}: {message}"
+    return f"HTTP {result.status}"
+
+
+async def _run(hosts: Sequence[Host], options: Optional[FleetOptions], method: str, path: str, json: Any = None) -> List[HostResult]:
+    async with FleetClient(options) as client:
+        return await client.fan_out(hosts, method, path, json)
+
+
+def status(hosts: Sequence[Host], options: Optional[FleetOptions] = None) -> List[HostResult]:
+    """``GET /api/v1/status`` on every host."""
+    return asyncio.run(_run(hosts, options, "GET", "/api/v1/status"))
+
+
+def apply(hosts: Sequence[Host], document: Dict[str, Any], plan_only: bool = False,
+          options: Optional[FleetOptions] = None) -> List[HostResult]:
+    """``POST /api/v1/apply`` with the same desired-state document on every host.
+
+    Retrying is safe: a host that applied the document but whose answer was
+    lost plans no changes the second time.
+    """
+    path = "/api/v1/apply?plan=true" if plan_only else "/api/v1/apply"
+    return asyncio.run(_run(hosts, options, "POST", path, document))
+
+
+def summary(results: Sequence[HostResult]) -> Dict[str, Any]:
+    ok = sum(1 for result in results if result.ok)
+    return {
+        "ok": ok,
+        "failed": len(results) - ok,
+        "hosts": [result.to_dict() for result in results],
+    }
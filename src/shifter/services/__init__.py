@@ -1,13 +1,34 @@
 """Service management modules for the Shifter toolkit."""
 
-from . import config, gost, haproxy, iptables, status, system_info, xray
+from . import actions, bulk, commands, config, daemon, desired, gost, gost_config, haproxy, haproxy_config, haproxy_runtime, iptables, iptables_nat, iptables_rules, metrics, nftables, nftables_rules, ports, probes, registry, reload, results, status, system_info, systemd, xray, xray_api, xray_stats
 
 __all__ = [
+    "actions",
+    "bulk",
+    "commands",
     "config",
+    "daemon",
+    "desired",
     "gost",
+    "gost_config",
     "haproxy",
+    "haproxy_config",
+    "haproxy_runtime",
     "iptables",
+    "iptables_nat",
+    "iptables_rules",
+    "metrics",
+    "nftables",
+    "nftables_rules",
+    "ports",
+    "probes",
+    "registry",
+    "reload",
+    "results",
     "status",
     "system_info",
+    "systemd",
     "xray",
+    "xray_api",
+    "xray_stats",
 ]
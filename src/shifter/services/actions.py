@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Registry of the mutating service actions exposed to the Web UI and other callers.
+
+Each entry maps a ``(service, action)`` pair to the service function and the
+named parameters it takes, so request handlers can validate raw string input
+and call the function in-process instead of shelling out to the CLI.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Tuple
+
+from . import bulk, gost, haproxy, haproxy_config, iptables, reload, xray
+from .results import ActionResult
+
+
+@dataclass(frozen=True)
+class Action:
+    """A service function plus its ``(field name, converter)`` parameter list.
+
+    ``options`` are optional keyword parameters, passed only when given and not blank.
+    """
+
+    func: Callable[..., ActionResult]
+    params: Tuple[Tuple[str, Callable[[str], Any]], ...] = ()
+    options: Tuple[Tuple[str, Callable[[str], Any]], ...] = ()
+
+
+ACTIONS: Dict[str, Dict[str, Action]] = {
+    "gost": {
+        "install": Action(gost.install_gost, (("domain", str), ("port", int))),
+        "add": Action(gost.add_port_gost, (("domain", str), ("port", int))),
+        "remove": Action(gost.remove_rule_by_port, (("port", int),)),
+        "add-bulk": Action(gost.add_rules_bulk, (("entries", bulk.reader(gost.BULK_ADD_FIELDS)),)),
+        "remove-bulk": Action(gost.remove_rules_bulk, (("entries", bulk.reader(gost.BULK_REMOVE_FIELDS)),)),
+        "uninstall": Action(gost.uninstall_gost),
+    },
+    "haproxy": {
+        "install": Action(haproxy.install_haproxy, (("relay_port", int), ("main_server_ip", str), ("main_server_port", int))),
+        "add": Action(
+            haproxy.add_frontend_backend, (("relay_port", int), ("main_server_ip", str), ("main_server_port", int)),
+            (("servers", haproxy_config.parse_servers), ("balance", haproxy_config.balance_algorithm),
+             ("check_inter", haproxy_config.check_interval)),
+        ),
+        "remove": Action(haproxy.remove_tunnel, (("frontend_name", str),)),
+        "add-bulk": Action(haproxy.add_tunnels_bulk, (("entries", bulk.reader(haproxy.BULK_ADD_FIELDS)),)),
+        "remove-bulk": Action(haproxy.remove_tunnels_bulk, (("entries", bulk.reader(haproxy.BULK_REMOVE_FIELDS)),)),
+        "set-destination": Action(haproxy.set_tunnel_destination, (("frontend_name", str), ("main_server_ip", str), ("main_server_port", int))),
+        "server-state": Action(haproxy.set_server_state, (("frontend_name", str), ("state", str))),
+        "add-server": Action(haproxy.add_server, (("frontend_name", str), ("server", haproxy_config.ServerSpec.parse))),
+        "remove-server": Action(haproxy.remove_server, (("frontend_name", str), ("server", lambda text: haproxy_config.ServerSpec.parse(text).target))),
+        "set-balance": Action(
+            haproxy.set_balance, (("frontend_name", str),),
+            (("balance", haproxy_config.balance_algorithm), ("check_inter", haproxy.check_setting)),
+        ),
+        "uninstall": Action(haproxy.uninstall_haproxy),
+    },
+    "xray": {
+        "install": Action(xray.install_xray, (("address", str), ("port", int))),
+        "add": Action(xray.add_another_inbound, (("address", str), ("port", int))),
+        "remove": Action(xray.remove_inbound_by_port, (("port", int),)),
+        "add-bulk": Action(xray.add_inbounds_bulk, (("entries", bulk.reader(xray.BULK_ADD_FIELDS)),)),
+        "remove-bulk": Action(xray.remove_inbounds_bulk, (("entries", bulk.reader(xray.BULK_REMOVE_FIELDS)),)),
+        "uninstall": Action(xray.uninstall_xray),
+    },
+    "iptables": {
+        "install": Action(iptables.install_iptables, (("main_server_ip", str), ("ports", str))),
+        "uninstall": Action(iptables.uninstall_iptables),
+    },
+}
+
+# One lock per service so concurrent callers never interleave config writes.
+_service_locks: Dict[str, threading.Lock] = {service: threading.Lock() for service in ACTIONS}
+
+
+def service_lock(service: str) -> threading.Lock:
+    """Return the lock serialising ``service``'s actions (and its coalesced reloads)."""
+    return _service_locks[service]
+
+
+def get_action(service: str, action: str) -> Action:
+    """Return the registered action, raising KeyError when it does not exist."""
+    return ACTIONS[service][action]
+
+
+def describe(service: str, action: str, params: Mapping[str, Any]) -> str:
+    """Return a one-line label such as ``haproxy add 8443 203.0.113.7 443``."""
+    spec = ACTIONS.get(service, {}).get(action)
+    values = [str(params.get(name, "")).strip() for name, _ in (spec.params if spec else ())]
+    # Bulk entries span lines; the label only names the action.
+    return " ".join([service, action, *(value for value in values if value and "\n" not in value)])
+
+
+def run_action(service: str, action: str, params: Mapping[str, Any], wait_reload: bool = True) -> ActionResult:
+    """Validate ``params`` and run the action, serialised per service.
+
+    When a reload scheduler is installed the service reload is queued. With
+    ``wait_reload`` the call returns once that reload has run, reporting it on
+    the result; otherwise ``result.data["reload"]`` holds the pending tickets.
+
+    Blocking: call it from a worker thread when running inside an event loop.
+    """
+    try:
+        spec = get_action(service, action)
+    except KeyError:
+        return ActionResult().fail(f"Unknown action: {service} {action}")
+
+    args = []
+    for name, convert in spec.params:
+        raw = params.get(name)
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            return ActionResult().fail(f"Missing required field: {name}")
+        try:
+            args.append(convert(raw.strip() if isinstance(raw, str) else raw))
+        except (TypeError, ValueError):
+            return ActionResult().fail(f"Invalid value for {name}: {raw!r}")
+    kwargs = {}
+    for name, convert in spec.options:
+        raw = params.get(name)
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            continue
+        try:
+            kwargs[name] = convert(raw.strip() if isinstance(raw, str) else raw)
+        except (TypeError, ValueError) as e:
+            return ActionResult().fail(f"Invalid value for {name}: {e}")
+
+    with reload.collecting(describe(service, action, params)) as tickets:
+        with _service_locks[service]:
+            result = spec.func(*args, **kwargs)
+    # Wait outside the lock: the reload itself needs it.
+    if wait_reload:
+        return reload.wait(result, tickets)
+    return reload.pending(result, tickets)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""Bulk add/remove support shared by the GOST, HAProxy and Xray services.
+
+Entries come from CSV text (a file for the CLI, a textarea for the Web UI), one
+tunnel per line with an optional header row and ``#`` comments. The service's
+bulk function checks every entry before touching anything; if any entry is
+rejected nothing is written, otherwise all entries are applied in one config
+write followed by a single reload.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from .results import ActionResult
+
+Fields = Sequence[Tuple[str, Callable[[str], Any]]]
+
+PENDING = "pending"
+REJECTED = "rejected"
+SKIPPED = "skipped"
+APPLIED = "applied"
+
+
+def port(value: str) -> int:
+    """Converter for TCP/UDP port fields."""
+    number = int(value)
+    if not 1 <= number <= 65535:
+        raise ValueError(f"port out of range: {number}")
+    return number
+
+
+@dataclass
+class BulkEntry:
+    """One CSV row: its line number, converted values and outcome."""
+
+    line: int
+    raw: str
+    values: Dict[str, Any] = field(default_factory=dict)
+    status: str = PENDING
+    message: str = ""
+
+    def reject(self, message: str) -> None:
+        self.status = REJECTED
+        self.message = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "line": self.line,
+            "entry": self.raw,
+            "status": self.status,
+            "message": self.message,
+        }
+
+
+def parse_entries(text: str, fields: Fields) -> List[BulkEntry]:
+    """Parse CSV ``text`` into entries; rows that fail conversion come back rejected."""
+    names = [name for name, _ in fields]
+    entries: List[BulkEntry] = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        row = [cell.strip() for cell in next(csv.reader(io.StringIO(stripped)))]
+        if not entries and [cell.lower() for cell in row] == names:
+            continue
+        entry = BulkEntry(number, stripped)
+        entries.append(entry)
+        if len(row) != len(fields):
+            entry.reject(f"expected {len(fields)} field(s) ({', '.join(names)}), got {len(row)}")
+            continue
+        for (name, convert), cell in zip(fields, row):
+            try:
+                entry.values[name] = convert(cell)
+            except (TypeError, ValueError):
+                entry.reject(f"invalid value for {name}: {cell!r}")
+                break
+    return entries
+
+
+def reader(fields: Fields) -> Callable[[str], List[BulkEntry]]:
+    """Return a converter for ``actions.Action`` params that parses CSV text."""
+    def convert(text: str) -> List[BulkEntry]:
+        return parse_entries(text, fields)
+    return convert
+
+
+def reject_duplicates(entries: List[BulkEntry], key: str) -> None:
+    """Reject entries repeating ``key`` from an earlier entry in the same batch."""
+    seen: Dict[Any, int] = {}
+    for entry in entries:
+        if entry.status == REJECTED:
+            continue
+        value = entry.values[key]
+        if value in seen:
+            entry.reject(f"duplicate {key} {value} (also on line {seen[value]})")
+        else:
+            seen[value] = entry.line
+
+
+def pending(entries: List[BulkEntry]) -> List[BulkEntry]:
+    return [entry for entry in entries if entry.status == PENDING]
+
+
+def _report(result: ActionResult, entries: List[BulkEntry]) -> None:
+    result.data["entries"] = [entry.to_dict() for entry in entries]
+    for entry in entries:
+        suffix = f": {entry.message}" if entry.message else ""
+        result.step(f"  line {entry.line:<5} {entry.status:<8} {entry.raw}{suffix}")
+
+
+def abort(result: ActionResult, entries: List[BulkEntry]) -> ActionResult:
+    """Report a batch with rejected entries; nothing has been changed."""
+    rejected = sum(1 for entry in entries if entry.status == REJECTED)
+    for entry in entries:
+        if entry.status == PENDING:
+            entry.status = SKIPPED
+            entry.message = "not applied because other entries were rejected"
+    _report(result, entries)
+    return result.fail(f"{rejected} of {len(entries)} entries rejected; no changes were made.")
+
+
+def check(result: ActionResult, entries: List[BulkEntry]) -> bool:
+    """Return True when the batch may be applied, failing ``result`` otherwise."""
+    if not entries:
+        result.fail("No entries found.")
+        return False
+    if any(entry.status == REJECTED for entry in entries):
+        abort(result, entries)
+        return False
+    return True
+
+
+def complete(result: ActionResult, entries: List[BulkEntry], message: str) -> ActionResult:
+    """Mark every entry applied and report the batch."""
+    for entry in entries:
+        entry.status = APPLIED
+    _report(result, entries)
+    return result.ok(message)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Subprocess helper shared by the service modules."""
+
+from __future__ import annotations
+
+import subprocess
+from typing import Optional, Sequence, Union
+
+from .results import ActionResult
+
+
+def _format_command(command: Union[str, Sequence[str]]) -> str:
+    return command if isinstance(command, str) else " ".join(command)
+
+
+def run_command(
+    command: Union[str, Sequence[str]],
+    result: Optional[ActionResult] = None,
+    **kwargs,
+) -> Optional[subprocess.CompletedProcess]:
+    """Run ``command`` and return the completed process, or None on failure.
+
+    Output is captured as text unless the caller overrides it. Failures are
+    recorded on ``result`` as non-fatal errors so the calling action decides
+    whether they are fatal.
+    """
+    kwargs.setdefault("text", True)
+    if "stdout" not in kwargs and "stderr" not in kwargs:
+        kwargs.setdefault("capture_output", True)
+    try:
+        return subprocess.run(command, check=True, **kwargs)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        if result is not None:
+            message = f"Error executing command: {_format_command(command)}\n{e}"
+            stderr = getattr(e, "stderr", None)
+            if stderr:
+                message = f"{message}\n{stderr.strip()}"
+            result.warn(message)
+        return None
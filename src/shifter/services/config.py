@@ -5,19 +5,50 @@
 from __future__ import annotations
 
 import json
+import os
 from importlib import resources
+from pathlib import Path
 from typing import Any
 
 # System destination paths configured by Shifter's installers.
 GOST_SERVICE_PATH = "/usr/lib/systemd/system/gost.service"
+GOST_CONFIG_PATH = "/etc/gost/config.json"
 HAPROXY_CONFIG_PATH = "/etc/haproxy/haproxy.cfg"
+HAPROXY_RUNTIME_SOCKET = "/run/haproxy/admin.sock"
 IPTABLES_RULES_PATH = "/etc/iptables/rules.v4"
 IPTABLES_DIR = "/etc/iptables"
+NFTABLES_RULES_PATH = "/etc/nftables.d/shifter.nft"
+NFTABLES_DIR = "/etc/nftables.d"
 XRAY_CONFIG_PATH = "/usr/local/etc/xray/config.json"
+XRAY_BINARY_PATH = "/usr/local/bin/xray"
+XRAY_API_ADDRESS = "127.0.0.1:10085"
 GOST_INSTALL_DIR = "/opt/gost"
+DAEMON_SOCKET_PATH = "/run/shifter/daemon.sock"
 
 _DATA_PACKAGE = "shifter.data"
 
+# Shifter's own state (Web UI credentials, counters) lives in the config directory.
+CONFIG_DIR_ENV = "SHIFTER_CONFIG_DIR"
+AUTH_FILE_ENV = "SHIFTER_AUTH_FILE"
+HOME_ENV = "SHIFTER_HOME"
+DEFAULT_CONFIG_SUBDIR = "config"
+
+
+def _expand_path(path: str) -> Path:
+    return Path(path).expanduser()
+
+
+def resolve_config_dir() -> Path:
+    """Resolve the configuration directory path."""
+    if auth_file_env := os.environ.get(AUTH_FILE_ENV):
+        return _expand_path(auth_file_env).parent
+    if config_dir_env := os.environ.get(CONFIG_DIR_ENV):
+        return _expand_path(config_dir_env)
+    home_root = os.environ.get(HOME_ENV)
+    if home_root:
+        return _expand_path(home_root) / DEFAULT_CONFIG_SUBDIR
+    return Path.home() / "Shifter" / DEFAULT_CONFIG_SUBDIR
+
 
 def load_text_template(filename: str) -> str:
     """Return the contents of a packaged text template."""
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""Local action server behind ``shifter daemon``.
+
+Every CLI invocation is its own process, so a script calling
+``shifter haproxy add`` in a loop reloads HAProxy once per call. While the
+daemon runs, the mutating CLI commands send their action over a Unix socket
+instead. The daemon runs it through :func:`actions.run_action` with a
+:class:`~shifter.services.reload.ReloadScheduler` installed, so changes that
+arrive within the reload window share a single reload.
+
+The protocol is one JSON line per connection in each direction. The request
+is ``{"service", "action", "params", "wait"}`` and the reply is
+``ActionResult.to_dict()``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import socketserver
+from typing import Any, Mapping, Optional
+
+from . import actions, reload
+from .config import DAEMON_SOCKET_PATH
+from .results import ActionResult
+
+SOCKET_ENV = "SHIFTER_DAEMON_SOCKET"
+
+# Generous: a waiting client also sits out the reload window and the reload itself.
+CLIENT_TIMEOUT = 300.0
+
+
+def socket_path() -> str:
+    return os.environ.get(SOCKET_ENV) or DAEMON_SOCKET_PATH
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            result = actions.run_action(
+                str(request["service"]),
+                str(request["action"]),
+                dict(request.get("params") or {}),
+                wait_reload=bool(request.get("wait", True)),
+            )
+        except (ValueError, KeyError, TypeError) as exc:
+            result = ActionResult().fail(f"Malformed daemon request: {exc}")
+        self.wfile.write(json.dumps(result.to_dict()).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _in_use(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def serve(path: Optional[str] = None, window: float = reload.DEFAULT_WINDOW) -> None:
+    """Serve actions on ``path`` until interrupted; queued reloads run before exit."""
+    path = path or socket_path()
+    if os.path.exists(path):
+        if _in_use(path):
+            raise RuntimeError(f"Another daemon is already listening on {path}.")
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    scheduler = reload.ReloadScheduler(window=window, lock_for=actions.service_lock)
+    previous = reload.install(scheduler)
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.close()
+        reload.install(previous)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def submit(
+    service: str,
+    action: str,
+    params: Mapping[str, Any],
+    wait: bool = True,
+    path: Optional[str] = None,
+) -> Optional[ActionResult]:
+    """Run an action through the daemon, or return None when no daemon is listening."""
+    payload = json.dumps({"service": service, "action": action, "params": dict(params), "wait": wait})
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(CLIENT_TIMEOUT)
+        try:
+            client.connect(path or socket_path())
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        client.sendall(payload.encode() + b"\n")
+        with client.makefile("rb") as reply:
+            line = reply.readline()
+    if not line:
+        return ActionResult().fail("The Shifter daemon closed the connection without a reply.")
+    return ActionResult(**json.loads(line))
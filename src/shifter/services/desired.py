@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+
+"""Declarative tunnel sets for ``shifter-toolkit apply``.
+
+A desired-state file (YAML, or JSON) lists the complete tunnel set of every
+service it names::
+
+    gost:
+      - {port: 8443, destination: example.com:443}
+    haproxy:
+      - {port: 9443, destination: 203.0.113.7:443}
+    xray:
+      - {port: 10000, destination: 203.0.113.7}
+    iptables:
+      - {destination: 203.0.113.8, ports: "80,443,1000:2000", protocols: [tcp]}
+
+A destination without a port forwards to the listen port. Services that are
+not in the file are left alone. A service given an empty list loses all of its
+tunnels.
+
+:func:`plan` diffs the file against what the services report: ``list_rules``,
+``list_tunnels``, ``list_inbounds`` and the live nat table. It returns only
+the tunnels to add, change or remove. :func:`apply` then writes each affected
+service's config once and reloads it at most once. An unchanged file writes
+nothing and reloads nothing.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import actions, bulk, gost, haproxy, haproxy_config, iptables, iptables_rules, ports, reload, xray
+from .iptables_nat import split_destination
+from .results import ActionResult
+
+SERVICES = ("gost", "haproxy", "xray", "iptables")
+
+ADD = "add"
+CHANGE = "change"
+REMOVE = "remove"
+_SYMBOLS = {ADD: "+", CHANGE: "~", REMOVE: "-"}
+
+
+class DesiredStateError(ValueError):
+    """The desired-state file cannot be read or does not describe a valid tunnel set."""
+
+
+@dataclass(frozen=True)
+class DesiredTunnel:
+    """One wanted tunnel. iptables tunnels are one port token of one protocol."""
+
+    service: str
+    key: str
+    destination: str
+    host: str
+    dest_port: Optional[int] = None
+    protocols: Tuple[str, ...] = ()
+    ports: Tuple[Tuple[int, int], ...] = ()
+
+    @property
+    def protocols_label(self) -> str:
+        return "/".join(sorted(proto.upper() for proto in self.protocols))
+
+
+class Existing(NamedTuple):
+    """A tunnel as its service reports it; ``name`` is what removing it takes.
+
+    ``pool`` marks a load-balanced HAProxy tunnel, whose servers, weights,
+    balance and checks a desired-state file cannot describe.
+    """
+
+    name: str
+    destination: str
+    protocols: str = ""
+    pool: bool = False
+
+
+@dataclass
+class Change:
+    service: str
+    action: str
+    key: str
+    current: Optional[Existing] = None
+    wanted: Optional[DesiredTunnel] = None
+
+    def line(self) -> str:
+        before = self.current.destination if self.current else ""
+        after = self.wanted.destination if self.wanted else ""
+        if self.action == CHANGE:
+            detail = f"{before} -> {after}"
+            if self.current.protocols != self.wanted.protocols_label:
+                detail += f" ({self.current.protocols} -> {self.wanted.protocols_label})"
+        else:
+            detail = after or before
+        return f"{_SYMBOLS[self.action]} {self.service:<9} {self.key:<16} {detail}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "service": self.service,
+            "action": self.action,
+            "key": self.key,
+            "current": self.current.destination if self.current else None,
+            "desired": self.wanted.destination if self.wanted else None,
+        }
+
+
+@dataclass
+class Plan:
+    """The changes that make the services match a desired state."""
+
+    desired: Dict[str, List[DesiredTunnel]]
+    changes: List[Change] = field(default_factory=list)
+    conflicts: List[str] = field(default_factory=list)
+
+    def for_service(self, service: str) -> List[Change]:
+        return [change for change in self.changes if change.service == service]
+
+    def lines(self) -> List[str]:
+        if not self.changes:
+            return ["No changes; the tunnels already match the desired state."]
+        counts = {action: sum(1 for c in self.changes if c.action == action) for action in _SYMBOLS}
+        lines = [change.line() for change in self.changes]
+        lines.append(f"Plan: {counts[ADD]} to add, {counts[CHANGE]} to change, {counts[REMOVE]} to remove.")
+        return lines
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "services": list(self.desired),
+            "changes": [change.to_dict() for change in self.changes],
+            "conflicts": list(self.conflicts),
+        }
+
+
+# --- reading the desired state ---
+
+def decode(text: str, source: str = "desired state") -> Any:
+    """Decode a YAML (or JSON) document without validating it."""
+    try:
+        import yaml
+    except ImportError:
+        # JSON is valid YAML, so JSON files work without PyYAML.
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise DesiredStateError(f"{source}: not valid JSON, and PyYAML is not installed to read YAML: {e}")
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise DesiredStateError(f"{source}: not valid YAML: {e}")
+
+
+def _port(value: Any, where: str) -> int:
+    try:
+        return bulk.port(str(value))
+    except ValueError:
+        raise DesiredStateError(f"{where}: invalid port {value!r}")
+
+
+def _protocols(item: Dict[str, Any], where: str) -> Tuple[str, ...]:
+    value = item.get("protocols", iptables_rules.PROTOCOLS)
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, (list, tuple)):
+        raise DesiredStateError(f"{where}: protocols must be a list such as [tcp, udp]")
+    protocols = tuple(dict.fromkeys(str(name).strip().lower() for name in names))
+    if not protocols or not set(protocols) <= set(iptables_rules.PROTOCOLS):
+        raise DesiredStateError(f"{where}: protocols must be tcp and/or udp, got {value!r}")
+    return protocols
+
+
+def _destination(item: Dict[str, Any], where: str, default_port: Optional[int]) -> Tuple[str, Optional[int]]:
+    value = item.get("destination")
+    if not isinstance(value, str) or not value.strip() or any(ch.isspace() for ch in value.strip()):
+        raise DesiredStateError(f"{where}: destination is required (host or host:port)")
+    host, dest_port = split_destination(value.strip())
+    if not host:
+        raise DesiredStateError(f"{where}: invalid destination {value!r}")
+    dest_port = dest_port if dest_port is not None else default_port
+    if dest_port is not None and not 1 <= dest_port <= 65535:
+        raise DesiredStateError(f"{where}: invalid destination port in {value!r}")
+    return host, dest_port
+
+
+def _listener(service: str, item: Dict[str, Any], where: str, protocols: Tuple[str, ...] = ()) -> DesiredTunnel:
+    if "port" not in item:
+        raise DesiredStateError(f"{where}: port is required")
+    port = _port(item["port"], where)
+    # GOST and Xray forward to the listen port unless told otherwise; HAProxy has no default.
+    host, dest_port = _destination(item, where, None if service == "haproxy" else port)
+    if dest_port is None:
+        raise DesiredStateError(f"{where}: destination must be host:port")
+    return DesiredTunnel(service, str(port), f"{host}:{dest_port}", host, dest_port, protocols, ((port, port),))
+
+
+def _gost(item: Dict[str, Any], where: str) -> List[DesiredTunnel]:
+    return [_listener("gost", item, where, _protocols(item, where))]
+
+
+def _haproxy(item: Dict[str, Any], where: str) -> List[DesiredTunnel]:
+    return [_listener("haproxy", item, where)]
+
+
+def _xray(item: Dict[str, Any], where: str) -> List[DesiredTunnel]:
+    return [_listener("xray", item, where)]
+
+
+def _iptables(item: Dict[str, Any], where: str) -> List[DesiredTunnel]:
+    value = item.get("ports")
+    if isinstance(value, (list, tuple)):
+        value = ",".join(str(token) for token in value)
+    try:
+        tokens = iptables_rules.parse_ports(value if value is not None else "")
+    except ValueError as e:
+        raise DesiredStateError(f"{where}: {e}")
+    host, dest_port = _destination(item, where, None)
+    # DNAT takes the destination verbatim; a port on it rewrites the destination port.
+    destination = item["destination"].strip()
+    return [
+        DesiredTunnel("iptables", f"{proto}/{token}", destination, host, dest_port,
+                      protocols=(proto,), ports=(_span(token),))
+        for proto in _protocols(item, where)
+        for token in tokens
+    ]
+
+
+def _span(token: str) -> Tuple[int, int]:
+    first, _, last = token.partition(":")
+    return int(first), int(last or first)
+
+
+PARSERS: Dict[str, Callable[[Dict[str, Any], str], List[DesiredTunnel]]] = {
+    "gost": _gost,
+    "haproxy": _haproxy,
+    "xray": _xray,
+    "iptables": _iptables,
+}
+
+
+def validate(data: Any, source: str = "desired state") -> Dict[str, List[DesiredTunnel]]:
+    """Check a decoded desired-state document; returns the tunnels of each service it names."""
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise DesiredStateError(f"{source}: expected a mapping of service names to tunnel lists")
+    unknown = sorted(str(name) for name in data if name not in SERVICES)
+    if unknown:
+        raise DesiredStateError(f"{source}: unknown service(s) {', '.join(unknown)}; expected {', '.join(SERVICES)}")
+    desired: Dict[str, List[DesiredTunnel]] = {}
+    owners: Dict[int, str] = {}
+    for service in SERVICES:
+        if service not in data:
+            continue
+        items = data[service] or []
+        if not isinstance(items, list):
+            raise DesiredStateError(f"{source}: {service} must be a list of tunnels")
+        tunnels: Dict[str, DesiredTunnel] = {}
+        for number, item in enumerate(items, start=1):
+            where = f"{service}[{number}]"
+            if not isinstance(item, dict):
+                raise DesiredStateError(f"{where}: expected a mapping such as {{port: 8443, destination: host:443}}")
+            for tunnel in PARSERS[service](item, where):
+                previous = tunnels.get(tunnel.key)
+                if previous is not None and previous.destination != tunnel.destination:
+                    raise DesiredStateError(f"{where}: {tunnel.key} is listed twice with different destinations")
+                tunnels[tunnel.key] = tunnel
+        for tunnel in tunnels.values():
+            for first, last in tunnel.ports:
+                for port in range(first, last + 1):
+                    owner = owners.setdefault(port, service)
+                    if owner != service:
+                        raise DesiredStateError(f"{source}: port {port} is listed for both {owner} and {service}")
+        desired[service] = list(tunnels.values())
+    return desired
+
+
+def parse(text: str, source: str = "desired state") -> Dict[str, List[DesiredTunnel]]:
+    return validate(decode(text, source), source)
+
+
+def load(path: str) -> Dict[str, List[DesiredTunnel]]:
+    """Read and validate a desired-state file (see :func:`parse`)."""
+    try:
+        with open(path, "r") as f:
+            text = f.read()
+    except OSError as e:
+        raise DesiredStateError(f"Could not read {path}: {e}")
+    return parse(text, path)
+
+
+# --- reading the current state ---
+
+def _current_gost() -> Dict[str, Existing]:
+    return {rule["port"]: Existing(rule["port"], rule["domain"], rule["protocols"]) for rule in gost.list_rules()}
+
+
+def _current_haproxy() -> Dict[str, Existing]:
+    # Frontends without a bind port or a server are not tunnels Shifter could have written.
+    return {
+        tunnel["port"]: Existing(
+            tunnel["frontend"], tunnel["destination"], pool=tunnel["backend"].startswith(haproxy_config.POOL_PREFIX)
+        )
+        for tunnel in haproxy.list_tunnels()
+        if tunnel["port"] != "N/A" and tunnel["destination"] != "N/A"
+    }
+
+
+def _current_xray() -> Dict[str, Existing]:
+    # Only dokodemo-door inbounds have a destination; other inbounds are left alone.
+    return {
+        str(inbound["port"]): Existing(str(inbound["port"]), inbound["destination"])
+        for inbound in xray.list_inbounds()
+        if inbound["destination"] != "N/A"
+    }
+
+
+def _current_iptables() -> Dict[str, Existing]:
+    rules = iptables.load_forwards()
+    if rules is None:
+        raise DesiredStateError("Could not read the current nat table (iptables-save failed).")
+    return {
+        f"{proto}/{token}": Existing(f"{proto}/{token}", destination, proto.upper())
+        for token, proto, destination in rules.ports()
+    }
+
+
+CURRENT: Dict[str, Callable[[], Dict[str, Existing]]] = {
+    "gost": _current_gost,
+    "haproxy": _current_haproxy,
+    "xray": _current_xray,
+    "iptables": _current_iptables,
+}
+
+
+# --- diffing ---
+
+def _differs(current: Existing, wanted: DesiredTunnel) -> bool:
+    if current.destination != wanted.destination:
+        return True
+    # Only GOST rules choose their protocols per tunnel; iptables keys include the protocol.
+    return wanted.service == "gost" and current.protocols != wanted.protocols_label
+
+
+def diff(service: str, wanted: Sequence[DesiredTunnel], current: Dict[str, Existing]) -> List[Change]:
+    """The minimal changes turning ``current`` into ``wanted`` for one service."""
+    changes = []
+    wanted_keys = set()
+    for tunnel in wanted:
+        wanted_keys.add(tunnel.key)
+        existing = current.get(tunnel.key)
+        if existing is None:
+            changes.append(Change(service, ADD, tunnel.key, None, tunnel))
+        elif _differs(existing, tunnel):
+            changes.append(Change(service, CHANGE, tunnel.key, existing, tunnel))
+    changes.extend(Change(service, REMOVE, key, existing) for key, existing in current.items() if key not in wanted_keys)
+    return changes
+
+
+def _key_ports(service: str, key: str) -> range:
+    first, last = _span(key.rpartition("/")[2] if service == "iptables" else key)
+    return range(first, last + 1)
+
+
+def _conflicts(changes: Sequence[Change]) -> List[str]:
+    """Ports the additions need that another backend or a local socket holds.
+
+    Ports this plan frees in another service do not count.
+    """
+    added = [change for change in changes if change.action == ADD]
+    if not added:
+        return []
+    index = ports.scan()
+    released = set()
+    for change in changes:
+        if change.action == REMOVE:
+            released.update(_key_ports(change.service, change.key))
+    conflicts = []
+    for change in added:
+        for port in _key_ports(change.service, change.key):
+            reason = None if port in released else index.conflict(port, change.service)
+            if reason:
+                conflicts.append(f"{change.service} {change.key}: port {port} is {reason}")
+                break
+    return conflicts
+
+
+def _pool_changes(changes: Sequence[Change]) -> List[str]:
+    """Load-balanced tunnels the plan would change.
+
+    Changing one means re-creating it with a single server, which would drop
+    its other servers and settings. Removing one is fine.
+    """
+    return [
+        f"{change.service} {change.key}: {change.current.name} is load-balanced "
+        "(managed with add-server/remove-server); not changed by apply"
+        for change in changes
+        if change.action == CHANGE and change.current.pool
+    ]
+
+
+def plan(desired: Dict[str, List[DesiredTunnel]]) -> Plan:
+    """Diff the desired tunnels against the services they name."""
+    result = Plan(desired)
+    for service, wanted in desired.items():
+        result.changes.extend(diff(service, wanted, CURRENT[service]()))
+    result.conflicts = _pool_changes(result.changes) + _conflicts(result.changes)
+    return result
+
+
+# --- applying ---
+
+def _apply_gost(changes: Sequence[Change], wanted: Sequence[DesiredTunnel]) -> ActionResult:
+    add = {int(c.key): (c.wanted.destination, c.wanted.protocols) for c in changes if c.action != REMOVE}
+    remove = [int(c.key) for c in changes if c.action == REMOVE]
+    return gost.apply_rules(add, remove)
+
+
+def _apply_haproxy(changes: Sequence[Change], wanted: Sequence[DesiredTunnel]) -> ActionResult:
+    add = {int(c.key): (c.wanted.host, c.wanted.dest_port) for c in changes if c.action != REMOVE}
+    # A changed tunnel is re-created; its old backend goes if nothing else uses it.
+    remove = [c.current.name for c in changes if c.action != ADD]
+    return haproxy.apply_tunnels(add, remove)
+
+
+def _apply_xray(changes: Sequence[Change], wanted: Sequence[DesiredTunnel]) -> ActionResult:
+    add = {int(c.key): (c.wanted.host, c.wanted.dest_port) for c in changes if c.action != REMOVE}
+    remove = [int(c.key) for c in changes if c.action == REMOVE]
+    return xray.apply_inbounds(add, remove)
+
+
+def _apply_iptables(changes: Sequence[Change], wanted: Sequence[DesiredTunnel]) -> ActionResult:
+    # The chains are rebuilt in one restore anyway, so hand over the whole set.
+    forwards: Dict[str, Dict[str, List[str]]] = {}
+    for tunnel in wanted:
+        proto, _, token = tunnel.key.partition("/")
+        forwards.setdefault(tunnel.destination, {}).setdefault(proto, []).append(token)
+    return iptables.apply_forwards(forwards)
+
+
+APPLIERS: Dict[str, Callable[[Sequence[Change], Sequence[DesiredTunnel]], ActionResult]] = {
+    "gost": _apply_gost,
+    "haproxy": _apply_haproxy,
+    "xray": _apply_xray,
+    "iptables": _apply_iptables,
+}
+
+
+def apply(plan: Plan) -> ActionResult:
+    """Apply ``plan``: one config write and at most one reload per service with changes.
+
+    Each service is diffed again under its lock before it is written, so a
+    concurrent apply of the same state finds nothing left to do. Services are
+    applied in order and the first failure stops the run; the services before
+    it keep their new state.
+    """
+    result = ActionResult()
+    result.data["plan"] = plan.to_dict()
+    for line in plan.lines():
+        result.step(line)
+    if plan.conflicts:
+        for line in plan.conflicts:
+            result.warn(line)
+        return result.fail(f"{len(plan.conflicts)} conflict(s); no changes were made.")
+    if not plan.changes:
+        return result.ok("Nothing to apply.")
+    applied, count = [], 0
+    for service in SERVICES:
+        if not plan.for_service(service):
+            continue
+        with reload.collecting(f"apply: {len(plan.for_service(service))} {service} change(s)") as tickets:
+            with actions.service_lock(service):
+                changes = diff(service, plan.desired[service], CURRENT[service]())
+                # A tunnel may have become load-balanced since the plan was made.
+                blocked = _pool_changes(changes)
+                if blocked:
+                    outcome = ActionResult().fail("; ".join(blocked))
+                else:
+                    outcome = APPLIERS[service](changes, plan.desired[service]) if changes else None
+        if outcome is None:
+            result.step(f"{service} already matches the desired state; skipped.")
+            continue
+        # Wait outside the lock: a coalesced reload needs it.
+        outcome = reload.wait(outcome, tickets)
+        result.details.extend(outcome.details)
+        result.errors.extend(outcome.errors)
+        if not outcome.success:
+            untouched = [s for s in SERVICES if s not in applied and s != service and plan.for_service(s)]
+            suffix = f" {', '.join(untouched)} not changed." if untouched else ""
+            return result.fail(f"{outcome.message}{suffix}")
+        result.step(outcome.message)
+        applied.append(service)
+        count += len(changes)
+    if not applied:
+        return result.ok("Nothing to apply; another change already made the tunnels match.")
+    return result.ok(f"Applied {count} change(s) to {', '.join(applied)}.")
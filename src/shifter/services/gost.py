@@ -1,33 +1,80 @@
 #!/usr/bin/env python3
 
 import os
-import re
-import subprocess
 import tarfile
 import shutil
 import platform
-import sys
-from collections import defaultdict
-import requests
 
-from .config import GOST_INSTALL_DIR, GOST_SERVICE_PATH, load_text_template
+from .config import GOST_CONFIG_PATH, GOST_INSTALL_DIR, GOST_SERVICE_PATH, load_text_template
+from . import bulk, gost_config, ports, registry, reload, safe_write, systemd
+from .gost_config import GostConfig
+from .commands import run_command
+from .results import ActionResult
 
 GOST_BINARY_PATH = os.path.join(GOST_INSTALL_DIR, "gost")
-
-def _run_command(command, **kwargs):
-    try:
-        return subprocess.run(command, check=True, text=True, **kwargs)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error executing command: {' '.join(command)}\n{e}", file=sys.stderr)
-        return None
+BULK_ADD_FIELDS = (("domain", str), ("port", bulk.port))
+BULK_REMOVE_FIELDS = (("port", bulk.port),)
+# GOST acknowledges SIGHUP before re-reading its config; give it time to fail.
+RELOAD_SETTLE_SECONDS = 1.0
 
 def is_gost_active():
-    result = subprocess.run(["systemctl", "is-active", "--quiet", "gost"])
-    return result.returncode == 0
+    return systemd.is_active("gost")
+
+def _unit_content():
+    content = load_text_template("gost.service")
+    return content.replace("/usr/local/bin/gost", GOST_BINARY_PATH).replace("/etc/gost/config.json", GOST_CONFIG_PATH)
+
+def _write_unit():
+    safe_write.write_file(GOST_SERVICE_PATH, _unit_content(), lambda path: safe_write.check_unit(path, "gost.service"))
+
+def _reload_gost(result):
+    """Reload now, or queue a coalesced reload when a scheduler is installed (see services.reload)."""
+    return reload.request("gost", result, _reload_gost_now)
+
+def _reload_gost_now(result):
+    """Reload, restoring the last working config if GOST does not stay up."""
+    return safe_write.reload_checked(result, "gost", GOST_CONFIG_PATH, _signal_gost, settle=RELOAD_SETTLE_SECONDS)
+
+def _signal_gost(result):
+    """GOST re-reads its config file on SIGHUP (the unit's ExecReload). Restart only if that fails."""
+    if run_command(["sudo", "systemctl", "reload", "gost"], result) is None:
+        result.warn("Reload failed; falling back to a full restart.")
+        run_command(["sudo", "systemctl", "restart", "gost"], result)
+
+def _load_config(result):
+    """Returns the config, as the tunnel registry holds it (see services.registry). Older installs keep rules as -L flags on the unit's ExecStart
+    line; those are moved into the config file, the unit is rewritten and GOST is
+    restarted onto it. The migration is complete by itself, so an action that then
+    fails its checks does not leave GOST running the old command line."""
+    if os.path.exists(GOST_CONFIG_PATH):
+        return registry.load("gost")
+    with open(GOST_SERVICE_PATH, 'r') as f:
+        line = gost_config.exec_line(f.read()) or ""
+    cfg = GostConfig.from_legacy_flags(line)
+    result.step(f"Migrating {len(cfg.ports())} rule(s) from gost.service to {GOST_CONFIG_PATH}...")
+    # The unit goes first: until config.json exists the next call retries the migration.
+    _write_unit()
+    registry.write("gost", cfg)
+    run_command(["sudo", "systemctl", "daemon-reload"], result)
+    # The running process was started with -L flags and must be restarted onto -C.
+    run_command(["sudo", "systemctl", "restart", "gost"], result)
+    return cfg
+
+def _save_and_apply(result, cfg):
+    """Stores the config in the tunnel registry, writes the file rendered from it and
+    applies it; returns False when the change was rolled back."""
+    safe_write.ensure_good(GOST_CONFIG_PATH, "gost")
+    registry.write("gost", cfg)
+    return _reload_gost(result)
 
 def install_gost(domain, port):
+    import requests  # only the installer downloads anything; keep it off the import path
+    result = ActionResult()
+    conflict = ports.scan().conflict(port, "gost")
+    if conflict:
+        return result.fail(f"Port {port} is {conflict}.")
     if is_gost_active():
-        print("GOST service is already installed. Proceeding with reinstallation...")
+        result.step("GOST service is already installed. Proceeding with reinstallation...")
 
     try:
         os_map = {'Linux': 'linux', 'Darwin': 'darwin', 'Windows': 'windows'}
@@ -38,154 +85,196 @@ def install_gost(domain, port):
         arch_name = arch_map.get(arch)
 
         if not os_name or not arch_name:
-            print(f"Unsupported OS/Arch: {system}/{arch}", file=sys.stderr)
-            return
+            return result.fail(f"Unsupported OS/Arch: {system}/{arch}")
 
-        print("Fetching latest GOST version from GitHub...")
+        result.step("Fetching latest GOST version from GitHub...")
         api_url = "https://api.github.com/repos/go-gost/gost/releases/latest"
         response = requests.get(api_url)
         response.raise_for_status()
         release_data = response.json()
-        
+
         download_url = next((asset.get('browser_download_url') for asset in release_data.get('assets', []) if os_name in asset.get('name', '') and arch_name in asset.get('name', '')), None)
-        
+
         if not download_url:
-            print(f"Could not find a GOST release for {os_name}/{arch_name}.", file=sys.stderr)
-            return
+            return result.fail(f"Could not find a GOST release for {os_name}/{arch_name}.")
 
-        print(f"Downloading: {download_url}")
+        result.step(f"Downloading: {download_url}")
         tmp_archive = "/tmp/gost.tar.gz"
         with requests.get(download_url, stream=True) as r:
             r.raise_for_status()
             with open(tmp_archive, 'wb') as f: shutil.copyfileobj(r.raw, f)
-        
-        print("Extracting GOST binary...")
+
+        result.step("Extracting GOST binary...")
         with tarfile.open(tmp_archive, "r:gz") as tar: tar.extract('gost', path='/tmp/')
-        
-        print(f"Installing GOST to {GOST_INSTALL_DIR}...")
+
+        result.step(f"Installing GOST to {GOST_INSTALL_DIR}...")
         os.makedirs(GOST_INSTALL_DIR, exist_ok=True)
         shutil.move('/tmp/gost', GOST_BINARY_PATH)
         os.chmod(GOST_BINARY_PATH, 0o755)
         os.remove(tmp_archive)
 
-        print("Writing gost.service from packaged template...")
-        service_content = load_text_template("gost.service")
-        service_content = service_content.replace("/usr/local/bin/gost", GOST_BINARY_PATH)
-        exec_start_line = f"ExecStart={GOST_BINARY_PATH} -L=tcp://:{port}/{domain}:{port} -L=udp://:{port}/{domain}:{port}"
-        service_content = re.sub(r"^ExecStart=.*$", exec_start_line, service_content, flags=re.MULTILINE)
+        result.step(f"Writing {GOST_CONFIG_PATH}...")
+        cfg = GostConfig()
+        cfg.add_rule(domain, port)
+        registry.write("gost", cfg)
 
-        with open(GOST_SERVICE_PATH, "w") as f: f.write(service_content)
+        result.step("Writing gost.service from packaged template...")
+        _write_unit()
 
-        _run_command(["sudo", "systemctl", "daemon-reload"])
-        _run_command(["sudo", "systemctl", "enable", "--now", "gost"])
+        run_command(["sudo", "systemctl", "daemon-reload"], result)
+        run_command(["sudo", "systemctl", "enable", "--now", "gost"], result)
 
-        if is_gost_active(): print("GOST tunnel is installed and active.")
-        else: print("GOST service failed to start.", file=sys.stderr)
+        if is_gost_active(): return result.ok("GOST tunnel is installed and active.")
+        return result.fail("GOST service failed to start.")
 
-    except (requests.RequestException, tarfile.TarError, IOError, OSError, KeyError) as e:
-        print(f"An error occurred during installation: {e}", file=sys.stderr)
+    except (requests.RequestException, tarfile.TarError, IOError, OSError, KeyError, safe_write.ValidationError) as e:
+        return result.fail(f"An error occurred during installation: {e}")
 
 def get_gost_status_details():
+    result = ActionResult()
     status = "active" if is_gost_active() else "inactive"
-    print(f"GOST Service Status: {status}")
-    print("\nConfigured Forwarding Rules (from gost.service):")
+    result.step(f"GOST Service Status: {status}")
+    result.step("")
+    result.step(f"Configured Forwarding Rules (from {GOST_CONFIG_PATH}):")
     rules = list_rules()
+    result.data['rules'] = rules
     if not rules:
-        print("  - No forwarding rules found in configuration.")
-        return
+        result.step("  - No forwarding rules found in configuration.")
+        return result
     for rule in rules:
-        print(f"  - Port: {rule['port']:<5} -> Destination: {rule['domain']}")
+        result.step(f"  - Port: {rule['port']:<5} -> Destination: {rule['domain']}")
+    return result
 
 def add_port_gost(domain, port):
+    result = ActionResult()
     if not is_gost_active():
-        print("GOST service is not active.", file=sys.stderr)
-        return
+        return result.fail("GOST service is not active.")
     try:
-        port_check_result = subprocess.run(["sudo", "lsof", "-i", f":{port}"], capture_output=True, text=True)
-        if port_check_result.returncode == 0:
-            print(f"Port {port} is already in use.", file=sys.stderr)
-            return
-    except FileNotFoundError as e:
-        print(f"Error executing lsof: {e}", file=sys.stderr)
-        return
+        cfg = _load_config(result)
+    except (IOError, ValueError, safe_write.ValidationError) as e:
+        return result.fail(f"Could not read GOST configuration: {e}")
+    if cfg.has_port(port):
+        return result.fail(f"Port {port} already has a forwarding rule.")
+    conflict = ports.scan().conflict(port, "gost")
+    if conflict:
+        return result.fail(f"Port {port} is {conflict}.")
+    cfg.add_rule(domain, port)
     try:
-        with open(GOST_SERVICE_PATH, 'r') as f: content = f.read()
-        new_forward_rule = f" -L=tcp://:{port}/{domain}:{port} -L=udp://:{port}/{domain}:{port}"
-        if new_forward_rule in content:
-            print("This exact rule already exists.", file=sys.stderr)
-            return
-        new_content = re.sub(r'^(ExecStart=.*)$', f'\\1{new_forward_rule}', content, flags=re.MULTILINE)
-        with open(GOST_SERVICE_PATH, 'w') as f: f.write(new_content)
-        _run_command(["sudo", "systemctl", "daemon-reload"])
-        _run_command(["sudo", "systemctl", "restart", "gost"])
-        print("New forwarding rule added to GOST.")
+        if not _save_and_apply(result, cfg):
+            return safe_write.rolled_back(result, "GOST")
+        return result.ok("New forwarding rule added to GOST.")
     except IOError as e:
-        print(f"Error updating service file: {e}", file=sys.stderr)
+        return result.fail(f"Error updating GOST configuration: {e}")
 
-def list_rules():
-    """Parses gost.service and returns a list of configured rules."""
-    if not os.path.exists(GOST_SERVICE_PATH): return []
+def add_rules_bulk(entries):
+    """Adds many forwarding rules with one config write and one reload (see services.bulk)."""
+    result = ActionResult()
+    if not is_gost_active():
+        return result.fail("GOST service is not active.")
+    try:
+        cfg = _load_config(result)
+    except (IOError, ValueError, safe_write.ValidationError) as e:
+        return result.fail(f"Could not read GOST configuration: {e}")
+    bulk.reject_duplicates(entries, "port")
+    for entry in bulk.pending(entries):
+        if cfg.has_port(entry.values["port"]):
+            entry.reject(f"port {entry.values['port']} already has a rule")
+    conflicts = ports.check_ports([entry.values["port"] for entry in bulk.pending(entries)], "gost")
+    for entry in bulk.pending(entries):
+        if entry.values["port"] in conflicts:
+            entry.reject(f"port {entry.values['port']} is {conflicts[entry.values['port']]}")
+    if not bulk.check(result, entries):
+        return result
+    for entry in entries:
+        cfg.add_rule(entry.values["domain"], entry.values["port"])
+    try:
+        if not _save_and_apply(result, cfg):
+            return safe_write.rolled_back(result, "GOST")
+    except IOError as e:
+        return result.fail(f"Error updating GOST configuration: {e}")
+    return bulk.complete(result, entries, f"Added {len(entries)} forwarding rule(s).")
+
+def remove_rules_bulk(entries):
+    """Removes many forwarding rules with one config write and one reload (see services.bulk)."""
+    result = ActionResult()
+    try:
+        cfg = _load_config(result)
+    except (IOError, ValueError, safe_write.ValidationError) as e:
+        return result.fail(f"Could not read GOST configuration: {e}")
+    bulk.reject_duplicates(entries, "port")
+    for entry in bulk.pending(entries):
+        if not cfg.has_port(entry.values["port"]):
+            entry.reject("no rule for this port")
+    if not bulk.check(result, entries):
+        return result
+    cfg.remove_ports(entry.values["port"] for entry in entries)
+    try:
+        if not _save_and_apply(result, cfg):
+            return safe_write.rolled_back(result, "GOST")
+    except IOError as e:
+        return result.fail(f"Error writing GOST configuration: {e}")
+    return bulk.complete(result, entries, f"Removed {len(entries)} forwarding rule(s).")
+
+def apply_rules(add, remove):
+    """Removes the ``remove`` ports, then adds ``add`` ({port: (destination, protocols)}),
+    with one config write and one reload (see services.desired). Ports were checked by the caller."""
+    result = ActionResult()
     try:
-        with open(GOST_SERVICE_PATH, 'r') as f: content = f.read()
-        exec_line = re.search(r"^ExecStart=.*$", content, re.MULTILINE)
-        if not exec_line: return []
-        rules_map = defaultdict(set)
-        found_rules = re.findall(r'-L=(tcp|udp)://:(\d+)/([^ ]+)', exec_line.group(0))
-        for proto, port, dest in found_rules:
-            rules_map[(port, dest)].add(proto.upper())
-        
-        rules_data = []
-        for (port, domain), protos in sorted(rules_map.items()):
-            proto_str = "/".join(sorted(list(protos)))
-            rules_data.append({'port': port, 'domain': domain, 'protocols': proto_str})
-        return rules_data
-    except IOError:
-        return []
+        cfg = _load_config(result)
+    except (IOError, ValueError, safe_write.ValidationError) as e:
+        return result.fail(f"Could not read GOST configuration: {e}")
+    cfg.remove_ports(remove)
+    for port, (destination, protocols) in add.items():
+        cfg.remove_ports([port])
+        for proto in protocols:
+            cfg.add_service(proto, port, destination)
+    try:
+        if not _save_and_apply(result, cfg):
+            return safe_write.rolled_back(result, "GOST")
+    except IOError as e:
+        return result.fail(f"Error writing GOST configuration: {e}")
+    return result.ok(f"GOST: {len(add)} rule(s) added or changed, {len(remove)} removed.")
+
+def list_rules():
+    """Returns the configured forwarding rules (from the tunnel registry, see services.registry)."""
+    return registry.entries("gost")
 
 def remove_rule_by_port(port_to_remove):
     """Removes a forwarding rule by its port number."""
+    result = ActionResult()
     try:
-        port_to_remove = str(port_to_remove)
-        with open(GOST_SERVICE_PATH, 'r') as f: content = f.read()
-    except (IOError, ValueError) as e:
-        print(f"Could not read service file or validate port: {e}", file=sys.stderr)
-        return
-    
-    domain_to_remove = None
-    all_rules = re.findall(r'-L=tcp://:(\d+)/([^ ]+)', content)
-    for port, domain in all_rules:
-        if port == port_to_remove:
-            domain_to_remove = domain
-            break
-
-    if domain_to_remove is None:
-        print(f"No rule found for port {port_to_remove}.", file=sys.stderr)
-        return
-
-    tcp_pattern = f" -L=tcp://:{port_to_remove}/{domain_to_remove}"
-    udp_pattern = f" -L=udp://:{port_to_remove}/{domain_to_remove}"
-    new_content = content.replace(tcp_pattern, "").replace(udp_pattern, "")
+        port_to_remove = int(port_to_remove)
+        cfg = _load_config(result)
+    except (IOError, ValueError, safe_write.ValidationError) as e:
+        return result.fail(f"Could not read GOST configuration or validate port: {e}")
+
+    if not cfg.has_port(port_to_remove):
+        return result.fail(f"No rule found for port {port_to_remove}.")
 
+    result.step(f"Removing forwarding rule for port {port_to_remove}...")
+    cfg.remove_ports([port_to_remove])
     try:
-        with open(GOST_SERVICE_PATH, 'w') as f: f.write(new_content)
-        print(f"Removing forwarding rule for port {port_to_remove}...")
-        _run_command(["sudo", "systemctl", "daemon-reload"])
-        _run_command(["sudo", "systemctl", "restart", "gost"])
-        print(f"Rule for port {port_to_remove} has been removed.")
+        if not _save_and_apply(result, cfg):
+            return safe_write.rolled_back(result, "GOST")
+        return result.ok(f"Rule for port {port_to_remove} has been removed.")
     except IOError as e:
-        print(f"Error writing service file: {e}", file=sys.stderr)
+        return result.fail(f"Error writing GOST configuration: {e}")
 
 def uninstall_gost():
-    print("Uninstalling GOST...")
+    result = ActionResult()
+    result.step("Uninstalling GOST...")
     if is_gost_active():
-        _run_command(["sudo", "systemctl", "disable", "--now", "gost"])
+        run_command(["sudo", "systemctl", "disable", "--now", "gost"], result)
     if os.path.exists(GOST_SERVICE_PATH):
         try: os.remove(GOST_SERVICE_PATH)
-        except OSError as e: print(f"Could not remove service file: {e}", file=sys.stderr)
+        except OSError as e: result.warn(f"Could not remove service file: {e}")
+    if os.path.exists(GOST_CONFIG_PATH):
+        try: os.remove(GOST_CONFIG_PATH)
+        except OSError as e: result.warn(f"Could not remove config file: {e}")
     if os.path.exists(GOST_INSTALL_DIR):
         try:
             shutil.rmtree(GOST_INSTALL_DIR)
-            print(f"Removed GOST directory: {GOST_INSTALL_DIR}")
-        except OSError as e: print(f"Could not remove directory {GOST_INSTALL_DIR}: {e}", file=sys.stderr)
-    _run_command(["sudo", "systemctl", "daemon-reload"])
-    print("GOST service has been uninstalled.")
+            result.step(f"Removed GOST directory: {GOST_INSTALL_DIR}")
+        except OSError as e: result.warn(f"Could not remove directory {GOST_INSTALL_DIR}: {e}")
+    run_command(["sudo", "systemctl", "daemon-reload"], result)
+    return result.ok("GOST service has been uninstalled.")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+"""GOST v3 configuration file managed by Shifter.
+
+Each forwarding rule becomes one GOST service per protocol, equivalent to the
+``-L=tcp://:PORT/HOST:PORT`` flags older installs put on the unit's
+``ExecStart`` line::
+
+    {"services": [{"name": "tcp-8080", "addr": ":8080",
+                   "handler": {"type": "tcp"}, "listener": {"type": "tcp"},
+                   "forwarder": {"nodes": [{"name": "target-0", "addr": "example.com:8080"}]}}]}
+
+Services are indexed by listening port so lookups, adds and removals do not
+scan the file, and the unit only needs ``-C <path>``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import GOST_CONFIG_PATH, GOST_SERVICE_PATH
+from .safe_write import write_file
+
+PROTOCOLS = ("tcp", "udp")
+
+_LEGACY_FLAG = re.compile(r"-L=(tcp|udp)://:(\d+)/([^\s]+)")
+
+
+def _port_of(addr: str) -> Optional[int]:
+    _, _, port = str(addr).rpartition(":")
+    return int(port) if port.isdigit() else None
+
+
+class GostConfig:
+    """The parsed config plus an index of services by listening port."""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self.data: Dict[str, Any] = data if data is not None else {}
+        self.data.setdefault("services", [])
+        self._by_port: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for service in self.data["services"]:
+            port = _port_of(service.get("addr", ""))
+            if port is not None:
+                self._by_port[port].append(service)
+
+    @classmethod
+    def from_file(cls, path: str = GOST_CONFIG_PATH) -> "GostConfig":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_legacy_flags(cls, exec_line: str) -> "GostConfig":
+        """Build a config from ``-L=proto://:port/dest`` flags on an ExecStart line."""
+        config = cls()
+        for proto, port, dest in _LEGACY_FLAG.findall(exec_line):
+            config.add_service(proto, int(port), dest)
+        return config
+
+    # --- queries ---
+    def ports(self) -> List[int]:
+        return sorted(port for port, services in self._by_port.items() if services)
+
+    def has_port(self, port: int) -> bool:
+        return bool(self._by_port.get(int(port)))
+
+    def destination(self, port: int) -> Optional[str]:
+        for service in self._by_port.get(int(port), []):
+            nodes = service.get("forwarder", {}).get("nodes", [])
+            if nodes:
+                return nodes[0].get("addr")
+        return None
+
+    def rule(self, port: int) -> Optional[Dict[str, str]]:
+        """Return one rule in the shape ``gost.list_rules`` has always used."""
+        services = self._by_port.get(int(port))
+        if not services:
+            return None
+        protos = sorted({s.get("listener", {}).get("type", "tcp").upper() for s in services})
+        return {
+            'port': str(port),
+            'domain': self.destination(port) or "N/A",
+            'protocols': "/".join(protos),
+        }
+
+    def rules(self) -> List[Dict[str, str]]:
+        return [self.rule(port) for port in self.ports()]
+
+    def services_on(self, port: int) -> List[Dict[str, Any]]:
+        """The GOST services listening on ``port`` (one per protocol)."""
+        return list(self._by_port.get(int(port), []))
+
+    def portless_services(self) -> List[Dict[str, Any]]:
+        """Services without a listening port; they are not forwarding rules."""
+        return [s for s in self.data["services"] if _port_of(s.get("addr", "")) is None]
+
+    # --- mutation ---
+    def add_service(self, proto: str, port: int, dest: str) -> Dict[str, Any]:
+        service = {
+            "name": f"{proto}-{port}",
+            "addr": f":{port}",
+            "handler": {"type": proto},
+            "listener": {"type": proto},
+            "forwarder": {"nodes": [{"name": "target-0", "addr": dest}]},
+        }
+        self.data["services"].append(service)
+        self._by_port[int(port)].append(service)
+        return service
+
+    def add_rule(self, domain: str, port: int, protocols: Iterable[str] = PROTOCOLS) -> None:
+        """Forward ``port`` to ``domain:port`` for each protocol."""
+        for proto in protocols:
+            self.add_service(proto, port, f"{domain}:{port}")
+
+    def remove_ports(self, ports: Iterable[int]) -> int:
+        """Remove every service listening on ``ports``; returns how many were removed."""
+        doomed = set()
+        for port in ports:
+            doomed.update(id(service) for service in self._by_port.pop(int(port), []))
+        if doomed:
+            self.data["services"] = [s for s in self.data["services"] if id(s) not in doomed]
+        return len(doomed)
+
+    def write(self, path: str = GOST_CONFIG_PATH) -> None:
+        """Replace the config file atomically (see services.safe_write)."""
+        write_file(path, json.dumps(self.data, indent=2))
+
+
+def exec_line(unit_content: str) -> Optional[str]:
+    match = re.search(r"^ExecStart=.*$", unit_content, re.MULTILINE)
+    return match.group(0) if match else None
+
+
+def read_rules(config_path: str = GOST_CONFIG_PATH, unit_path: str = GOST_SERVICE_PATH) -> List[Dict[str, str]]:
+    """Return the configured rules, reading legacy unit flags if not migrated yet."""
+    if os.path.exists(config_path):
+        return GostConfig.from_file(config_path).rules()
+    if os.path.exists(unit_path):
+        with open(unit_path, "r") as f:
+            line = exec_line(f.read())
+        if line:
+            return GostConfig.from_legacy_flags(line).rules()
+    return []
+
@@ -1,184 +1,491 @@
 #!/usr/bin/env python3
 
 import os
-import re
-import subprocess
-import shutil
-import sys
 
 from .config import HAPROXY_CONFIG_PATH, load_text_template
+from . import haproxy_config
+from .haproxy_config import HAProxyConfig
+from .haproxy_runtime import HAProxyRuntimeError, RuntimeClient
 from .system_info import get_system_info
+from . import bulk, ports, registry, reload, safe_write, systemd
+from .commands import run_command
+from .results import ActionResult
 
-def _run_command(command, **kwargs):
-    try:
-        return subprocess.run(command, check=True, text=True, **kwargs)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error executing command: {' '.join(command)}\n{e}", file=sys.stderr)
-        return None
+BULK_ADD_FIELDS = (("relay_port", bulk.port), ("main_server_ip", str), ("main_server_port", bulk.port))
+BULK_REMOVE_FIELDS = (("frontend_name", str),)
+
+def check_setting(value):
+    """A ``check inter`` value such as ``2s``, or ``off`` to remove health checks."""
+    return "off" if value.strip().lower() == "off" else haproxy_config.check_interval(value)
 
 def is_haproxy_active():
-    result = subprocess.run(["systemctl", "is-active", "--quiet", "haproxy"])
-    return result.returncode == 0
+    return systemd.is_active("haproxy")
+
+def _load_config():
+    """Returns a private copy of haproxy.cfg as the tunnel registry holds it (see services.registry)."""
+    return registry.load("haproxy")
+
+def _write_config(cfg):
+    """Stores the config in the tunnel registry and replaces haproxy.cfg with the file
+    rendered from it, validated with ``haproxy -c`` (see services.safe_write)."""
+    safe_write.ensure_good(HAPROXY_CONFIG_PATH, "haproxy")
+    registry.write("haproxy", cfg, safe_write.check_haproxy)
+
+def _reload_haproxy(result):
+    """Reload now, or queue a coalesced reload when a scheduler is installed (see services.reload)."""
+    return reload.request("haproxy", result, _reload_haproxy_now)
+
+def _reload_haproxy_now(result):
+    """Reload, restoring the last working haproxy.cfg if HAProxy does not stay up."""
+    return safe_write.reload_checked(result, "haproxy", HAPROXY_CONFIG_PATH, _signal_haproxy)
+
+def _signal_haproxy(result):
+    """Seamless reload: the master starts new workers on the inherited listeners
+    while old workers finish their connections. Restart only if reload fails."""
+    if run_command(["sudo", "systemctl", "reload", "haproxy"], result) is None:
+        result.warn("Reload failed; falling back to a full restart.")
+        run_command(["sudo", "systemctl", "restart", "haproxy"], result)
 
 def install_haproxy(relay_port, main_server_ip, main_server_port):
+    result = ActionResult()
+    conflict = ports.scan().conflict(relay_port, "haproxy")
+    if conflict:
+        return result.fail(f"Port {relay_port} is {conflict}. Choose another.")
     if is_haproxy_active():
-        print("HAProxy is already active. Proceeding with reinstallation...")
+        result.step("HAProxy is already active. Proceeding with reinstallation...")
     try:
         package_manager = get_system_info()['package_manager']
-        print("Installing HAProxy...")
-        _run_command(["sudo", package_manager, "install", "haproxy", "-y"], capture_output=True)
-        print("Writing haproxy.cfg from packaged template...")
-        template_content = load_text_template("haproxy.cfg")
-        temp_path = "/tmp/haproxy.cfg"
-        with open(temp_path, 'w') as f:
-            f.write(template_content)
-        shutil.move(temp_path, HAPROXY_CONFIG_PATH)
-        print(f"Moved new haproxy.cfg to {HAPROXY_CONFIG_PATH}")
-    except (OSError, requests.RequestException, KeyError) as e:
-        print(f"An error occurred during installation: {e}", file=sys.stderr)
-        return
-    print("Configuring HAProxy...")
-    try:
-        with open(HAPROXY_CONFIG_PATH, 'r') as f:
-            content = f.read()
+        result.step("Installing HAProxy...")
+        run_command(["sudo", package_manager, "install", "haproxy", "-y"], result)
+    except (OSError, KeyError) as e:
+        return result.fail(f"An error occurred during installation: {e}")
+    result.step("Configuring HAProxy...")
+    try:
+        content = load_text_template("haproxy.cfg")
         content = content.replace("$iport", str(relay_port))
         content = content.replace("$IP", main_server_ip)
         content = content.replace("$port", str(main_server_port))
-        with open(HAPROXY_CONFIG_PATH, 'w') as f:
-            f.write(content)
-        _run_command(["sudo", "systemctl", "enable", "haproxy"])
-        _run_command(["sudo", "systemctl", "restart", "haproxy"])
+        registry.write("haproxy", HAProxyConfig.parse(content), safe_write.check_haproxy)
+        result.step(f"Wrote {HAPROXY_CONFIG_PATH} from packaged template.")
+        run_command(["sudo", "systemctl", "enable", "haproxy"], result)
+        run_command(["sudo", "systemctl", "restart", "haproxy"], result)
         if is_haproxy_active():
-            print("HAProxy tunnel is installed and active.")
-        else:
-            print("HAProxy service failed to start.", file=sys.stderr)
-    except IOError as e:
-        print(f"Error configuring HAProxy: {e}", file=sys.stderr)
+            return result.ok("HAProxy tunnel is installed and active.")
+        return result.fail("HAProxy service failed to start.")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error configuring HAProxy: {e}")
 
 def get_haproxy_status_details():
+    result = ActionResult()
     status = "active" if is_haproxy_active() else "inactive"
-    print(f"HAProxy Service Status: {status}")
-    print("\nConfigured Tunnels (from haproxy.cfg):")
+    result.step(f"HAProxy Service Status: {status}")
+    result.step("")
+    result.step("Configured Tunnels (from haproxy.cfg):")
     tunnels = list_tunnels()
+    result.data['tunnels'] = tunnels
     if not tunnels:
-        print("  - No tunnels defined in config.")
-        return
+        result.step("  - No tunnels defined in config.")
+        return result
     for tunnel in tunnels:
-        print(f"  - Frontend: {tunnel['frontend']:<25} Port: {tunnel['port']:<5} -> Destination: {tunnel['destination']}")
+        result.step(f"  - Frontend: {tunnel['frontend']:<25} Port: {tunnel['port']:<5} -> Destination: {describe_servers(tunnel)}")
+    return result
+
+def describe_servers(tunnel):
+    """``a:1`` for a plain tunnel; ``a:1 (weight 3), b:2 (backup) [leastconn, check 2s]`` for a pool."""
+    servers = tunnel.get('servers') or []
+    if len(servers) < 2 and not tunnel.get('balance') and not any(server['check'] for server in servers):
+        return tunnel['destination']
+    parts = []
+    for server in servers:
+        flags = ([f"weight {server['weight']}"] if server['weight'] is not None else []) + (["backup"] if server['backup'] else [])
+        parts.append(server['address'] + (f" ({', '.join(flags)})" if flags else ""))
+    settings = [tunnel.get('balance') or "roundrobin"]
+    checks = {server['check'] for server in servers if server['check']}
+    if checks:
+        settings.append(f"check {'/'.join(sorted(checks))}")
+    return f"{', '.join(parts)} [{', '.join(settings)}]"
 
-def add_frontend_backend(relay_port, main_server_ip, main_server_port):
+def add_frontend_backend(relay_port, main_server_ip, main_server_port, servers=(), balance=None, check_inter=None):
+    """Adds a tunnel. Extra ``servers`` (ServerSpec), a ``balance`` algorithm or a
+    ``check_inter`` health check interval give it its own load-balanced backend."""
+    result = ActionResult()
     if not is_haproxy_active():
-        print("HAProxy service is not active. Please start it first.", file=sys.stderr)
-        return
-    with open(HAPROXY_CONFIG_PATH, 'r') as f:
-        if f"frontend tunnel-{relay_port}" in f.read():
-            print(f"Port {relay_port} is already in use by HAProxy. Choose another.", file=sys.stderr)
-            return
-    new_config = f"""
-frontend tunnel-{relay_port}
-    bind :::{relay_port} v4v6
-    mode tcp
-    default_backend tunnel-{main_server_ip}-{main_server_port}
-
-backend tunnel-{main_server_ip}-{main_server_port}
-    mode tcp
-    server target_server {main_server_ip}:{main_server_port}
-"""
-    try:
-        with open(HAPROXY_CONFIG_PATH, 'a') as f:
-            f.write(new_config)
-        _run_command(["sudo", "systemctl", "restart", "haproxy"])
-        print("New frontend and backend added successfully.")
+        return result.fail("HAProxy service is not active. Please start it first.")
+    try:
+        cfg = _load_config()
     except IOError as e:
-        print(f"Error updating HAProxy configuration: {e}", file=sys.stderr)
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    if cfg.frontend_for_port(relay_port) or f"tunnel-{relay_port}" in cfg.frontends:
+        return result.fail(f"Port {relay_port} is already in use by HAProxy. Choose another.")
+    conflict = ports.scan().conflict(relay_port, "haproxy")
+    if conflict:
+        return result.fail(f"Port {relay_port} is {conflict}. Choose another.")
+    frontend, _ = cfg.add_tunnel(relay_port, main_server_ip, main_server_port, servers, balance, check_inter)
+    try:
+        _write_config(cfg)
+        if not _reload_haproxy(result):
+            return safe_write.rolled_back(result, "HAProxy")
+        if servers:
+            return result.ok(f"New frontend and backend with {len(servers) + 1} servers added successfully.")
+        return result.ok("New frontend and backend added successfully.")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error updating HAProxy configuration: {e}")
 
 def list_tunnels():
-    """Parses haproxy.cfg and returns a list of configured tunnels."""
-    if not os.path.exists(HAPROXY_CONFIG_PATH):
-        return []
-    try:
-        with open(HAPROXY_CONFIG_PATH, 'r') as f:
-            content = f.read()
-        
-        frontend_pattern = re.compile(r"frontend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
-        backend_pattern = re.compile(r"backend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
-        frontends = {m.group(1): m.group(2) for m in frontend_pattern.finditer(content)}
-        backends = {m.group(1): m.group(2) for m in backend_pattern.finditer(content)}
-        
-        tunnels_data = []
-        for fe_name, fe_config in frontends.items():
-            bind_match = re.search(r"bind\s+.*?:(\d+)", fe_config)
-            backend_match = re.search(r"default_backend\s+([^\s]+)", fe_config)
-            port = bind_match.group(1) if bind_match else "N/A"
-            be_name = backend_match.group(1) if backend_match else "N/A"
-            destination = "N/A"
-            if be_name in backends:
-                server_match = re.search(r"server\s+\w+\s+([^\s]+)", backends[be_name])
-                if server_match:
-                    destination = server_match.group(1)
-            tunnels_data.append({'frontend': fe_name, 'port': port, 'backend': be_name, 'destination': destination})
-        return tunnels_data
-    except IOError:
-        return []
+    """Returns the configured tunnels (from the tunnel registry, see services.registry)."""
+    return registry.entries("haproxy")
 
 def remove_tunnel(frontend_name):
-    """Removes a frontend and its corresponding backend by the frontend's name."""
+    """Removes a frontend and its backend, unless another frontend still uses that backend."""
+    result = ActionResult()
     try:
-        with open(HAPROXY_CONFIG_PATH, 'r') as f:
-            lines = f.readlines()
+        cfg = _load_config()
     except IOError as e:
-        print(f"Could not read {HAPROXY_CONFIG_PATH}: {e}", file=sys.stderr)
-        return
-
-    content = "".join(lines)
-    frontend_block_pattern = re.compile(r"frontend\s+" + re.escape(frontend_name) + r"\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
-    fe_match = frontend_block_pattern.search(content)
-
-    if not fe_match:
-        print(f"Frontend '{frontend_name}' not found.", file=sys.stderr)
-        return
-
-    backend_match = re.search(r"default_backend\s+([^\s]+)", fe_match.group(0))
-    if not backend_match:
-        print(f"Could not find backend for frontend '{frontend_name}'.", file=sys.stderr)
-        return
-    
-    backend_to_remove = backend_match.group(1)
-    print(f"Removing frontend '{frontend_name}' and backend '{backend_to_remove}'...")
-
-    new_lines = []
-    in_fe_block = False
-    in_be_block = False
-    for line in lines:
-        if line.strip() == f"frontend {frontend_name}":
-            in_fe_block = True
-            continue
-        if line.strip() == f"backend {backend_to_remove}":
-            in_be_block = True
-            continue
-        if (in_fe_block or in_be_block) and not line.strip():
-            in_fe_block = False
-            in_be_block = False
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+
+    frontend = cfg.frontends.get(frontend_name)
+    if frontend is None:
+        return result.fail(f"Frontend '{frontend_name}' not found.")
+    backend_args = frontend.get("default_backend")
+    if not backend_args:
+        return result.fail(f"Could not find backend for frontend '{frontend_name}'.")
+
+    backend_name = backend_args[0]
+    cfg.remove_section(frontend)
+    backend = cfg.backends.get(backend_name)
+    if backend is not None and not cfg.frontends_using(backend_name):
+        result.step(f"Removing frontend '{frontend_name}' and backend '{backend_name}'...")
+        cfg.remove_section(backend)
+        message = "Frontend and backend removed successfully."
+    else:
+        result.step(f"Removing frontend '{frontend_name}' (backend '{backend_name}' is still in use)...")
+        message = "Frontend removed successfully."
+
+    try:
+        _write_config(cfg)
+        if not _reload_haproxy(result):
+            return safe_write.rolled_back(result, "HAProxy")
+        return result.ok(message)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+
+def add_tunnels_bulk(entries):
+    """Adds many tunnels with one config write and one reload (see services.bulk)."""
+    result = ActionResult()
+    if not is_haproxy_active():
+        return result.fail("HAProxy service is not active. Please start it first.")
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    bulk.reject_duplicates(entries, "relay_port")
+    for entry in bulk.pending(entries):
+        relay_port = entry.values["relay_port"]
+        if cfg.frontend_for_port(relay_port) or f"tunnel-{relay_port}" in cfg.frontends:
+            entry.reject(f"port {relay_port} is already in use by HAProxy")
+    conflicts = ports.check_ports([entry.values["relay_port"] for entry in bulk.pending(entries)], "haproxy")
+    for entry in bulk.pending(entries):
+        if entry.values["relay_port"] in conflicts:
+            entry.reject(f"port {entry.values['relay_port']} is {conflicts[entry.values['relay_port']]}")
+    if not bulk.check(result, entries):
+        return result
+    for entry in entries:
+        cfg.add_tunnel(entry.values["relay_port"], entry.values["main_server_ip"], entry.values["main_server_port"])
+    try:
+        _write_config(cfg)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error updating HAProxy configuration: {e}")
+    if not _reload_haproxy(result):
+        return safe_write.rolled_back(result, "HAProxy")
+    return bulk.complete(result, entries, f"Added {len(entries)} tunnel(s).")
+
+def remove_tunnels_bulk(entries):
+    """Removes many tunnels with one config write and one reload (see services.bulk)."""
+    result = ActionResult()
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    bulk.reject_duplicates(entries, "frontend_name")
+    for entry in bulk.pending(entries):
+        frontend = cfg.frontends.get(entry.values["frontend_name"])
+        if frontend is None:
+            entry.reject("frontend not found")
+        elif not frontend.get("default_backend"):
+            entry.reject("frontend has no backend")
+    if not bulk.check(result, entries):
+        return result
+    backend_names = set()
+    for entry in entries:
+        frontend = cfg.frontends[entry.values["frontend_name"]]
+        backend_names.add(frontend.get("default_backend")[0])
+        cfg.remove_section(frontend)
+    for backend_name in sorted(backend_names):
+        backend = cfg.backends.get(backend_name)
+        if backend is not None and not cfg.frontends_using(backend_name):
+            cfg.remove_section(backend)
+    try:
+        _write_config(cfg)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+    if not _reload_haproxy(result):
+        return safe_write.rolled_back(result, "HAProxy")
+    return bulk.complete(result, entries, f"Removed {len(entries)} tunnel(s).")
+
+def apply_tunnels(add, remove):
+    """Removes the ``remove`` frontends, then adds ``add`` ({relay_port: (ip, port)}), with one
+    config write and one reload (see services.desired). Ports were checked by the caller."""
+    result = ActionResult()
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    backend_names = set()
+    for frontend_name in remove:
+        frontend = cfg.frontends.get(frontend_name)
+        if frontend is None:
             continue
-        if not in_fe_block and not in_be_block:
-            new_lines.append(line)
+        backend_args = frontend.get("default_backend")
+        if backend_args:
+            backend_names.add(backend_args[0])
+        cfg.remove_section(frontend)
+    added = [cfg.add_tunnel(relay_port, ip, port)[0].name for relay_port, (ip, port) in add.items()]
+    for backend_name in sorted(backend_names):
+        backend = cfg.backends.get(backend_name)
+        if backend is not None and not cfg.frontends_using(backend_name):
+            cfg.remove_section(backend)
+    try:
+        _write_config(cfg)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+    if not _reload_haproxy(result):
+        return safe_write.rolled_back(result, "HAProxy")
+    return result.ok(f"HAProxy: {len(add)} tunnel(s) added or changed, {len(set(remove) - set(added))} removed.")
+
+def _tunnel_server(cfg, frontend_name):
+    """Returns (backend section, server line index, server args) for a tunnel, or an error message."""
+    frontend = cfg.frontends.get(frontend_name)
+    if frontend is None:
+        return None, f"Frontend '{frontend_name}' not found."
+    backend = cfg.backend_for(frontend)
+    if backend is None:
+        return None, f"Could not find backend for frontend '{frontend_name}'."
+    for index, keyword, args in backend.directives():
+        if keyword == "server" and len(args) > 1:
+            return (backend, index, args), None
+    return None, f"Backend '{backend.name}' has no server."
+
+def _sharing(cfg, backend, frontend_name):
+    """Names of the other tunnels that forward through ``backend``."""
+    return [frontend.name for frontend in cfg.frontends_using(backend.name) if frontend.name != frontend_name]
 
+def set_tunnel_destination(frontend_name, main_server_ip, main_server_port):
+    """Points an existing tunnel at a new destination without dropping other tunnels.
+
+    The change is written to haproxy.cfg for persistence and applied live over
+    the runtime socket; if the socket is unavailable HAProxy is reloaded. A
+    tunnel that shares its backend with others first gets a backend of its own
+    (``pool-<frontend>``), which takes a reload.
+    """
+    result = ActionResult()
     try:
-        with open(HAPROXY_CONFIG_PATH, 'w') as f:
-            f.writelines(new_lines)
-        _run_command(["sudo", "systemctl", "restart", "haproxy"])
-        print("Frontend and backend removed successfully.")
+        cfg = _load_config()
     except IOError as e:
-        print(f"Error writing to config file: {e}", file=sys.stderr)
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+
+    found, error = _tunnel_server(cfg, frontend_name)
+    if error:
+        return result.fail(error)
+    backend, index, args = found
+    split = bool(_sharing(cfg, backend, frontend_name))
+    if split:
+        backend, _ = cfg.pool_for(cfg.frontends[frontend_name])
+        result.step(f"Moved tunnel '{frontend_name}' to its own backend '{backend.name}'.")
+        (backend, index, args), _ = _tunnel_server(cfg, frontend_name)
+    server_name = args[0]
+    line = backend.lines[index]
+    end = line.index(server_name, line.index("server") + len("server")) + len(server_name)
+    backend.set_line(index, line[:end] + line[end:].replace(args[1], f"{main_server_ip}:{main_server_port}", 1))
+    cfg.mark_changed(backend)
+
+    try:
+        _write_config(cfg)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+
+    # A backend that was just split off does not exist in the running process yet.
+    applied = False
+    if not split:
+        try:
+            RuntimeClient().set_server_address(backend.name, server_name, main_server_ip, main_server_port)
+            result.step(f"Applied {backend.name}/{server_name} -> {main_server_ip}:{main_server_port} over the runtime API.")
+            applied = True
+        except HAProxyRuntimeError as e:
+            result.warn(str(e))
+    if not applied and not _reload_haproxy(result):
+        return safe_write.rolled_back(result, "HAProxy")
+    return result.ok(f"Tunnel '{frontend_name}' now forwards to {main_server_ip}:{main_server_port}.")
+
+def _tunnel_pool(cfg, frontend_name):
+    """Returns (frontend, pool backend, created) for a tunnel, or raises KeyError with a message."""
+    frontend = cfg.frontends.get(frontend_name)
+    if frontend is None:
+        raise KeyError(f"Frontend '{frontend_name}' not found.")
+    pool, created = cfg.pool_for(frontend)
+    return frontend, pool, created
+
+def _apply_pool_change(result, cfg, frontend_name, live):
+    """Writes the pool change, then applies it with ``live`` (a runtime API call) unless the
+    pool was just created; reloads when that is not possible. Returns False after a rollback."""
+    _write_config(cfg)
+    if live is not None:
+        try:
+            live(RuntimeClient())
+            return True
+        except HAProxyRuntimeError as e:
+            result.warn(str(e))
+    return _reload_haproxy(result)
+
+def add_server(frontend_name, server):
+    """Adds a destination server (ServerSpec) to a tunnel's pool backend.
+
+    Only the pool's lines change; a tunnel still on a shared single-destination
+    backend first gets its own pool. An existing pool is updated over the
+    runtime socket when possible, so no reload is needed.
+    """
+    result = ActionResult()
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    try:
+        _, pool, created = _tunnel_pool(cfg, frontend_name)
+    except KeyError as e:
+        return result.fail(e.args[0])
+    if any(existing['address'] == server.target for existing in cfg.servers(pool)):
+        return result.fail(f"Tunnel '{frontend_name}' already forwards to {server.target}.")
+    if created:
+        result.step(f"Moved tunnel '{frontend_name}' to its own backend '{pool.name}'.")
+    name = cfg.add_server(pool, server)
+    words = server.options(cfg.servers(pool)[-1]['check'])
+
+    def live(client):
+        client.add_server(pool.name, name, server.target, words)
+        result.step(f"Added {pool.name}/{name} -> {server.target} over the runtime API.")
+
+    try:
+        if not _apply_pool_change(result, cfg, frontend_name, None if created else live):
+            return safe_write.rolled_back(result, "HAProxy")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+    return result.ok(f"Tunnel '{frontend_name}' now also forwards to {server.target}" + (" as a backup." if server.backup else "."))
+
+def remove_server(frontend_name, address):
+    """Removes the server forwarding to ``address`` (HOST:PORT) from a tunnel.
+
+    The last regular (non-backup) server cannot be removed; remove the tunnel instead.
+    Live removal drains the server first, so its open sessions can finish (see
+    RuntimeClient.delete_server).
+    """
+    result = ActionResult()
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    frontend = cfg.frontends.get(frontend_name)
+    backend = cfg.backend_for(frontend) if frontend is not None else None
+    if backend is None:
+        return result.fail(f"Frontend '{frontend_name}' not found." if frontend is None
+                           else f"Could not find backend for frontend '{frontend_name}'.")
+    servers = cfg.servers(backend)
+    if not any(server['address'] == address for server in servers):
+        return result.fail(f"Tunnel '{frontend_name}' has no server {address}.")
+    if not any(not server['backup'] and server['address'] != address for server in servers):
+        return result.fail(f"{address} is the last regular server of '{frontend_name}'; remove the tunnel instead.")
+    pool, created = cfg.pool_for(frontend)
+    name = cfg.remove_server(pool, address)
+
+    def live(client):
+        cut = client.delete_server(pool.name, name)
+        if cut:
+            result.warn(f"{cut} session(s) on {pool.name}/{name} were still open after draining and were closed.")
+        result.step(f"Drained and deleted {pool.name}/{name} over the runtime API.")
+
+    try:
+        if not _apply_pool_change(result, cfg, frontend_name, None if created else live):
+            return safe_write.rolled_back(result, "HAProxy")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+    return result.ok(f"Tunnel '{frontend_name}' no longer forwards to {address}.")
+
+def set_balance(frontend_name, balance=None, check_inter=None):
+    """Sets a tunnel's ``balance`` algorithm and/or health check interval ("off" removes the checks).
+
+    Both are backend settings, so the tunnel gets its own pool first and HAProxy is reloaded.
+    """
+    result = ActionResult()
+    if balance is None and check_inter is None:
+        return result.fail("Nothing to change: give a balance algorithm or a check interval.")
+    try:
+        cfg = _load_config()
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    try:
+        _, pool, created = _tunnel_pool(cfg, frontend_name)
+    except KeyError as e:
+        return result.fail(e.args[0])
+    if created:
+        result.step(f"Moved tunnel '{frontend_name}' to its own backend '{pool.name}'.")
+    changes = []
+    if balance is not None:
+        cfg.set_balance(pool, balance)
+        changes.append(f"balance {balance}")
+    if check_inter is not None:
+        cfg.set_check(pool, None if check_inter == "off" else check_inter)
+        changes.append("no health checks" if check_inter == "off" else f"health checks every {check_inter}")
+    try:
+        if not _apply_pool_change(result, cfg, frontend_name, None):
+            return safe_write.rolled_back(result, "HAProxy")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Error writing to config file: {e}")
+    return result.ok(f"Tunnel '{frontend_name}': {', '.join(changes)}.")
+
+def set_server_state(frontend_name, state):
+    """Sets a tunnel's server to ready, drain or maint over the runtime socket.
+
+    Runtime-only: a later reload restores the state written in haproxy.cfg.
+    Refused when other tunnels share the backend, since they would change too.
+    """
+    result = ActionResult()
+    try:
+        cfg = haproxy_config.load(HAPROXY_CONFIG_PATH)
+    except IOError as e:
+        return result.fail(f"Could not read {HAPROXY_CONFIG_PATH}: {e}")
+    found, error = _tunnel_server(cfg, frontend_name)
+    if error:
+        return result.fail(error)
+    backend, _, args = found
+    shared = _sharing(cfg, backend, frontend_name)
+    if shared:
+        return result.fail(
+            f"Backend '{backend.name}' also serves {', '.join(shared)}; setting its server to {state} would affect "
+            f"those tunnels too. Give '{frontend_name}' its own backend first (set-balance does that)."
+        )
+    try:
+        RuntimeClient().set_server_state(backend.name, args[0], state)
+    except (HAProxyRuntimeError, ValueError) as e:
+        return result.fail(str(e))
+    return result.ok(f"Server {backend.name}/{args[0]} set to {state}.")
 
 def uninstall_haproxy():
-    print("Uninstalling HAProxy...")
+    result = ActionResult()
+    result.step("Uninstalling HAProxy...")
     try:
         package_manager = get_system_info()['package_manager']
-        _run_command(["sudo", "systemctl", "disable", "--now", "haproxy"], capture_output=True)
-        _run_command(["sudo", package_manager, "purge", "haproxy", "-y"], capture_output=True)
+        run_command(["sudo", "systemctl", "disable", "--now", "haproxy"], result)
+        run_command(["sudo", package_manager, "purge", "haproxy", "-y"], result)
         if os.path.exists(HAPROXY_CONFIG_PATH):
             os.remove(HAPROXY_CONFIG_PATH)
-        print("HAProxy has been uninstalled.")
+        return result.ok("HAProxy has been uninstalled.")
     except (OSError, KeyError) as e:
-        print(f"An error occurred during uninstallation: {e}", file=sys.stderr)
+        return result.fail(f"An error occurred during uninstallation: {e}")
@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+
+"""Structured model of haproxy.cfg.
+
+The file is parsed once into a list of sections (``global``, ``defaults``,
+``frontend``, ``backend``, ...) that keep their original text and line span,
+plus indexes by frontend name, bind port and backend name. Unchanged sections
+are written back verbatim; when a change only appends sections the file is
+appended to instead of rewritten. Parsed files are cached on (mtime, size).
+
+A tunnel with one destination uses a backend named after that destination,
+shared by every frontend that forwards there. Once a tunnel gets more servers,
+a ``balance`` algorithm or health checks, it moves to a backend of its own,
+``pool-<frontend>``. Servers are then added and removed by editing lines of
+that backend alone.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .safe_write import Validator, write_file
+
+SECTION_KEYWORDS = frozenset({
+    "global",
+    "defaults",
+    "frontend",
+    "backend",
+    "listen",
+    "peers",
+    "resolvers",
+    "userlist",
+    "program",
+    "mailers",
+    "cache",
+    "ring",
+    "http-errors",
+})
+
+
+_SECTION_HEADER = re.compile(
+    r"^[ \t]*(%s)(?=[ \t#\n])[ \t]*([^\s#]+)?.*\n" % "|".join(
+        re.escape(keyword) for keyword in sorted(SECTION_KEYWORDS, key=len, reverse=True)),
+    re.MULTILINE,
+)
+
+BALANCE_ALGORITHMS = ("roundrobin", "static-rr", "leastconn", "first", "source")
+POOL_PREFIX = "pool-"
+PRIMARY_SERVER = "target_server"
+
+_INTERVAL = re.compile(r"^\d+(us|ms|s|m|h|d)?$")
+
+
+def check_interval(value: str) -> str:
+    """Validate an HAProxy time value for ``check inter`` (``2s``, ``500ms``, ``2000``)."""
+    value = value.strip()
+    if not _INTERVAL.match(value) or int(re.match(r"\d+", value).group()) == 0:
+        raise ValueError(f"Invalid check interval {value!r}; use e.g. 2s or 500ms.")
+    return value
+
+
+def balance_algorithm(value: str) -> str:
+    value = value.strip().lower()
+    if value not in BALANCE_ALGORITHMS:
+        raise ValueError(f"Unknown balance algorithm {value!r}; choose one of {', '.join(BALANCE_ALGORITHMS)}.")
+    return value
+
+
+@dataclass(frozen=True)
+class ServerSpec:
+    """One destination of a tunnel, written as ``HOST:PORT[,weight=N][,backup]``."""
+
+    address: str
+    port: int
+    weight: Optional[int] = None
+    backup: bool = False
+
+    @classmethod
+    def parse(cls, text: str) -> "ServerSpec":
+        target, *flags = [part.strip() for part in text.strip().split(",")]
+        address, sep, port = target.rpartition(":")
+        if not sep or not address or not port.isdigit() or not 0 < int(port) < 65536:
+            raise ValueError(f"Invalid server {text!r}; expected HOST:PORT[,weight=N][,backup].")
+        weight, backup = None, False
+        for flag in flags:
+            key, _, value = flag.partition("=")
+            if key == "backup" and not value:
+                backup = True
+            elif key == "weight" and value.isdigit() and int(value) <= 256:
+                weight = int(value)
+            else:
+                raise ValueError(f"Invalid server option {flag!r} in {text!r}; use weight=0..256 or backup.")
+        return cls(address.strip("[]"), int(port), weight, backup)
+
+    @property
+    def target(self) -> str:
+        return f"{self.address}:{self.port}"
+
+    def options(self, check_inter: Optional[str] = None) -> List[str]:
+        words: List[str] = []
+        if self.weight is not None:
+            words += ["weight", str(self.weight)]
+        if check_inter:
+            words += ["check", "inter", check_inter]
+        if self.backup:
+            words.append("backup")
+        return words
+
+
+def parse_servers(text: str) -> List[ServerSpec]:
+    """Parse whitespace- or newline-separated server specs (see :class:`ServerSpec`)."""
+    return [ServerSpec.parse(part) for part in text.split()]
+
+
+def server_info(args: List[str]) -> Dict[str, Any]:
+    """Describe a ``server`` directive's arguments as the tunnel listing reports them."""
+    info: Dict[str, Any] = {"name": args[0], "address": args[1] if len(args) > 1 else "N/A",
+                            "weight": None, "backup": "backup" in args[2:], "check": None}
+    for index, word in enumerate(args[2:-1], start=2):
+        if word == "weight" and args[index + 1].isdigit():
+            info["weight"] = int(args[index + 1])
+    if "check" in args[2:]:
+        info["check"] = "2s"
+        if "inter" in args[2:-1]:
+            info["check"] = args[args.index("inter", 2) + 1]
+    return info
+
+
+def _tokens(line: str) -> List[str]:
+    """Split a config line into words, dropping comments."""
+    if "#" in line:
+        line = line[:line.index("#")]
+    return line.split()
+
+
+def bind_ports(args: List[str]) -> List[int]:
+    """Return the ports of a ``bind`` line's address list (``:::80``, ``*:80,*:81-82``)."""
+    if not args:
+        return []
+    ports: List[int] = []
+    for address in args[0].split(","):
+        _, sep, port = address.rpartition(":")
+        if not sep:
+            continue
+        low, _, high = port.partition("-")
+        if not low.isdigit():
+            continue
+        if high.isdigit():
+            ports.extend(range(int(low), int(high) + 1))
+        else:
+            ports.append(int(low))
+    return ports
+
+
+@dataclass(eq=False)
+class Section:
+    """One section of the file: its header line plus every following line up to
+    the next section header (directives, comments and trailing blank lines)."""
+
+    kind: str
+    name: Optional[str]
+    lines: List[str]
+    start: int = -1
+    end: int = -1
+    dirty: bool = False
+    ports: List[int] = field(default_factory=list)
+    _parsed: Optional[List[Tuple[int, str, List[str]]]] = field(default=None, repr=False)
+
+    def directives(self) -> List[Tuple[int, str, List[str]]]:
+        """Return ``(line index, keyword, args)`` for every directive in the body."""
+        if self._parsed is None:
+            parsed = []
+            for index in range(1, len(self.lines)):
+                words = _tokens(self.lines[index])
+                if words:
+                    parsed.append((index, words[0], words[1:]))
+            self._parsed = parsed
+        return self._parsed
+
+    def get(self, keyword: str) -> Optional[List[str]]:
+        """Return the arguments of the first ``keyword`` directive, if any."""
+        for _, word, args in self.directives():
+            if word == keyword:
+                return args
+        return None
+
+    def get_all(self, keyword: str) -> List[List[str]]:
+        return [args for _, word, args in self.directives() if word == keyword]
+
+    def set_line(self, index: int, text: str) -> None:
+        self.lines[index] = text if text.endswith("\n") else f"{text}\n"
+        self._touch()
+
+    def insert_line(self, index: int, text: str) -> None:
+        self.lines.insert(index, text if text.endswith("\n") else f"{text}\n")
+        self._touch()
+
+    def delete_line(self, index: int) -> None:
+        del self.lines[index]
+        self._touch()
+
+    def _touch(self) -> None:
+        self.dirty = True
+        self._parsed = None
+
+    def body_end(self) -> int:
+        """Index just past the last non-blank line, where new directives go."""
+        index = len(self.lines)
+        while index > 1 and not self.lines[index - 1].strip():
+            index -= 1
+        return index
+
+    def text(self) -> str:
+        return "".join(self.lines)
+
+
+class HAProxyConfig:
+    """Parsed haproxy.cfg with frontend/backend/port indexes."""
+
+    def __init__(self, preamble: List[str], sections: List[Section]):
+        self.preamble = preamble
+        self.sections = sections
+        self.frontends: Dict[str, Section] = {}
+        self.backends: Dict[str, Section] = {}
+        self.ports: Dict[int, Section] = {}
+        self._appended: List[Section] = []
+        self._rewrite = False
+        self._tunnels: Optional[List[Dict[str, Any]]] = None
+        self._reindex()
+
+    # --- parsing ---
+    @classmethod
+    def parse(cls, text: str) -> "HAProxyConfig":
+        if text and not text.endswith("\n"):
+            text += "\n"
+        headers = list(_SECTION_HEADER.finditer(text))
+        first = headers[0].start() if headers else len(text)
+        preamble = text[:first].splitlines(keepends=True)
+        sections: List[Section] = []
+        line_number = len(preamble)
+        for index, match in enumerate(headers):
+            stop = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+            lines = text[match.start():stop].splitlines(keepends=True)
+            sections.append(Section(match.group(1), match.group(2), lines,
+                                    start=line_number, end=line_number + len(lines)))
+            line_number += len(lines)
+        return cls(preamble, sections)
+
+    @classmethod
+    def from_file(cls, path: str) -> "HAProxyConfig":
+        with open(path, "r") as f:
+            return cls.parse(f.read())
+
+    def _reindex(self) -> None:
+        self._tunnels = None
+        self.frontends = {}
+        self.backends = {}
+        self.ports = {}
+        for section in self.sections:
+            self._index(section)
+
+    def _index(self, section: Section) -> None:
+        self._tunnels = None
+        if section.kind == "frontend" and section.name:
+            self.frontends[section.name] = section
+            section.ports = [port for args in section.get_all("bind") for port in bind_ports(args)]
+            for port in section.ports:
+                self.ports.setdefault(port, section)
+        elif section.kind == "backend" and section.name:
+            self.backends[section.name] = section
+
+    # --- queries ---
+    def frontend_for_port(self, port: int) -> Optional[Section]:
+        return self.ports.get(int(port))
+
+    def backend_for(self, frontend: Section) -> Optional[Section]:
+        args = frontend.get("default_backend") or frontend.get("use_backend")
+        return self.backends.get(args[0]) if args else None
+
+    def frontends_using(self, backend_name: str) -> List[Section]:
+        return [
+            section for section in self.frontends.values()
+            if (section.get("default_backend") or [None])[0] == backend_name
+        ]
+
+    def tunnels(self) -> List[Dict[str, Any]]:
+        """Return one entry per frontend in file order, as ``list_tunnels`` does."""
+        if self._tunnels is not None:
+            return list(self._tunnels)
+        tunnels_data = [self._tunnel(fe_name, frontend) for fe_name, frontend in self.frontends.items()]
+        self._tunnels = tunnels_data
+        return list(tunnels_data)
+
+    def tunnel(self, frontend_name: str) -> Optional[Dict[str, Any]]:
+        """Return the ``tunnels()`` entry for one frontend."""
+        frontend = self.frontends.get(frontend_name)
+        return self._tunnel(frontend_name, frontend) if frontend is not None else None
+
+    def servers(self, backend: Section) -> List[Dict[str, Any]]:
+        """The backend's servers in file order (see :func:`server_info`)."""
+        return [server_info(args) for args in backend.get_all("server") if args]
+
+    def _tunnel(self, fe_name: str, frontend: Section) -> Dict[str, Any]:
+        ports = frontend.ports
+        backend_args = frontend.get("default_backend")
+        be_name = backend_args[0] if backend_args else "N/A"
+        destination = "N/A"
+        balance = None
+        servers: List[Dict[str, Any]] = []
+        backend = self.backends.get(be_name)
+        if backend is not None:
+            servers = self.servers(backend)
+            if servers:
+                destination = servers[0]["address"]
+            balance_args = backend.get("balance")
+            balance = balance_args[0] if balance_args else None
+        return {
+            'frontend': fe_name,
+            'port': str(ports[0]) if ports else "N/A",
+            'backend': be_name,
+            'destination': destination,
+            'balance': balance,
+            'servers': servers,
+        }
+
+    # --- mutation ---
+    def add_section(self, kind: str, name: str, directives: List[str]) -> Section:
+        """Append a new section with the given (unindented) directive lines."""
+        lines = [f"{kind} {name}\n"] + [f"    {directive}\n" for directive in directives]
+        if self.sections and self.sections[-1].lines[-1].strip():
+            # Keep a blank line between sections.
+            self.sections[-1].lines.append("\n")
+            if self.sections[-1] not in self._appended:
+                self.sections[-1].dirty = True
+        section = Section(kind, name, lines, dirty=True)
+        self.sections.append(section)
+        self._appended.append(section)
+        self._index(section)
+        return section
+
+    def remove_section(self, section: Section) -> None:
+        self.sections.remove(section)
+        if section in self._appended:
+            self._appended.remove(section)
+        else:
+            self._rewrite = True
+        self._unindex(section)
+
+    def _unindex(self, section: Section) -> None:
+        self._tunnels = None
+        if section.kind == "frontend" and self.frontends.get(section.name) is section:
+            del self.frontends[section.name]
+            for port in section.ports:
+                if self.ports.get(port) is section:
+                    del self.ports[port]
+        elif section.kind == "backend" and self.backends.get(section.name) is section:
+            del self.backends[section.name]
+
+    def mark_changed(self, section: Section) -> None:
+        """Record an in-place edit of ``section`` and refresh the indexes."""
+        section.dirty = True
+        if section not in self._appended:
+            self._rewrite = True
+        self._unindex(section)
+        self._index(section)
+
+    def add_tunnel(self, relay_port: int, server_address: str, server_port: int,
+                   extra_servers: Iterable[ServerSpec] = (), balance: Optional[str] = None,
+                   check_inter: Optional[str] = None) -> Tuple[Section, Section]:
+        """Add the frontend/backend pair Shifter uses for one tunnel.
+
+        A plain single-destination tunnel reuses an existing backend for the
+        same destination rather than duplicating it. With ``extra_servers``,
+        ``balance`` or ``check_inter`` the tunnel gets its own pool backend.
+        """
+        extra_servers = list(extra_servers)
+        frontend_name = f"tunnel-{relay_port}"
+        pooled = bool(extra_servers or balance or check_inter)
+        backend_name = f"{POOL_PREFIX}{frontend_name}" if pooled else f"tunnel-{server_address}-{server_port}"
+        backend = None if pooled else self.backends.get(backend_name)
+        frontend = self.add_section("frontend", frontend_name, [
+            f"bind :::{relay_port} v4v6",
+            "mode tcp",
+            f"default_backend {backend_name}",
+        ])
+        if backend is None:
+            primary = ServerSpec(server_address, int(server_port))
+            names = [PRIMARY_SERVER] + [f"{PRIMARY_SERVER}_{n}" for n in range(2, len(extra_servers) + 2)]
+            backend = self.add_section("backend", backend_name, [
+                "mode tcp",
+                *([f"balance {balance}"] if balance else []),
+                *(_server_line(name, spec, check_inter) for name, spec in zip(names, [primary, *extra_servers])),
+            ])
+        return frontend, backend
+
+    def pool_for(self, frontend: Section) -> Tuple[Section, bool]:
+        """Return the backend only ``frontend`` uses, creating ``pool-<frontend>`` if needed.
+
+        The second value is True when the pool was created now, which is a
+        structural change (a reload, not a runtime update). A new pool starts
+        as a copy of the old backend, and the old backend is dropped if no
+        other frontend uses it.
+        """
+        backend = self.backend_for(frontend)
+        pool_name = f"{POOL_PREFIX}{frontend.name}"
+        if backend is not None and backend.name == pool_name:
+            return backend, False
+        body = backend.lines[1:backend.body_end()] if backend is not None else ["    mode tcp\n"]
+        pool = self.add_section("backend", pool_name, [])
+        pool.lines.extend(body)
+        pool._touch()
+        for index, keyword, _ in frontend.directives():
+            if keyword in ("default_backend", "use_backend"):
+                frontend.set_line(index, f"    default_backend {pool_name}")
+                break
+        else:
+            frontend.insert_line(frontend.body_end(), f"    default_backend {pool_name}")
+        self.mark_changed(frontend)
+        if backend is not None and not self.frontends_using(backend.name):
+            self.remove_section(backend)
+        return pool, True
+
+    def add_server(self, backend: Section, spec: ServerSpec, check_inter: Optional[str] = None) -> str:
+        """Append a server line to ``backend`` and return its name.
+
+        Without ``check_inter`` the server gets the same health check as the
+        backend's existing servers.
+        """
+        servers = self.servers(backend)
+        if check_inter is None:
+            check_inter = next((server["check"] for server in servers if server["check"]), None)
+        taken = {server["name"] for server in servers}
+        name = PRIMARY_SERVER if PRIMARY_SERVER not in taken else next(
+            f"{PRIMARY_SERVER}_{n}" for n in range(2, len(taken) + 3) if f"{PRIMARY_SERVER}_{n}" not in taken
+        )
+        lines = [index for index, keyword, _ in backend.directives() if keyword == "server"]
+        backend.insert_line(lines[-1] + 1 if lines else backend.body_end(), "    " + _server_line(name, spec, check_inter))
+        self.mark_changed(backend)
+        return name
+
+    def remove_server(self, backend: Section, address: str) -> Optional[str]:
+        """Delete the server forwarding to ``address`` and return its name (None if absent)."""
+        for index, keyword, args in backend.directives():
+            if keyword == "server" and len(args) > 1 and args[1] == address:
+                backend.delete_line(index)
+                self.mark_changed(backend)
+                return args[0]
+        return None
+
+    def set_balance(self, backend: Section, algorithm: str) -> None:
+        """Set (or replace) the backend's ``balance`` line."""
+        directives = backend.directives()
+        for index, keyword, _ in directives:
+            if keyword == "balance":
+                backend.set_line(index, f"    balance {algorithm}")
+                break
+        else:
+            after = next((index for index, keyword, _ in directives if keyword == "mode"), 0)
+            backend.insert_line(after + 1, f"    balance {algorithm}")
+        self.mark_changed(backend)
+
+    def set_check(self, backend: Section, check_inter: Optional[str]) -> None:
+        """Give every server a ``check inter`` of ``check_inter``, or no health check when None."""
+        for index, keyword, args in list(backend.directives()):
+            if keyword != "server" or len(args) < 2:
+                continue
+            options, skip = [], False
+            for position, word in enumerate(args[2:], start=2):
+                if skip:
+                    skip = False
+                elif word == "check":
+                    continue
+                elif word == "inter" and position + 1 < len(args):
+                    skip = True
+                else:
+                    options.append(word)
+            if check_inter:
+                options += ["check", "inter", check_inter]
+            backend.set_line(index, "    " + " ".join(["server", args[0], args[1], *options]))
+        self.mark_changed(backend)
+
+    # --- serialisation ---
+    def render(self) -> str:
+        return "".join(self.preamble) + "".join(section.text() for section in self.sections)
+
+    def write(self, path: str, validate: Optional[Validator] = None) -> None:
+        """Persist the changes atomically (see services.safe_write).
+
+        When nothing before the new sections changed, the existing file text is
+        reused and only the new sections are rendered.
+        """
+        if not self._rewrite and self._appended and os.path.exists(path):
+            # The only possible edit to an existing section here is the blank
+            # separator line add_section() put after the old last section.
+            separator = any(s.dirty for s in self.sections if s not in self._appended)
+            with open(path, "r") as f:
+                existing = f.read()
+            write_file(path, existing + ("\n" if separator else "") + "".join(s.text() for s in self._appended), validate)
+        elif self._rewrite or self._appended:
+            write_file(path, self.render(), validate)
+        for section in self.sections:
+            section.dirty = False
+        self._appended = []
+        self._rewrite = False
+        _remember(path, self)
+
+
+def _server_line(name: str, spec: ServerSpec, check_inter: Optional[str]) -> str:
+    return " ".join(["server", name, spec.target, *spec.options(check_inter)])
+
+
+# --- mtime/size keyed cache ---
+_cache: Dict[str, Tuple[Tuple[int, int], HAProxyConfig]] = {}
+
+
+def _signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _remember(path: str, config: HAProxyConfig) -> None:
+    try:
+        _cache[path] = (_signature(path), config)
+    except OSError:
+        _cache.pop(path, None)
+
+
+def load(path: str) -> HAProxyConfig:
+    """Return the parsed config, reusing the cached parse while the file is unchanged.
+
+    The returned object is shared: use :meth:`HAProxyConfig.from_file` for a
+    private copy before mutating it.
+    """
+    signature = _signature(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    config = HAProxyConfig.from_file(path)
+    _cache[path] = (signature, config)
+    return config
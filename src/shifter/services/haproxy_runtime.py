@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Client for the HAProxy Runtime API (the admin-level ``stats socket``).
+
+Server address, port and state changes applied here take effect inside the
+running process, so existing connections on other tunnels are untouched. So do
+servers added to or deleted from an existing backend (HAProxy 2.4+ "dynamic
+servers"). Structural changes (new or removed frontends/backends, a new
+``balance``) still need a reload.
+"""
+
+from __future__ import annotations
+
+import csv
+import socket
+import time
+from typing import Dict, List, Optional, Sequence
+
+from .config import HAPROXY_RUNTIME_SOCKET
+
+# Leading words HAProxy uses when it rejects a runtime command.
+_ERROR_PREFIXES = (
+    "No such",
+    "Require",
+    "Permission denied",
+    "Unknown command",
+    "Invalid",
+    "Can't",
+    "Cannot",
+    "unable",
+    "Missing",
+)
+
+SERVER_STATES = ("ready", "drain", "maint")
+# How long delete_server lets a drained server's sessions finish before cutting them.
+DRAIN_TIMEOUT = 30.0
+DRAIN_POLL_INTERVAL = 0.5
+# ``show stat`` type filter: 1 frontends, 2 backends, 4 servers.
+_STAT_SERVERS = 4
+
+
+class HAProxyRuntimeError(RuntimeError):
+    """Raised when the runtime socket is unreachable or rejects a command."""
+
+
+class RuntimeClient:
+    """Send commands to HAProxy's runtime socket, one connection per command."""
+
+    def __init__(self, socket_path: str = HAPROXY_RUNTIME_SOCKET, timeout: float = 2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def execute(self, command: str) -> str:
+        """Run one runtime command and return HAProxy's raw response."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(f"{command}\n".encode())
+                chunks = []
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+        except OSError as e:
+            raise HAProxyRuntimeError(f"Runtime socket {self.socket_path} unavailable: {e}") from e
+        return b"".join(chunks).decode(errors="replace")
+
+    def _checked(self, command: str) -> str:
+        response = self.execute(command).strip()
+        if response.startswith(_ERROR_PREFIXES):
+            raise HAProxyRuntimeError(f"HAProxy rejected '{command}': {response}")
+        return response
+
+    def is_available(self) -> bool:
+        try:
+            self.execute("show info")
+        except HAProxyRuntimeError:
+            return False
+        return True
+
+    # --- server management ---
+    def set_server_address(self, backend: str, server: str, address: str, port: Optional[int] = None) -> str:
+        command = f"set server {backend}/{server} addr {address}"
+        if port is not None:
+            command += f" port {port}"
+        return self._checked(command)
+
+    def set_server_state(self, backend: str, server: str, state: str) -> str:
+        if state not in SERVER_STATES:
+            raise ValueError(f"Unsupported server state: {state}")
+        return self._checked(f"set server {backend}/{server} state {state}")
+
+    def enable_server(self, backend: str, server: str) -> str:
+        return self.set_server_state(backend, server, "ready")
+
+    def disable_server(self, backend: str, server: str) -> str:
+        return self.set_server_state(backend, server, "maint")
+
+    def drain_server(self, backend: str, server: str) -> str:
+        return self.set_server_state(backend, server, "drain")
+
+    def add_server(self, backend: str, server: str, address: str, options: Sequence[str] = ()) -> None:
+        """Create a server in a running backend and put it in service.
+
+        Dynamic servers start in maintenance, and their health check has to
+        be enabled separately.
+        """
+        self._checked(" ".join([f"add server {backend}/{server} {address}", *options]))
+        if "check" in options:
+            self._checked(f"enable health {backend}/{server}")
+        self.enable_server(backend, server)
+
+    def current_sessions(self, backend: str, server: str) -> int:
+        """The server's open sessions (``scur`` in ``show stat``)."""
+        for row in self.show_stat(backend, _STAT_SERVERS):
+            if row.get("pxname") == backend and row.get("svname") == server:
+                value = row.get("scur") or "0"
+                return int(value) if value.isdigit() else 0
+        raise HAProxyRuntimeError(f"Server {backend}/{server} not found in 'show stat'.")
+
+    def delete_server(self, backend: str, server: str, drain_timeout: float = DRAIN_TIMEOUT,
+                      poll_interval: float = DRAIN_POLL_INTERVAL) -> int:
+        """Drain a server, let its sessions finish, then delete it.
+
+        The server stops taking new connections at once. Its open sessions get
+        up to ``drain_timeout`` seconds; only those still open then are shut
+        down. Returns the number of sessions that were cut.
+        """
+        self.drain_server(backend, server)
+        deadline = time.monotonic() + drain_timeout
+        remaining = self.current_sessions(backend, server)
+        while remaining and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            remaining = self.current_sessions(backend, server)
+        # "del server" only accepts a server in maintenance without sessions.
+        self.disable_server(backend, server)
+        if remaining:
+            self._checked(f"shutdown sessions server {backend}/{server}")
+        self._checked(f"del server {backend}/{server}")
+        return remaining
+
+    # --- introspection ---
+    def show_stat(self, proxy: Optional[str] = None, types: int = -1) -> List[Dict[str, str]]:
+        """Return ``show stat`` as one dict per proxy/server row, optionally for one proxy
+        and a type mask (1 frontends, 2 backends, 4 servers)."""
+        response = self.execute(f"show stat {proxy} {types} -1" if proxy else "show stat")
+        lines = [line for line in response.splitlines() if line.strip()]
+        if not lines or not lines[0].startswith("# "):
+            raise HAProxyRuntimeError(f"Unexpected 'show stat' response: {response[:200]}")
+        lines[0] = lines[0][2:]
+        return [dict(row) for row in csv.DictReader(lines)]
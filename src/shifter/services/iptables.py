@@ -2,119 +2,141 @@
 
 import os
 import subprocess
-import re
-import sys
-from .system_info import get_system_info
+from .system_info import get_persistence_info, get_system_info
+from . import iptables_nat, iptables_rules, systemd
 from .config import IPTABLES_RULES_PATH, IPTABLES_DIR
-
-def _run_command(command, **kwargs):
-    try:
-        if 'input' in kwargs:
-            kwargs['text'] = True
-        return subprocess.run(command, check=True, **kwargs)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error executing command: {' '.join(command)}\n{e}", file=sys.stderr)
-        return None
-
-def _get_iptables_persistence_info():
-    """Returns the correct persistence package and service name based on the OS."""
-    info = get_system_info()
-    if info['package_manager'] == 'apt':
-        return {'package': 'iptables-persistent', 'service': 'netfilter-persistent'}
-    elif info['package_manager'] in ['dnf', 'yum']:
-        return {'package': 'iptables-services', 'service': 'iptables'}
-    else:
-        return {'package': 'iptables-persistent', 'service': 'iptables'}
+from .commands import run_command
+from .ports import check_ports, describe, expand_tokens
+from .results import ActionResult
 
 def install_iptables(main_server_ip, ports):
+    result = ActionResult()
+    try:
+        tokens = iptables_rules.parse_ports(ports)
+    except ValueError as e:
+        return result.fail(f"Invalid ports: {e}")
+    conflicts = check_ports(expand_tokens(tokens), "iptables")
+    if conflicts:
+        return result.fail(describe(conflicts))
     try:
         sys_info = get_system_info()
         package_manager = sys_info['package_manager']
-        persistence = _get_iptables_persistence_info()
+        persistence = get_persistence_info()
 
-        print(f"Installing iptables and persistence package ({persistence['package']})...")
+        result.step(f"Installing iptables and persistence package ({persistence['package']})...")
         if package_manager == 'apt':
-            _run_command(["sudo", "debconf-set-selections"], input="iptables-persistent iptables-persistent/autosave_v4 boolean true")
-            _run_command(["sudo", "debconf-set-selections"], input="iptables-persistent iptables-persistent/autosave_v6 boolean true")
-
-        _run_command(["sudo", package_manager, "install", "iptables", persistence['package'], "-y"], capture_output=True, text=True)
-
-        print("Enabling IP forwarding...")
-        _run_command(["sudo", "sysctl", "net.ipv4.ip_forward=1"], capture_output=True, text=True)
-
-        print("Configuring iptables rules...")
-        rules = [
-            ["sudo", "iptables", "-t", "nat", "-A", "POSTROUTING", "-p", "tcp", "--match", "multiport", "--dports", ports, "-j", "MASQUERADE"],
-            ["sudo", "iptables", "-t", "nat", "-A", "PREROUTING", "-p", "tcp", "--match", "multiport", "--dports", ports, "-j", "DNAT", "--to-destination", main_server_ip],
-            ["sudo", "iptables", "-t", "nat", "-A", "POSTROUTING", "-p", "udp", "--match", "multiport", "--dports", ports, "-j", "MASQUERADE"],
-            ["sudo", "iptables", "-t", "nat", "-A", "PREROUTING", "-p", "udp", "--match", "multiport", "--dports", ports, "-j", "DNAT", "--to-destination", main_server_ip]
-        ]
-        for rule in rules:
-            _run_command(rule, capture_output=True, text=True)
-
-        print("Saving iptables rules...")
-        os.makedirs(IPTABLES_DIR, exist_ok=True)
-        
-        save_result = _run_command(["sudo", "iptables-save"], capture_output=True, text=True)
-        if save_result and save_result.stdout:
-            with open(IPTABLES_RULES_PATH, 'w') as f:
-                f.write(save_result.stdout)
-        
-        print(f"Enabling and starting {persistence['service']} service...")
-        _run_command(["sudo", "systemctl", "enable", "--now", persistence['service']])
-
-        print("IPTables installation and configuration completed.")
-    except (OSError, KeyError, subprocess.CalledProcessError) as e:
-        print(f"An error occurred: {e}", file=sys.stderr)
+            run_command(["sudo", "debconf-set-selections"], result, input="iptables-persistent iptables-persistent/autosave_v4 boolean true")
+            run_command(["sudo", "debconf-set-selections"], result, input="iptables-persistent iptables-persistent/autosave_v6 boolean true")
+
+        run_command(["sudo", package_manager, "install", "iptables", persistence['package'], "-y"], result)
+
+        result.step("Enabling IP forwarding...")
+        run_command(["sudo", "sysctl", "net.ipv4.ip_forward=1"], result)
+
+        result.step("Configuring iptables rules...")
+        rules = _load_rules(result)
+        if rules is None:
+            return result.fail("Could not read the current nat table; no rules were changed.")
+        rules.add(main_server_ip, ports)
+        if not _apply_rules(result, rules):
+            return result.fail("iptables-restore rejected the rules; no rules were changed.")
+
+        _save_rules(result)
+
+        result.step(f"Enabling and starting {persistence['service']} service...")
+        run_command(["sudo", "systemctl", "enable", "--now", persistence['service']], result)
+
+        return result.ok("IPTables installation and configuration completed.")
+    except (OSError, KeyError, ValueError, subprocess.CalledProcessError) as e:
+        return result.fail(f"An error occurred: {e}")
+
+def _load_rules(result):
+    """Reads Shifter's forwarding rules (and any legacy ones) from the live nat table."""
+    save_result = run_command(["sudo", "iptables-save", "-t", "nat"], result)
+    if save_result is None:
+        return None
+    return iptables_rules.NatRules.from_save(save_result.stdout)
+
+def _apply_rules(result, rules):
+    """Swaps the SHIFTER-* chains for ``rules`` in one iptables-restore transaction."""
+    iptables_nat.invalidate()
+    return run_command(["sudo", "iptables-restore", "--noflush"], result, input=rules.restore_payload()) is not None
+
+def _save_rules(result):
+    """Writes the live ruleset to the rules file the persistence service restores at boot."""
+    result.step("Saving iptables rules...")
+    os.makedirs(IPTABLES_DIR, exist_ok=True)
+    save_result = run_command(["sudo", "iptables-save"], result)
+    if save_result and save_result.stdout:
+        with open(IPTABLES_RULES_PATH, 'w') as f:
+            f.write(save_result.stdout)
+
+def load_forwards():
+    """Returns Shifter's forwarding rules read from the live nat table, or None."""
+    return _load_rules(ActionResult())
+
+def apply_forwards(forwards):
+    """Replaces Shifter's forwards with ``forwards`` ({destination: {proto: [port tokens]}})
+    in one iptables-restore transaction (see services.desired). Ports were checked by the caller."""
+    result = ActionResult()
+    rules = _load_rules(result)
+    if rules is None:
+        return result.fail("Could not read the current nat table; no rules were changed.")
+    rules.forwards = {destination: {proto: list(tokens) for proto, tokens in by_proto.items()}
+                      for destination, by_proto in forwards.items()}
+    if not _apply_rules(result, rules):
+        return result.fail("iptables-restore rejected the rules; no rules were changed.")
+    try:
+        _save_rules(result)
+    except OSError as e:
+        result.warn(f"Could not save {IPTABLES_RULES_PATH}: {e}")
+    return result.ok(f"IPTables: {len(rules.ports())} forwarded port token(s) in place.")
 
 def get_iptables_status_details():
-    """Prints a detailed status including service name and configured rules."""
-    persistence = _get_iptables_persistence_info()
-    status_result = subprocess.run(["sudo", "systemctl", "is-active", persistence['service']], capture_output=True, text=True)
-    status = status_result.stdout.strip()
-    print(f"IPTables Persistence Service ({persistence['service']}) Status: {status}")
-
-    save_result = _run_command(["sudo", "iptables-save"], capture_output=True, text=True)
-    if not (save_result and save_result.stdout):
-        print("Could not retrieve iptables rules.")
-        return
-
-    print("\nActive Port Forwarding Rules:")
+    """Reports a detailed status including service name and configured rules."""
+    result = ActionResult()
+    persistence = get_persistence_info()
+    status = systemd.get_unit_statuses([persistence['service']])[persistence['service']]['active']
+    result.step(f"IPTables Persistence Service ({persistence['service']}) Status: {status}")
+
+    table = iptables_nat.load()
+    if table is None:
+        return result.fail("Could not retrieve iptables rules.")
+
+    result.step("")
+    result.step("Active Port Forwarding Rules:")
     found_rules = False
-    for line in save_result.stdout.splitlines():
-        if "-A PREROUTING" in line and "-j DNAT" in line:
-            proto_match = re.search(r"-p\s+(tcp|udp)", line)
-            dports_match = re.search(r"--dports\s+([\d,]+)", line)
-            dest_match = re.search(r"--to-destination\s+([\d\.]+)", line)
-            if proto_match and dports_match and dest_match:
-                found_rules = True
-                protocol, dports, dest_ip = proto_match.groups()
-                for port in dports.split(','):
-                    print(f"  - Port(s) {port} ({protocol.upper()}) -> {dest_ip}")
-    
+    for record in table.forwards():
+        for port in record.port_labels():
+            found_rules = True
+            result.step(f"  - Port(s) {port} ({record.proto.upper()}) -> {record.destination}")
+
     if not found_rules:
-        print("  - No active forwarding rules found.")
+        result.step("  - No active forwarding rules found.")
+    return result
 
 def uninstall_iptables():
-    persistence = _get_iptables_persistence_info()
+    result = ActionResult()
+    persistence = get_persistence_info()
     package_manager = get_system_info()['package_manager']
 
-    print("Flushing all iptables rules...")
+    result.step("Flushing all iptables rules...")
     commands = [["sudo", "iptables", "-F"], ["sudo", "iptables", "-X"], ["sudo", "iptables", "-t", "nat", "-F"], ["sudo", "iptables", "-t", "nat", "-X"]]
     for cmd in commands:
-        _run_command(cmd)
+        run_command(cmd, result)
+    iptables_nat.invalidate()
 
     if os.path.exists(IPTABLES_RULES_PATH):
         try:
-            print(f"Removing {IPTABLES_RULES_PATH}...")
+            result.step(f"Removing {IPTABLES_RULES_PATH}...")
             os.remove(IPTABLES_RULES_PATH)
         except OSError as e:
-            print(f"Error removing rules file: {e}", file=sys.stderr)
+            result.warn(f"Error removing rules file: {e}")
 
-    print(f"Stopping and disabling {persistence['service']} service...")
+    result.step(f"Stopping and disabling {persistence['service']} service...")
     subprocess.run(["sudo", "systemctl", "disable", "--now", persistence['service']], capture_output=True)
-    
-    print(f"Purging persistence package ({persistence['package']})...")
-    _run_command(["sudo", package_manager, "purge", persistence['package'], "-y"])
 
-    print("IPTables rules and persistence have been cleared.")
\ No newline at end of file
+    result.step(f"Purging persistence package ({persistence['package']})...")
+    run_command(["sudo", package_manager, "purge", persistence['package'], "-y"], result)
+
+    return result.ok("IPTables rules and persistence have been cleared.")
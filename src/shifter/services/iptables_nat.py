@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+"""Streaming parser for ``iptables-save -t nat`` with a cached, port-indexed result.
+
+Status checks only need the nat table, so the dump is read line by line from
+the pipe instead of capturing every table into one string. Each ``-A`` rule is
+split into tokens once and kept as a small :class:`NatRecord`; records are
+indexed by destination port, with ranges kept in a separate list.
+
+The parsed table is cached per address family. The cache entry is reused until
+the saved rules file changes (Shifter rewrites it after every change) or
+``CACHE_TTL`` expires, so repeated dashboard loads do not fork at all.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .config import IPTABLES_DIR, IPTABLES_RULES_PATH
+
+CACHE_TTL = 30.0
+
+SAVE_COMMANDS = {
+    "ipv4": ["sudo", "iptables-save", "-t", "nat"],
+    "ipv6": ["sudo", "ip6tables-save", "-t", "nat"],
+}
+RULES_FILES = {
+    "ipv4": IPTABLES_RULES_PATH,
+    "ipv6": os.path.join(IPTABLES_DIR, "rules.v6"),
+}
+
+# Chains whose DNAT rules are port forwards (Shifter's own chain and legacy rules).
+FORWARD_CHAINS = ("PREROUTING", "SHIFTER-PREROUTING")
+
+_FIELDS = {
+    "-p": "proto",
+    "--dport": "ports",
+    "--dports": "ports",
+    "-j": "target",
+    "--to-destination": "destination",
+}
+
+
+class NatRecord(NamedTuple):
+    chain: str
+    proto: str
+    ports: Tuple[Tuple[int, int], ...]
+    target: str
+    destination: str
+
+    def port_labels(self) -> List[str]:
+        return [str(first) if first == last else f"{first}:{last}" for first, last in self.ports]
+
+
+def _parse_ports(value: str) -> Tuple[Tuple[int, int], ...]:
+    ports = []
+    for token in value.split(","):
+        first, _, last = token.partition(":")
+        ports.append((int(first), int(last or first)))
+    return tuple(ports)
+
+
+def parse_rule(line: str) -> Optional[NatRecord]:
+    """Tokenize one ``-A`` line; rules without a port match or target return None."""
+    tokens = line.split()
+    if len(tokens) < 2 or tokens[0] != "-A":
+        return None
+    fields: Dict[str, str] = {}
+    for index in range(2, len(tokens) - 1):
+        name = _FIELDS.get(tokens[index])
+        if name:
+            if name == "ports" and tokens[index - 1] == "!":
+                # A negated port match cannot be expressed as a forward.
+                return None
+            fields[name] = tokens[index + 1]
+    if "ports" not in fields or "target" not in fields:
+        return None
+    try:
+        ports = _parse_ports(fields["ports"])
+    except ValueError:
+        return None
+    return NatRecord(tokens[1], fields.get("proto", ""), ports, fields["target"], fields.get("destination", ""))
+
+
+def split_destination(destination: str) -> Tuple[str, Optional[int]]:
+    """Split ``1.2.3.4:80``, ``[2001:db8::1]:80`` or a bare address into host and port."""
+    if destination.startswith("["):
+        host, _, rest = destination[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else ""
+    elif destination.count(":") == 1:
+        host, _, port = destination.partition(":")
+    else:
+        host, port = destination, ""
+    port = port.split("-")[0]
+    return host, int(port) if port.isdigit() else None
+
+
+class NatTable:
+    """Parsed nat rules plus an index from destination port to records."""
+
+    def __init__(self):
+        self.records: List[NatRecord] = []
+        self.by_port: Dict[int, List[NatRecord]] = defaultdict(list)
+        self.ranges: List[Tuple[int, int, NatRecord]] = []
+
+    @classmethod
+    def parse(cls, lines: Iterable[str]) -> "NatTable":
+        table = cls()
+        in_nat = True
+        for line in lines:
+            if line.startswith("*"):
+                in_nat = line.rstrip() == "*nat"
+                continue
+            # Cheap substring checks skip most rules without tokenizing them.
+            if not in_nat or not line.startswith("-A ") or "dport" not in line:
+                continue
+            record = parse_rule(line.rstrip("\n"))
+            if record:
+                table.add(record)
+        return table
+
+    def add(self, record: NatRecord) -> None:
+        self.records.append(record)
+        for first, last in record.ports:
+            if first == last:
+                self.by_port[first].append(record)
+            else:
+                self.ranges.append((first, last, record))
+
+    def lookup(self, port: int) -> List[NatRecord]:
+        """Return every record matching destination ``port``."""
+        found = list(self.by_port.get(port, ()))
+        found.extend(record for first, last, record in self.ranges if first <= port <= last)
+        return found
+
+    def forwards(self) -> List[NatRecord]:
+        return [r for r in self.records if r.target == "DNAT" and r.chain in FORWARD_CHAINS]
+
+
+def forward_counters(lines: Iterable[str]) -> List[Tuple[str, str, str, int]]:
+    """Return ``(proto, ports, destination, packets)`` per forward in ``iptables-save -c`` output."""
+    forwards = []
+    for line in lines:
+        if not line.startswith("[") or "dport" not in line:
+            continue
+        counters, _, rule = line.partition("] ")
+        record = parse_rule(rule)
+        if record and record.target == "DNAT" and record.chain in FORWARD_CHAINS:
+            packets = int(counters[1:].partition(":")[0])
+            forwards.append((record.proto, ",".join(record.port_labels()), record.destination, packets))
+    return forwards
+
+
+def stream_save(family: str = "ipv4", timeout: float = 5.0) -> Optional[NatTable]:
+    """Run ``*tables-save -t nat`` and parse its output as it arrives."""
+    try:
+        process = subprocess.Popen(
+            SAVE_COMMANDS[family], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+    except OSError:
+        return None
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        table = NatTable.parse(process.stdout)
+        process.stdout.close()
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+    return table if returncode == 0 else None
+
+
+_cache: Dict[str, Tuple[Optional[int], float, NatTable]] = {}
+_cache_lock = threading.Lock()
+
+
+def _signature(family: str) -> Optional[int]:
+    try:
+        return os.stat(RULES_FILES[family]).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load(family: str = "ipv4", timeout: float = 5.0, ttl: float = CACHE_TTL) -> Optional[NatTable]:
+    """Return the parsed nat table, reusing the cached one while it is fresh."""
+    signature = _signature(family)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(family)
+        if cached and cached[0] == signature and cached[1] > now:
+            return cached[2]
+    table = stream_save(family, timeout)
+    if table is not None:
+        with _cache_lock:
+            _cache[family] = (signature, now + ttl, table)
+    return table
+
+
+def invalidate() -> None:
+    """Drop cached tables; call after changing the rules."""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""Shifter-owned nat rules, applied as one ``iptables-restore`` transaction.
+
+Forwarding rules live in two dedicated chains, reached by a single jump from
+the built-in chains::
+
+    -A PREROUTING -j SHIFTER-PREROUTING
+    -A SHIFTER-PREROUTING -p tcp -m multiport --dports 80,443 -j DNAT --to-destination 203.0.113.7
+    -A POSTROUTING -j SHIFTER-POSTROUTING
+    -A SHIFTER-POSTROUTING -p tcp -m multiport --dports 80,443 -j MASQUERADE
+
+An update re-declares both chains in an ``iptables-restore --noflush`` payload,
+which empties and refills them atomically. The rest of the nat table (Docker,
+kube-proxy, hand-written rules) is left untouched, and a failed restore changes
+nothing. Rules written by older releases straight into PREROUTING/POSTROUTING
+are deleted in the same transaction and re-created inside the chains.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PREROUTING_CHAIN = "SHIFTER-PREROUTING"
+POSTROUTING_CHAIN = "SHIFTER-POSTROUTING"
+PROTOCOLS = ("tcp", "udp")
+
+# The multiport match accepts at most 15 ports; a range counts as two.
+MULTIPORT_LIMIT = 15
+
+_RULE = re.compile(
+    r"^-A (?P<chain>\S+)\s+-p (?P<proto>tcp|udp)\s+-m multiport\s+--dports (?P<ports>[\d,:]+)"
+    r"\s+-j (?P<target>DNAT|MASQUERADE)(?:\s+--to-destination (?P<dest>\S+))?\s*$"
+)
+
+
+def parse_ports(ports: str) -> List[str]:
+    """Split a ``80,443,1000:2000`` port list into validated tokens."""
+    tokens = []
+    for token in str(ports).replace(" ", "").split(","):
+        if not token:
+            continue
+        bounds = token.split(":")
+        if len(bounds) > 2 or not all(b.isdigit() and 1 <= int(b) <= 65535 for b in bounds):
+            raise ValueError(f"invalid port: {token!r}")
+        if len(bounds) == 2 and int(bounds[0]) > int(bounds[1]):
+            raise ValueError(f"invalid port range: {token!r}")
+        tokens.append(token)
+    if not tokens:
+        raise ValueError("no ports given")
+    return tokens
+
+
+def chunk_ports(tokens: Sequence[str], limit: int = MULTIPORT_LIMIT) -> List[List[str]]:
+    """Group port tokens into lists that fit one multiport match each."""
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    weight = 0
+    for token in tokens:
+        cost = 2 if ":" in token else 1
+        if current and weight + cost > limit:
+            chunks.append(current)
+            current, weight = [], 0
+        current.append(token)
+        weight += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_rule(line: str) -> Optional[Dict[str, str]]:
+    """Parse an ``iptables-save`` line in the shape Shifter writes, or return None."""
+    match = _RULE.match(line.strip())
+    return match.groupdict() if match else None
+
+
+class NatRules:
+    """The Shifter forwarding rules, keyed by destination, plus what the live
+    table needs to migrate them (legacy rules to delete, missing jumps)."""
+
+    def __init__(self):
+        # destination -> protocol -> ordered port tokens
+        self.forwards: Dict[str, Dict[str, List[str]]] = {}
+        self.legacy_lines: List[str] = []
+        self.jumps: Dict[str, bool] = {"PREROUTING": False, "POSTROUTING": False}
+
+    @classmethod
+    def from_save(cls, save_output: str) -> "NatRules":
+        """Read the current rules from ``iptables-save -t nat`` output."""
+        rules = cls()
+        legacy_masquerade = []
+        in_nat = True
+        for line in save_output.splitlines():
+            line = line.strip()
+            if line.startswith("*"):
+                in_nat = line == "*nat"
+                continue
+            if not in_nat:
+                continue
+            if line == f"-A PREROUTING -j {PREROUTING_CHAIN}":
+                rules.jumps["PREROUTING"] = True
+                continue
+            if line == f"-A POSTROUTING -j {POSTROUTING_CHAIN}":
+                rules.jumps["POSTROUTING"] = True
+                continue
+            rule = parse_rule(line)
+            if not rule:
+                continue
+            if rule["target"] == "DNAT" and rule["chain"] in (PREROUTING_CHAIN, "PREROUTING"):
+                rules.add(rule["dest"], rule["ports"], (rule["proto"],))
+                if rule["chain"] == "PREROUTING":
+                    rules.legacy_lines.append(line)
+            elif rule["target"] == "MASQUERADE" and rule["chain"] == "POSTROUTING":
+                legacy_masquerade.append((rule, line))
+        # Only MASQUERADE rules paired with a legacy DNAT rule are Shifter's.
+        legacy_keys = {(r["proto"], r["ports"]) for r in map(parse_rule, rules.legacy_lines)}
+        rules.legacy_lines.extend(
+            line for rule, line in legacy_masquerade if (rule["proto"], rule["ports"]) in legacy_keys
+        )
+        return rules
+
+    def add(self, destination: str, ports: str, protocols: Sequence[str] = PROTOCOLS) -> None:
+        tokens = parse_ports(ports)
+        by_proto = self.forwards.setdefault(destination, {})
+        for proto in protocols:
+            existing = by_proto.setdefault(proto, [])
+            existing.extend(token for token in tokens if token not in existing)
+
+    def ports(self) -> List[Tuple[str, str, str]]:
+        """Return ``(port, protocol, destination)`` for every forwarded port token."""
+        return [
+            (token, proto, destination)
+            for destination, by_proto in self.forwards.items()
+            for proto, tokens in by_proto.items()
+            for token in tokens
+        ]
+
+    def rule_lines(self) -> List[str]:
+        lines = []
+        for destination, by_proto in self.forwards.items():
+            for proto, tokens in by_proto.items():
+                for chunk in chunk_ports(tokens):
+                    dports = ",".join(chunk)
+                    match = f"-p {proto} -m multiport --dports {dports}"
+                    lines.append(f"-A {PREROUTING_CHAIN} {match} -j DNAT --to-destination {destination}")
+                    lines.append(f"-A {POSTROUTING_CHAIN} {match} -j MASQUERADE")
+        return lines
+
+    def restore_payload(self) -> str:
+        """Build the ``iptables-restore --noflush`` input that installs these rules."""
+        lines = ["*nat", f":{PREROUTING_CHAIN} - [0:0]", f":{POSTROUTING_CHAIN} - [0:0]"]
+        lines.extend("-D" + line[2:] for line in self.legacy_lines)
+        lines.extend(self.rule_lines())
+        if not self.jumps["PREROUTING"]:
+            lines.append(f"-A PREROUTING -j {PREROUTING_CHAIN}")
+        if not self.jumps["POSTROUTING"]:
+            lines.append(f"-A POSTROUTING -j {POSTROUTING_CHAIN}")
+        lines.append("COMMIT")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""Prometheus text exposition of Shifter's services and tunnels.
+
+One collection reads every source once:
+
+- systemd accounting and destination probe results (see services.probes),
+  from the status dict the caller already holds,
+- iptables DNAT rule counters (``iptables-save -c -t nat``),
+- HAProxy ``show stat`` over the runtime socket,
+- Xray StatsService inbound counters.
+
+:class:`MetricsCollector` keeps the last rendered sample and serves it until
+``min_interval`` seconds have passed. Concurrent scrapes wait for the single
+collection in flight instead of starting their own, so scrapers cannot cause
+a burst of subprocesses. A failing source is reported through
+``shifter_metrics_source_up`` and does not fail the scrape.
+"""
+
+from __future__ import annotations
+
+import functools
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import iptables_nat, xray_stats
+from .haproxy_runtime import HAProxyRuntimeError, RuntimeClient
+from .xray_api import XrayAPIError
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_MIN_INTERVAL = 15.0
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Dict[str, Any]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricFamily:
+    """One metric name with its HELP/TYPE lines and labelled samples."""
+
+    def __init__(self, name: str, kind: str, help_text: str):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.samples: List[Tuple[str, Labels, float]] = []
+
+    def add(self, value: Optional[float], suffix: str = "", **labels: Any) -> None:
+        if value is not None:
+            self.samples.append((suffix, labels, value))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """A cumulative histogram per label value, kept across collections."""
+
+    def __init__(self, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List[float]] = {}
+
+    def observe(self, label: str, value: float) -> None:
+        # counts per bucket, then +Inf count and sum
+        series = self._series.setdefault(label, [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def family(self, name: str, help_text: str, label_name: str) -> MetricFamily:
+        family = MetricFamily(name, "histogram", help_text)
+        for label, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                family.add(int(count), "_bucket", **{label_name: label, "le": bound})
+            family.add(int(series[-2]), "_bucket", **{label_name: label, "le": "+Inf"})
+            family.add(int(series[-2]), "_count", **{label_name: label})
+            family.add(series[-1], "_sum", **{label_name: label})
+        return family
+
+
+# --- sources: each returns metric families and raises on failure ---
+
+def service_families(services: Dict[str, Dict[str, Any]]) -> List[MetricFamily]:
+    up = MetricFamily("shifter_service_up", "gauge", "1 when the service unit is active.")
+    enabled = MetricFamily("shifter_service_enabled", "gauge", "1 when the service unit is enabled.")
+    memory = MetricFamily("shifter_service_memory_bytes", "gauge", "Memory used by the unit's cgroup.")
+    cpu = MetricFamily("shifter_service_cpu_seconds_total", "counter", "CPU time used by the unit's cgroup.")
+    restarts = MetricFamily("shifter_service_restarts_total", "counter", "Automatic restarts of the unit.")
+    for name, data in sorted(services.items()):
+        up.add(int(data.get("active") == "active"), service=name)
+        enabled.add(int(data.get("enabled") == "enabled"), service=name)
+        memory.add(data.get("memory_bytes"), service=name)
+        if data.get("cpu_nsec") is not None:
+            cpu.add(data["cpu_nsec"] / 1e9, service=name)
+        restarts.add(data.get("restarts"), service=name)
+    return [up, enabled, memory, cpu, restarts]
+
+
+def probe_families(services: Dict[str, Dict[str, Any]]) -> List[MetricFamily]:
+    latency = MetricFamily(
+        "shifter_tunnel_probe_latency_seconds", "gauge", "Rolling connect latency percentile to a tunnel destination."
+    )
+    failures = MetricFamily(
+        "shifter_tunnel_probe_failure_ratio", "gauge", "Share of recent probes of a tunnel destination that failed."
+    )
+    up = MetricFamily("shifter_tunnel_probe_up", "gauge", "1 when the last probe of a tunnel destination succeeded.")
+    for name, data in sorted(services.items()):
+        for entry in data.get("probes") or []:
+            labels = {"service": name, "tunnel": entry["tunnel"], "destination": entry["destination"], "check": entry["check"]}
+            for key, quantile in (("p50_ms", "0.5"), ("p95_ms", "0.95"), ("p99_ms", "0.99")):
+                value = entry.get(key)
+                latency.add(round(value / 1000, 6) if value is not None else None, quantile=quantile, **labels)
+            failures.add(entry.get("failure_rate"), **labels)
+            if entry.get("last_ok") is not None:
+                up.add(int(entry["last_ok"]), **labels)
+    return [latency, failures, up]
+
+
+def iptables_families(timeout: float) -> List[MetricFamily]:
+    output = subprocess.run(
+        ["sudo", "iptables-save", "-c", "-t", "nat"],
+        capture_output=True, text=True, timeout=timeout, check=True,
+    ).stdout
+    # The nat table only sees the first packet of each connection, so a DNAT
+    # rule's packet counter is the number of connections it forwarded.
+    connections = MetricFamily(
+        "shifter_iptables_forward_connections_total", "counter", "Connections forwarded by a DNAT rule."
+    )
+    for proto, ports, destination, packets in iptables_nat.forward_counters(output.splitlines()):
+        connections.add(packets, proto=proto, ports=ports, destination=destination)
+    return [connections]
+
+
+def haproxy_families(timeout: float) -> List[MetricFamily]:
+    rows = RuntimeClient(timeout=timeout).show_stat()
+    bytes_in = MetricFamily("shifter_haproxy_frontend_bytes_in_total", "counter", "Bytes received by a frontend.")
+    bytes_out = MetricFamily("shifter_haproxy_frontend_bytes_out_total", "counter", "Bytes sent by a frontend.")
+    sessions = MetricFamily("shifter_haproxy_frontend_sessions_total", "counter", "Sessions accepted by a frontend.")
+    current = MetricFamily("shifter_haproxy_frontend_current_sessions", "gauge", "Open sessions on a frontend.")
+    server_up = MetricFamily(
+        "shifter_haproxy_server_up", "gauge", "1 when the backend server is UP, or in service without health checks."
+    )
+
+    def number(row: Dict[str, str], key: str) -> Optional[int]:
+        value = row.get(key) or ""
+        return int(value) if value.isdigit() else None
+
+    for row in rows:
+        proxy, server = row.get("pxname", ""), row.get("svname", "")
+        if server == "FRONTEND":
+            bytes_in.add(number(row, "bin"), frontend=proxy)
+            bytes_out.add(number(row, "bout"), frontend=proxy)
+            sessions.add(number(row, "stot"), frontend=proxy)
+            current.add(number(row, "scur"), frontend=proxy)
+        elif server != "BACKEND":
+            # Single-destination tunnels have no health check; HAProxy reports them as "no check".
+            status = row.get("status", "")
+            server_up.add(int(status.startswith("UP") or status == "no check"), backend=proxy, server=server)
+    return [bytes_in, bytes_out, sessions, current, server_up]
+
+
+def xray_families(timeout: float, state: Optional[Dict[str, Any]] = None) -> List[MetricFamily]:
+    """Inbound byte totals. ``state`` holds the previous sample in memory; the
+    on-disk one belongs to the dashboard and CLI, whose rate window a scrape
+    must not move."""
+    traffic = xray_stats.sample({} if state is None else state, timeout=timeout)
+    counter = MetricFamily("shifter_xray_inbound_bytes_total", "counter", "Bytes through an Xray inbound.")
+    for tag, counters in traffic.items():
+        counter.add(counters["uplink_bytes"], inbound=tag, direction="uplink")
+        counter.add(counters["downlink_bytes"], inbound=tag, direction="downlink")
+    return [counter]
+
+
+SOURCES: Dict[str, Callable[[float], List[MetricFamily]]] = {
+    "iptables": iptables_families,
+    "haproxy": haproxy_families,
+    "xray": xray_families,
+}
+
+SOURCE_ERRORS = (OSError, ValueError, subprocess.SubprocessError, HAProxyRuntimeError, XrayAPIError)
+
+
+class MetricsCollector:
+    """Serve the last sample, collecting a new one at most every ``min_interval`` seconds."""
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_INTERVAL, timeout: float = 5.0):
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._durations = Histogram()
+        self._sources: Dict[str, Callable[[float], List[MetricFamily]]] = {
+            **SOURCES, "xray": functools.partial(xray_families, state={}),
+        }
+        self._text = ""
+        self._collected_at: Optional[float] = None
+
+    def render(self, services: Dict[str, Dict[str, Any]]) -> str:
+        """Return the exposition text, collecting first if the sample is stale.
+
+        Blocking: call it from a worker thread inside an event loop.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._collected_at is None or now - self._collected_at >= self.min_interval:
+                self._text = self._collect(services)
+                self._collected_at = time.monotonic()
+            return self._text
+
+    def _collect(self, services: Dict[str, Dict[str, Any]]) -> str:
+        families = service_families(services) + probe_families(services)
+        source_up = MetricFamily("shifter_metrics_source_up", "gauge", "1 when the source answered the last collection.")
+        for name, source in self._sources.items():
+            start = time.perf_counter()
+            try:
+                families.extend(source(self.timeout))
+                source_up.add(1, source=name)
+            except SOURCE_ERRORS:
+                source_up.add(0, source=name)
+            self._durations.observe(name, time.perf_counter() - start)
+        families.append(source_up)
+        families.append(self._durations.family(
+            "shifter_metrics_collect_duration_seconds", "Time spent reading each metrics source.", "source"
+        ))
+        lines: List[str] = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
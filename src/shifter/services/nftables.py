@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+from .system_info import get_system_info
+from . import iptables_rules, nftables_rules, safe_write, systemd
+from .config import NFTABLES_RULES_PATH
+from .commands import run_command
+from .ports import check_ports, describe, expand_tokens
+from .results import ActionResult
+
+def _get_nftables_conf_path():
+    """Returns the file nftables.service loads at boot for this OS."""
+    if get_system_info()['package_manager'] in ['dnf', 'yum']:
+        return "/etc/sysconfig/nftables.conf"
+    return "/etc/nftables.conf"
+
+def _include_line():
+    return f'include "{NFTABLES_RULES_PATH}"'
+
+def _load_ruleset():
+    if os.path.exists(NFTABLES_RULES_PATH):
+        return nftables_rules.NftRuleset.from_file(NFTABLES_RULES_PATH)
+    return nftables_rules.NftRuleset()
+
+def _apply_ruleset(result, ruleset):
+    """Replaces the shifter table in one nft transaction, then persists it."""
+    script = ruleset.render()
+    if run_command(["sudo", "nft", "-f", "-"], result, input=script) is None:
+        return False
+    safe_write.write_file(NFTABLES_RULES_PATH, script)
+    return True
+
+def _ensure_included(result, conf_path):
+    """Makes nftables.service load the Shifter table at boot."""
+    content = ""
+    if os.path.exists(conf_path):
+        with open(conf_path, 'r') as f:
+            content = f.read()
+    if _include_line() in content:
+        return
+    result.step(f"Adding the Shifter table to {conf_path}...")
+    if content and not content.endswith("\n"):
+        content += "\n"
+    safe_write.write_file(conf_path, content + _include_line() + "\n")
+
+def install_nftables(main_server_ip, ports):
+    result = ActionResult()
+    try:
+        ruleset = _load_ruleset()
+        ruleset.add(main_server_ip, ports)
+    except (OSError, ValueError) as e:
+        return result.fail(f"Invalid forwarding rule: {e}")
+    conflicts = check_ports(expand_tokens(iptables_rules.parse_ports(ports)), "nftables")
+    if conflicts:
+        return result.fail(describe(conflicts))
+    try:
+        package_manager = get_system_info()['package_manager']
+
+        result.step("Installing nftables...")
+        run_command(["sudo", package_manager, "install", "nftables", "-y"], result)
+
+        result.step("Enabling IP forwarding...")
+        run_command(["sudo", "sysctl", "net.ipv4.ip_forward=1"], result)
+
+        result.step(f"Applying the '{nftables_rules.TABLE}' table with nft -f...")
+        if not _apply_ruleset(result, ruleset):
+            return result.fail("nft rejected the ruleset; no rules were changed.")
+
+        _ensure_included(result, _get_nftables_conf_path())
+
+        result.step("Enabling nftables service...")
+        run_command(["sudo", "systemctl", "enable", "nftables"], result)
+
+        return result.ok("nftables forwarding rules installed.")
+    except (OSError, KeyError, subprocess.CalledProcessError) as e:
+        return result.fail(f"An error occurred: {e}")
+
+def get_nftables_status_details():
+    """Reports the nftables service state and the forwarded ports."""
+    result = ActionResult()
+    status = systemd.get_unit_statuses(["nftables"])["nftables"]['active']
+    result.step(f"nftables Service Status: {status}")
+
+    live = run_command(["sudo", "nft", "list", "table", "ip", nftables_rules.TABLE], result)
+    if live is None:
+        return result.fail(f"Table 'ip {nftables_rules.TABLE}' is not loaded.")
+
+    result.step("")
+    result.step("Active Port Forwarding Rules:")
+    entries = nftables_rules.NftRuleset.from_text(live.stdout).entries()
+    for port, protocol, dest_ip in entries:
+        result.step(f"  - Port(s) {port} ({protocol.upper()}) -> {dest_ip}")
+    if not entries:
+        result.step("  - No active forwarding rules found.")
+    return result
+
+def uninstall_nftables():
+    result = ActionResult()
+    result.step(f"Deleting table 'ip {nftables_rules.TABLE}'...")
+    run_command(["sudo", "nft", "delete", "table", "ip", nftables_rules.TABLE], result)
+
+    try:
+        if os.path.exists(NFTABLES_RULES_PATH):
+            result.step(f"Removing {NFTABLES_RULES_PATH}...")
+            os.remove(NFTABLES_RULES_PATH)
+        conf_path = _get_nftables_conf_path()
+        if os.path.exists(conf_path):
+            with open(conf_path, 'r') as f:
+                lines = f.readlines()
+            kept = [line for line in lines if line.strip() != _include_line()]
+            if kept != lines:
+                safe_write.write_file(conf_path, "".join(kept))
+    except (OSError, KeyError) as e:
+        result.warn(f"Error removing persisted rules: {e}")
+
+    return result.ok("nftables forwarding rules have been removed.")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""Shifter's nftables ruleset: port forwards kept in kernel maps.
+
+Instead of one multiport rule per 15 ports, every forwarded port or range is an
+element of an interval map, so the kernel resolves the destination with a
+single lookup however many ports are forwarded::
+
+    table ip shifter {
+        map tcp_forwards {
+            type inet_service : ipv4_addr
+            flags interval
+            elements = {
+                80 : 203.0.113.7,
+                1000-2000 : 203.0.113.8
+            }
+        }
+        ...
+        chain prerouting {
+            type nat hook prerouting priority dstnat; policy accept;
+            dnat to tcp dport map @tcp_forwards
+        }
+    }
+
+The rendered file deletes and recreates ``table ip shifter``, so ``nft -f``
+replaces the whole table in one transaction and leaves other tables alone.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from .iptables_rules import PROTOCOLS, parse_ports
+
+TABLE = "shifter"
+
+# (first port, last port, destination)
+Interval = Tuple[int, int, str]
+
+_MAP_ELEMENTS = re.compile(r"map (tcp|udp)_forwards \{[^}]*?elements = \{([^}]*)\}")
+_ELEMENT = re.compile(r"^\s*(\d+)(?:-(\d+))?\s*:\s*([\d.]+)\s*$")
+
+
+def _interval(token: str) -> Tuple[int, int]:
+    """Turn a validated ``80`` or ``1000:2000`` token into ``(first, last)``."""
+    first, _, last = token.partition(":")
+    return int(first), int(last or first)
+
+
+def format_interval(first: int, last: int) -> str:
+    return str(first) if first == last else f"{first}-{last}"
+
+
+class NftRuleset:
+    """Forwarded port intervals per protocol, rendered as an ``nft -f`` script."""
+
+    def __init__(self):
+        self.forwards: Dict[str, List[Interval]] = {proto: [] for proto in PROTOCOLS}
+
+    @classmethod
+    def from_text(cls, text: str) -> "NftRuleset":
+        """Read the maps from a rendered file or ``nft list table`` output."""
+        ruleset = cls()
+        for proto, body in _MAP_ELEMENTS.findall(text):
+            for element in body.split(","):
+                match = _ELEMENT.match(element)
+                if match:
+                    first = int(match.group(1))
+                    last = int(match.group(2) or first)
+                    ruleset.forwards[proto].append((first, last, match.group(3)))
+        return ruleset
+
+    @classmethod
+    def from_file(cls, path: str) -> "NftRuleset":
+        with open(path, "r") as f:
+            return cls.from_text(f.read())
+
+    def add(self, destination: str, ports: str, protocols: Sequence[str] = PROTOCOLS) -> None:
+        """Forward ``ports`` to ``destination``; raises ValueError on conflicts."""
+        ipaddress.IPv4Address(destination)
+        intervals = [_interval(token) for token in parse_ports(ports)]
+        for proto in protocols:
+            existing = self.forwards[proto]
+            for first, last in intervals:
+                if (first, last, destination) in existing:
+                    continue
+                for other_first, other_last, other_dest in existing:
+                    if first <= other_last and other_first <= last:
+                        raise ValueError(
+                            f"{proto} port(s) {format_interval(first, last)} conflict with "
+                            f"{format_interval(other_first, other_last)} -> {other_dest}"
+                        )
+                existing.append((first, last, destination))
+            existing.sort()
+
+    def entries(self) -> List[Tuple[str, str, str]]:
+        """Return ``(port or range, protocol, destination)`` for every element."""
+        return [
+            (format_interval(first, last), proto, destination)
+            for proto, intervals in self.forwards.items()
+            for first, last, destination in intervals
+        ]
+
+    def _map(self, proto: str) -> List[str]:
+        lines = [
+            f"\tmap {proto}_forwards {{",
+            "\t\ttype inet_service : ipv4_addr",
+            "\t\tflags interval",
+        ]
+        elements = [f"\t\t\t{format_interval(first, last)} : {dest}" for first, last, dest in self.forwards[proto]]
+        if elements:
+            lines += ["\t\telements = {", ",\n".join(elements), "\t\t}"]
+        lines.append("\t}")
+        return lines
+
+    def _set(self, proto: str) -> List[str]:
+        lines = [
+            f"\tset {proto}_ports {{",
+            "\t\ttype inet_service",
+            "\t\tflags interval",
+        ]
+        # Intervals never overlap (see add), so the map keys form a valid set.
+        elements = [format_interval(first, last) for first, last, _ in self.forwards[proto]]
+        if elements:
+            lines.append(f"\t\telements = {{ {', '.join(elements)} }}")
+        lines.append("\t}")
+        return lines
+
+    def render(self) -> str:
+        """Build the ``nft -f`` script that atomically replaces the table."""
+        lines = [
+            "#!/usr/sbin/nft -f",
+            "# Managed by Shifter; manual changes are overwritten.",
+            f"table ip {TABLE}",
+            f"delete table ip {TABLE}",
+            "",
+            f"table ip {TABLE} {{",
+        ]
+        for proto in PROTOCOLS:
+            lines += self._map(proto)
+            lines += self._set(proto)
+        lines += [
+            "\tchain prerouting {",
+            "\t\ttype nat hook prerouting priority dstnat; policy accept;",
+            *(f"\t\tdnat to {proto} dport map @{proto}_forwards" for proto in PROTOCOLS),
+            "\t}",
+            "\tchain postrouting {",
+            "\t\ttype nat hook postrouting priority srcnat; policy accept;",
+            *(f"\t\tct status dnat {proto} dport @{proto}_ports masquerade" for proto in PROTOCOLS),
+            "\t}",
+            "}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""Port allocation index shared by every add path.
+
+A :class:`PortRegistry` combines two sources. The first is the sockets the
+kernel lists in ``/proc/net/{tcp,tcp6,udp,udp6}``: listening TCP sockets and
+every bound UDP socket. The second is the ports Shifter's backends claim in
+their configs: GOST rules, HAProxy binds, Xray inbounds, and the iptables and
+nftables forwards. Both are kept in dicts keyed by port, so checking a port is
+a lookup. There is no ``sudo lsof -i :port`` walking every process's file
+descriptors, and a port forwarded by one backend cannot be added to another.
+
+Build a fresh registry for each action with :func:`scan`. Reading
+``/proc/net`` takes a few milliseconds even on busy hosts, and the claims are
+one query against the tunnel registry (:mod:`shifter.services.registry`).
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import registry
+
+PROC_NET_DIR = "/proc/net"
+PROC_NET_FILES = ("tcp", "tcp6", "udp", "udp6")
+LOCAL_PORT_RANGE_PATH = "/proc/sys/net/ipv4/ip_local_port_range"
+
+# Suggestions start here and stop below the kernel's ephemeral range.
+SUGGEST_START = 10000
+DEFAULT_EPHEMERAL_START = 32768
+
+_TCP_LISTEN = "0A"
+
+
+def _read_proc_net(path: str, listening_only: bool) -> Iterable[int]:
+    try:
+        with open(path, "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split(None, 4)
+                if len(fields) < 4 or (listening_only and fields[3] != _TCP_LISTEN):
+                    continue
+                yield int(fields[1].rpartition(":")[2], 16)
+    except OSError:
+        return
+
+
+def ephemeral_start() -> int:
+    """First port of the kernel's ephemeral (outgoing connection) range."""
+    try:
+        with open(LOCAL_PORT_RANGE_PATH, "r") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return DEFAULT_EPHEMERAL_START
+
+
+class PortRegistry:
+    """Ports bound on this host and ports claimed by Shifter's backends."""
+
+    def __init__(self):
+        self.bound: Dict[int, Set[str]] = {}
+        self.claims: Dict[int, str] = {}
+
+    @classmethod
+    def scan(cls, proc_net_dir: Optional[str] = None, services: bool = True) -> "PortRegistry":
+        registry = cls()
+        directory = proc_net_dir or PROC_NET_DIR
+        for name in PROC_NET_FILES:
+            proto = name.rstrip("6")
+            for port in _read_proc_net(os.path.join(directory, name), listening_only=proto == "tcp"):
+                registry.bind(port, proto)
+        if services:
+            for port, service in service_claims():
+                registry.claim(port, service)
+        return registry
+
+    def bind(self, port: int, proto: str) -> None:
+        self.bound.setdefault(port, set()).add(proto)
+
+    def claim(self, port: int, service: str) -> None:
+        # The first backend to claim a port keeps it; the others conflict with it.
+        self.claims.setdefault(port, service)
+
+    def owner(self, port: int) -> Optional[str]:
+        """The backend claiming ``port``, ``"system"`` for other bound sockets, or None."""
+        if port in self.claims:
+            return self.claims[port]
+        if port in self.bound:
+            return "system"
+        return None
+
+    def conflict(self, port: int, service: Optional[str] = None) -> Optional[str]:
+        """Why ``port`` cannot be given to ``service`` (``"already ..."``), or None when it is free.
+
+        A port claimed by ``service`` itself does not conflict; its own
+        socket holding the port is expected.
+        """
+        owner = self.claims.get(port)
+        if owner is not None:
+            return None if owner == service else f"already forwarded by {owner}"
+        protos = self.bound.get(port)
+        if protos:
+            return f"already in use by a local {'/'.join(sorted(protos))} socket"
+        return None
+
+    def is_free(self, port: int, service: Optional[str] = None) -> bool:
+        return self.conflict(port, service) is None
+
+    def free_ports(self, count: int = 1, start: Optional[int] = None, end: Optional[int] = None) -> List[int]:
+        """Up to ``count`` free ports in ``[start, end]``, lowest first.
+
+        The default range runs from ``SUGGEST_START`` to just below the
+        ephemeral range, where outgoing connections could take the port.
+        """
+        first = SUGGEST_START if start is None else start
+        last = ephemeral_start() - 1 if end is None else end
+        found: List[int] = []
+        for port in range(max(first, 1), min(last, 65535) + 1):
+            if port not in self.claims and port not in self.bound:
+                found.append(port)
+                if len(found) >= count:
+                    break
+        return found
+
+
+def _expand(ranges: Iterable[Tuple[int, int]]) -> List[int]:
+    return [port for first, last in ranges for port in range(first, last + 1)]
+
+
+def service_claims() -> List[Tuple[int, str]]:
+    """``(port, service)`` for every port a backend's config forwards (see services.registry)."""
+    return [(port, service) for first, last, service in registry.claims() for port in range(first, last + 1)]
+
+
+def scan(services: bool = True) -> PortRegistry:
+    """Build a registry from ``/proc/net`` and, unless disabled, every backend's config."""
+    return PortRegistry.scan(services=services)
+
+
+def check_ports(ports: Iterable[int], service: str, index: Optional[PortRegistry] = None) -> Dict[int, str]:
+    """Map each conflicting port in ``ports`` to the reason, for ``service``."""
+    index = index or scan()
+    conflicts = {}
+    for port in ports:
+        reason = index.conflict(port, service)
+        if reason:
+            conflicts[port] = reason
+    return conflicts
+
+
+def expand_tokens(tokens: Iterable[str]) -> List[int]:
+    """Ports named by validated ``80`` / ``1000:2000`` tokens (see iptables_rules.parse_ports)."""
+    spans = []
+    for token in tokens:
+        first, _, last = token.partition(":")
+        spans.append((int(first), int(last or first)))
+    return _expand(spans)
+
+
+def describe(conflicts: Dict[int, str], limit: int = 5) -> str:
+    """One line listing the first ``limit`` conflicts from :func:`check_ports`."""
+    shown = [f"{port} ({conflicts[port]})" for port in sorted(conflicts)[:limit]]
+    more = len(conflicts) - len(shown)
+    return "Port(s) not available: " + ", ".join(shown) + (f" and {more} more." if more else ".")
+
+
+def suggest(count: int = 1, start: Optional[int] = None, end: Optional[int] = None) -> List[int]:
+    """Free ports for a new tunnel (see :meth:`PortRegistry.free_ports`)."""
+    return scan().free_ports(count, start, end)
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+
+"""Reachability and latency probes for tunnel destinations.
+
+The targets come from the tunnel registry (see services.registry):
+
+* a GOST rule's forwarder address,
+* every ``server`` address of an HAProxy frontend's backend,
+* an Xray dokodemo-door inbound's ``settings.address:port``,
+* an iptables or nftables forward's ``--to-destination``.
+
+A destination without a port, such as iptables' bare ``1.2.3.4``, is probed on
+the tunnel's first listen port.
+
+Every target gets a set of checks:
+
+* ``tcp`` times a TCP connect.
+* ``tls`` times a TCP connect plus a TLS handshake. The certificate is not
+  verified, because the check is about reachability and not trust.
+* ``udp`` sends a one-byte datagram. An ICMP port-unreachable counts as a
+  failure. No answer within ``UDP_WAIT`` counts as a success, because most
+  UDP services stay silent, so that sample has no latency.
+
+TCP and TLS checks only run against tunnels that forward TCP; UDP checks only
+run against tunnels that forward UDP.
+
+:class:`ProbeEngine` runs every check of a round concurrently. A semaphore
+caps how many are in flight, and each check has its own timeout. Hostnames go
+through :class:`Resolver`, which caches answers for ``DNS_TTL`` seconds and
+shares one lookup between concurrent callers. Each (tunnel, check) pair keeps
+a :class:`RollingWindow` of its last ``DEFAULT_WINDOW`` samples. From that
+window come the p50/p95/p99 connect latency and the failure rate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import math
+import os
+import socket
+import sqlite3
+import ssl
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import registry
+from .iptables_nat import split_destination
+
+CHECKS = ("tcp", "udp", "tls")
+DEFAULT_CHECKS = ("tcp",)
+DEFAULT_CONCURRENCY = 100
+DEFAULT_TIMEOUT = 3.0
+DEFAULT_WINDOW = 120
+DEFAULT_INTERVAL = 30.0
+DNS_TTL = 60.0
+# Failed lookups are retried sooner than good answers expire.
+DNS_NEGATIVE_TTL = 10.0
+# How long a UDP check waits for an answer or an ICMP error.
+UDP_WAIT = 1.0
+INTERVAL_ENV = "SHIFTER_PROBE_INTERVAL"
+CHECKS_ENV = "SHIFTER_PROBE_CHECKS"
+
+# Which tunnel protocol each check needs.
+_CHECK_PROTOCOL = {"tcp": "TCP", "tls": "TCP", "udp": "UDP"}
+
+
+@dataclass(frozen=True)
+class Target:
+    """One tunnel destination to probe."""
+
+    service: str
+    tunnel: str
+    destination: str
+    host: str
+    port: int
+    protocols: str
+
+    def supports(self, check: str) -> bool:
+        # An unknown protocol list is treated as TCP, which every backend forwards.
+        return _CHECK_PROTOCOL[check] in (self.protocols.upper() or "TCP")
+
+
+@dataclass
+class Sample:
+    ok: bool
+    latency: Optional[float] = None
+    error: str = ""
+    at: float = 0.0
+
+
+def _targets(service: str, key: str, destinations: str, protocols: str, listen_ports: Sequence[str]) -> List[Target]:
+    # A load-balanced HAProxy tunnel lists its servers comma-separated.
+    targets = []
+    for destination in destinations.split(","):
+        if not destination or destination == "N/A":
+            continue
+        host, port = split_destination(destination)
+        if port is None:
+            # DNAT to a bare address keeps the port the client connected to.
+            first = listen_ports[0].split("-")[0] if listen_ports else ""
+            port = int(first) if first.isdigit() else None
+        if host and port is not None:
+            targets.append(Target(service, key, destination, host, port, protocols))
+    return targets
+
+
+def load_targets(services: Optional[Iterable[str]] = None) -> List[Target]:
+    """Every probeable tunnel destination, optionally limited to ``services``."""
+    wanted = tuple(services) if services is not None else registry.SERVICES
+    rows: List[Tuple[str, str, str, str, List[str]]] = []
+    try:
+        for tunnel in registry.tunnels():
+            rows.append((tunnel["service"], tunnel["key"], tunnel["destination"], tunnel["protocols"], tunnel["ports"]))
+    except (sqlite3.Error, OSError):
+        for service in registry.SERVICES:
+            try:
+                found = registry.IMPORTERS[service]()
+            except (OSError, ValueError):
+                continue
+            rows.extend(
+                (t.service, t.key, t.destination, t.protocols, [str(first) for first, _ in t.ports])
+                for t in found if t.listed
+            )
+    targets = []
+    for service, key, destination, protocols, listen_ports in rows:
+        if service in wanted:
+            targets.extend(_targets(service, key, destination, protocols, listen_ports))
+    return targets
+
+
+def _is_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class Resolver:
+    """``getaddrinfo`` with a TTL cache; concurrent lookups of one name share a query."""
+
+    def __init__(self, ttl: float = DNS_TTL, negative_ttl: float = DNS_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # host -> (expires at, addresses or the lookup error)
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+        self._pending: Dict[str, "asyncio.Task[Any]"] = {}
+
+    async def resolve(self, host: str) -> List[Tuple[int, str]]:
+        """Return ``(family, address)`` pairs for ``host``, raising OSError if it does not resolve."""
+        if _is_address(host):
+            return [(socket.AF_INET6 if ":" in host else socket.AF_INET, host)]
+        cached = self._cache.get(host)
+        if cached is not None and cached[0] > time.monotonic():
+            answer = cached[1]
+        else:
+            # The lookup runs as its own task and every caller waits on it through
+            # a shield, so a caller that times out does not cancel it for the others.
+            task = self._pending.get(host)
+            if task is None:
+                task = self._pending[host] = asyncio.ensure_future(self._lookup(host))
+                task.add_done_callback(lambda done: self._forget(host, done))
+            answer = await asyncio.shield(task)
+        if isinstance(answer, OSError):
+            raise OSError(*answer.args)
+        return answer
+
+    def _forget(self, host: str, task: "asyncio.Task[Any]") -> None:
+        if self._pending.get(host) is task:
+            del self._pending[host]
+
+    async def _lookup(self, host: str) -> Any:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except OSError as e:
+            answer: Any = OSError(f"DNS lookup for {host} failed: {e.strerror or e}")
+            self._cache[host] = (time.monotonic() + self.negative_ttl, answer)
+            return answer
+        answer = []
+        for family, _, _, _, sockaddr in infos:
+            if (family, sockaddr[0]) not in answer:
+                answer.append((family, sockaddr[0]))
+        self._cache[host] = (time.monotonic() + self.ttl, answer)
+        return answer
+
+
+class RollingWindow:
+    """The last ``size`` samples of one check, summarized as percentiles and a failure rate."""
+
+    def __init__(self, size: int = DEFAULT_WINDOW):
+        self.samples: Deque[Sample] = deque(maxlen=max(size, 1))
+
+    def add(self, sample: Sample) -> None:
+        self.samples.append(sample)
+
+    def summary(self) -> Dict[str, Any]:
+        count = len(self.samples)
+        failures = sum(1 for sample in self.samples if not sample.ok)
+        latencies = sorted(sample.latency for sample in self.samples if sample.ok and sample.latency is not None)
+        last = self.samples[-1] if self.samples else None
+        return {
+            "samples": count,
+            "failures": failures,
+            "failure_rate": round(failures / count, 4) if count else None,
+            "p50_ms": _percentile_ms(latencies, 0.50),
+            "p95_ms": _percentile_ms(latencies, 0.95),
+            "p99_ms": _percentile_ms(latencies, 0.99),
+            "last_ok": last.ok if last else None,
+            "last_ms": _ms(last.latency) if last else None,
+            "last_error": last.error if last else "",
+            "last_at": last.at if last else None,
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _percentile_ms(ordered: Sequence[float], quantile: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted latencies, in milliseconds."""
+    if not ordered:
+        return None
+    return _ms(ordered[max(math.ceil(quantile * len(ordered)) - 1, 0)])
+
+
+class _DatagramProbe(asyncio.DatagramProtocol):
+    def __init__(self, answer: "asyncio.Future[None]"):
+        self.answer = answer
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        if not self.answer.done():
+            self.answer.set_result(None)
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.answer.done():
+            self.answer.set_exception(exc)
+
+
+def _no_verify_context() -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class ProbeEngine:
+    """Runs probe rounds and keeps a rolling window per (tunnel, check).
+
+    One engine is meant to live as long as its process (the Web UI or agent
+    keeps one), so the windows cover the last ``window`` rounds.
+    """
+
+    def __init__(self, checks: Sequence[str] = DEFAULT_CHECKS, concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, window: int = DEFAULT_WINDOW, resolver: Optional[Resolver] = None):
+        unknown = set(checks) - set(CHECKS)
+        if unknown:
+            raise ValueError(f"Unknown probe check(s): {', '.join(sorted(unknown))}")
+        self.checks = tuple(check for check in CHECKS if check in checks)
+        self.concurrency = max(concurrency, 1)
+        self.timeout = timeout
+        self.window = window
+        self.resolver = resolver or Resolver()
+        self._windows: Dict[Tuple[Target, str], RollingWindow] = {}
+        self._tls_context: Optional[ssl.SSLContext] = None
+
+    # --- checks ---
+    async def _tcp(self, target: Target, family: int, address: str, tls: bool) -> Optional[float]:
+        if tls and self._tls_context is None:
+            self._tls_context = _no_verify_context()
+        started = time.perf_counter()
+        _, writer = await asyncio.open_connection(
+            address, target.port, family=family,
+            ssl=self._tls_context if tls else None,
+            server_hostname=(target.host if not _is_address(target.host) else "") if tls else None,
+        )
+        elapsed = time.perf_counter() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        return elapsed
+
+    async def _udp(self, target: Target, family: int, address: str) -> Optional[float]:
+        loop = asyncio.get_running_loop()
+        answer = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProbe(answer), remote_addr=(address, target.port), family=family
+        )
+        try:
+            started = time.perf_counter()
+            transport.sendto(b"\0")
+            try:
+                await asyncio.wait_for(answer, min(UDP_WAIT, self.timeout))
+            except asyncio.TimeoutError:
+                return None
+            return time.perf_counter() - started
+        finally:
+            transport.close()
+
+    async def _check(self, semaphore: asyncio.Semaphore, target: Target, check: str) -> Sample:
+        async with semaphore:
+            at = time.time()
+            try:
+                addresses = await asyncio.wait_for(self.resolver.resolve(target.host), self.timeout)
+                family, address = addresses[0]
+                if check == "udp":
+                    # Bounded by UDP_WAIT itself; a silent port is not a timeout.
+                    return Sample(True, await self._udp(target, family, address), at=at)
+                probe = self._tcp(target, family, address, tls=check == "tls")
+                return Sample(True, await asyncio.wait_for(probe, self.timeout), at=at)
+            except asyncio.TimeoutError:
+                return Sample(False, error=f"timed out after {self.timeout:g}s", at=at)
+            except ConnectionRefusedError:
+                return Sample(False, error="port unreachable" if check == "udp" else "connection refused", at=at)
+            except ssl.SSLError as e:
+                return Sample(False, error=f"TLS handshake failed: {e.reason or e}", at=at)
+            except OSError as e:
+                return Sample(False, error=e.strerror or str(e), at=at)
+
+    # --- rounds ---
+    async def run_round(self, targets: Optional[Sequence[Target]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Probe every target once and return :meth:`summaries`.
+
+        Windows of tunnels that are no longer configured are dropped.
+        """
+        if targets is None:
+            targets = await asyncio.to_thread(load_targets)
+        jobs = [(target, check) for target in targets for check in self.checks if target.supports(check)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._check(semaphore, target, check) for target, check in jobs), return_exceptions=True
+        )
+        # One check failing unexpectedly is a failed sample, not a lost round.
+        samples = [
+            result if isinstance(result, Sample) else Sample(False, error=str(result) or result.__class__.__name__, at=time.time())
+            for result in results
+        ]
+        current = set(jobs)
+        for stale in [job for job in self._windows if job not in current]:
+            del self._windows[stale]
+        for job, sample in zip(jobs, samples):
+            if job not in self._windows:
+                self._windows[job] = RollingWindow(self.window)
+            self._windows[job].add(sample)
+        return self.summaries()
+
+    async def sample(self, rounds: int = 1, interval: float = 0.0,
+                     services: Optional[Iterable[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Run ``rounds`` rounds, ``interval`` seconds apart, against the current targets."""
+        targets = await asyncio.to_thread(load_targets, services)
+        summaries: Dict[str, List[Dict[str, Any]]] = {}
+        for number in range(max(rounds, 1)):
+            if number and interval:
+                await asyncio.sleep(interval)
+            summaries = await self.run_round(targets)
+        return summaries
+
+    def summaries(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Per service, one entry per (tunnel, check) with its rolling statistics."""
+        found: Dict[str, List[Dict[str, Any]]] = {}
+        for (target, check), window in self._windows.items():
+            found.setdefault(target.service, []).append({
+                "tunnel": target.tunnel,
+                "destination": f"[{target.host}]:{target.port}" if ":" in target.host else f"{target.host}:{target.port}",
+                "check": check,
+                **window.summary(),
+            })
+        return found
+
+
+def run(rounds: int = 1, interval: float = 1.0, services: Optional[Iterable[str]] = None,
+        **engine_options: Any) -> Dict[str, List[Dict[str, Any]]]:
+    """Synchronous wrapper for the CLI: ``rounds`` probe rounds with a fresh engine."""
+    return asyncio.run(ProbeEngine(**engine_options).sample(rounds, interval, services))
+
+
+def format_summary(entry: Dict[str, Any]) -> str:
+    """One line for a (tunnel, check) summary, as ``status`` and ``probe`` print it."""
+    def latency(value: Optional[float]) -> str:
+        return f"{value:g}ms" if value is not None else "-"
+
+    line = (
+        f"{entry['tunnel']} -> {entry['destination']} [{entry['check']}] "
+        f"p50 {latency(entry['p50_ms'])} p95 {latency(entry['p95_ms'])} p99 {latency(entry['p99_ms'])}, "
+        f"{entry['failures']}/{entry['samples']} failed"
+    )
+    if entry["last_ok"] is False and entry["last_error"]:
+        line += f" (last: {entry['last_error']})"
+    return line
+
+
+def interval_from_env(default: float = DEFAULT_INTERVAL) -> float:
+    """Seconds between background probe rounds (``SHIFTER_PROBE_INTERVAL``; 0 turns them off)."""
+    try:
+        return max(float(os.environ.get(INTERVAL_ENV, default)), 0.0)
+    except ValueError:
+        return default
+
+
+def checks_from_env(default: Sequence[str] = DEFAULT_CHECKS) -> Tuple[str, ...]:
+    """Checks for background rounds, from a comma-separated ``SHIFTER_PROBE_CHECKS``."""
+    value = os.environ.get(CHECKS_ENV, "")
+    checks = tuple(part.strip().lower() for part in value.split(",") if part.strip())
+    if not checks or set(checks) - set(CHECKS):
+        return tuple(default)
+    return checks
@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+
+"""SQLite registry of every tunnel Shifter manages.
+
+Each tunnel lives in ``tunnels.db`` in the Shifter config directory: a GOST
+rule, an HAProxy frontend, an Xray inbound, or an iptables or nftables forward.
+A row holds the service, the tunnel's key (port, frontend name or tag), its
+destination and protocols, and the entry the service's ``list_*`` function
+returns. The ports it listens on go into ``bindings``, indexed by port. Listing
+and port conflict checks are therefore queries, however many tunnels there are.
+
+GOST's and Xray's ``config.json`` and ``haproxy.cfg`` are rendered from the
+registry. Each row also holds the native text it stands for (a tunnel's GOST
+services, an Xray inbound, an HAProxy section), and ``sources`` keeps the rest
+of the file (``base``). Rows that are part of the file but not tunnels, such as
+HAProxy backends or Xray's API inbound, are stored unlisted. An action edits
+the config that :func:`load` parses from the rows and hands it to
+:func:`write`, which updates the changed rows and writes the file rendered
+from them in one transaction. The daemons keep reading their native files.
+
+Hand edits still count:
+
+* Before a read or a :func:`load`, :func:`sync` compares the service's file
+  signature (inode, mtime and size) with the one stored at the last import or
+  write. A hand edit, a rollback to ``.last-good`` or a write from another
+  process shows up as a mismatch, and the service is re-imported from its
+  files before anything is rendered. The iptables table can change without any
+  file changing, so it is re-read after ``IPTABLES_TTL`` as well.
+* The iptables and nftables forwards are only imported; Shifter writes them
+  with ``iptables-restore`` and ``nft`` as before.
+
+:func:`rebuild` (``shifter-toolkit registry import``) re-imports everything
+from the native files. If the database cannot be opened or queried, reads fall
+back to parsing the files and :func:`write` writes the file straight from the
+edited config, as before the registry existed.
+"""
+
+from __future__ import annotations
+
+import errno
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import gost_config, haproxy_config, iptables_nat
+from .safe_write import Validator, write_file
+from .config import (
+    GOST_CONFIG_PATH,
+    GOST_SERVICE_PATH,
+    HAPROXY_CONFIG_PATH,
+    NFTABLES_RULES_PATH,
+    XRAY_CONFIG_PATH,
+    resolve_config_dir,
+)
+from .nftables_rules import NftRuleset, format_interval
+
+DB_FILENAME = "tunnels.db"
+PATH_ENV = "SHIFTER_REGISTRY_PATH"
+SERVICES = ("gost", "haproxy", "xray", "iptables", "nftables")
+IPTABLES_TTL = iptables_nat.CACHE_TTL
+# Part of every signature: bumping it re-imports rows stored in an older entry format.
+ENTRY_FORMAT = "2"
+# Bumping it drops the tables; they are re-imported from the native files.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tunnels (
+    service TEXT NOT NULL,
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    port INTEGER,
+    destination TEXT NOT NULL DEFAULT '',
+    protocols TEXT NOT NULL DEFAULT '',
+    listed INTEGER NOT NULL DEFAULT 1,
+    entry TEXT NOT NULL,
+    native TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (service, key)
+);
+CREATE INDEX IF NOT EXISTS tunnels_by_position ON tunnels (service, position);
+CREATE TABLE IF NOT EXISTS bindings (
+    service TEXT NOT NULL,
+    key TEXT NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bindings_by_port ON bindings (first, last);
+CREATE INDEX IF NOT EXISTS bindings_by_key ON bindings (service, key);
+CREATE TABLE IF NOT EXISTS sources (
+    service TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    imported_at REAL NOT NULL,
+    base TEXT NOT NULL DEFAULT ''
+);
+"""
+
+
+@dataclass
+class Tunnel:
+    """One tunnel as stored in the registry."""
+
+    service: str
+    key: str
+    entry: Dict[str, Any]
+    ports: List[Tuple[int, int]] = field(default_factory=list)
+    destination: str = ""
+    protocols: str = ""
+    # False for things that hold a port but are not tunnels (Xray's API inbound)
+    # and for the parts of a rendered config that are not tunnels at all.
+    listed: bool = True
+    # The text this row renders to in the native config, if it is rendered.
+    native: str = ""
+
+    @property
+    def port(self) -> Optional[int]:
+        return self.ports[0][0] if self.ports else None
+
+
+# --- importers: native config -> tunnels ---
+
+def gost_tunnel(rule: Dict[str, str]) -> Tunnel:
+    port = int(rule["port"])
+    return Tunnel("gost", rule["port"], rule, [(port, port)], rule["domain"], rule["protocols"])
+
+
+def haproxy_tunnel(cfg: haproxy_config.HAProxyConfig, frontend_name: str) -> Optional[Tunnel]:
+    entry = cfg.tunnel(frontend_name)
+    if entry is None:
+        return None
+    ports = [(port, port) for port in cfg.frontends[frontend_name].ports]
+    # Every server of a load-balanced tunnel, so lookups and probes see all of them.
+    destination = ",".join(server["address"] for server in entry["servers"]) or entry["destination"]
+    return Tunnel("haproxy", frontend_name, entry, ports, destination, "TCP")
+
+
+def xray_key(inbound: Dict[str, Any]) -> str:
+    return inbound.get("tag") or f"port:{inbound.get('port')}"
+
+
+def xray_tunnel(inbound: Dict[str, Any]) -> Tunnel:
+    port = inbound.get("port", "N/A")
+    destination = "N/A"
+    if inbound.get("protocol") == "dokodemo-door":
+        settings = inbound.get("settings", {})
+        destination = f"{settings.get('address', 'N/A')}:{settings.get('port', 'N/A')}"
+    entry = {"tag": inbound.get("tag", "N/A"), "port": port, "destination": destination}
+    ports = [(port, port)] if isinstance(port, int) else []
+    network = (inbound.get("settings", {}).get("network") or "tcp").upper().replace(",", "/")
+    return Tunnel("xray", xray_key(inbound), entry, ports, destination, network, listed=inbound.get("tag") != "api")
+
+
+def _gost_tunnels() -> List[Tunnel]:
+    return _import("gost")[1]
+
+
+def _haproxy_tunnels() -> List[Tunnel]:
+    return _import("haproxy")[1]
+
+
+def _xray_tunnels() -> List[Tunnel]:
+    return _import("xray")[1]
+
+
+def _iptables_tunnels() -> List[Tunnel]:
+    table = iptables_nat.load("ipv4")
+    if table is None:
+        return []
+    tunnels = []
+    for record in table.forwards():
+        labels = record.port_labels()
+        entry = {"ports": labels, "protocol": record.proto, "destination": record.destination}
+        key = f"{record.proto}/{','.join(labels)}/{record.destination}"
+        tunnels.append(Tunnel("iptables", key, entry, list(record.ports), record.destination, record.proto.upper()))
+    return tunnels
+
+
+def _nftables_tunnels() -> List[Tunnel]:
+    if not os.path.exists(NFTABLES_RULES_PATH):
+        return []
+    tunnels = []
+    for proto, intervals in NftRuleset.from_file(NFTABLES_RULES_PATH).forwards.items():
+        for first, last, destination in intervals:
+            label = format_interval(first, last)
+            entry = {"ports": label, "protocol": proto, "destination": destination}
+            tunnels.append(Tunnel("nftables", f"{proto}/{label}", entry, [(first, last)], destination, proto.upper()))
+    return tunnels
+
+
+IMPORTERS: Dict[str, Callable[[], List[Tunnel]]] = {
+    "gost": _gost_tunnels,
+    "haproxy": _haproxy_tunnels,
+    "xray": _xray_tunnels,
+    "iptables": _iptables_tunnels,
+    "nftables": _nftables_tunnels,
+}
+
+
+# --- rendered configs: native file <-> rows ---
+
+@dataclass(frozen=True)
+class Codec:
+    """How a native config file is split into rows and put back together from them.
+
+    ``split`` returns the file's ``base`` (everything that is not a row) and
+    ``(key, native)`` for each row in file order; ``describe`` builds the row.
+    ``build`` turns a base and natives into the config an action edits, and
+    ``render`` into the file text.
+    """
+
+    path: Callable[[], str]
+    read: Callable[[], Any]
+    parse: Callable[[str], Any]
+    split: Callable[[Any], Tuple[str, List[Tuple[str, str]]]]
+    describe: Callable[[Any, str, str], Tunnel]
+    build: Callable[[str, List[str]], Any]
+    render: Callable[[str, List[str]], str]
+
+
+def _unique(pieces: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Suffix repeated keys (``#2``, ``#3``) so a duplicate in the file keeps its own row."""
+    seen: Dict[str, int] = {}
+    unique = []
+    for key, native in pieces:
+        seen[key] = seen.get(key, 0) + 1
+        unique.append((key if seen[key] == 1 else f"{key}#{seen[key]}", native))
+    return unique
+
+
+def _gost_read() -> Optional[gost_config.GostConfig]:
+    # Older installs keep their rules as -L flags on the unit (see gost._load_config).
+    if os.path.exists(GOST_CONFIG_PATH):
+        return gost_config.GostConfig.from_file(GOST_CONFIG_PATH)
+    if os.path.exists(GOST_SERVICE_PATH):
+        with open(GOST_SERVICE_PATH, "r") as f:
+            line = gost_config.exec_line(f.read())
+        if line:
+            return gost_config.GostConfig.from_legacy_flags(line)
+    return None
+
+
+def _gost_split(cfg: gost_config.GostConfig) -> Tuple[str, List[Tuple[str, str]]]:
+    base = dict(cfg.data, services=cfg.portless_services())
+    return json.dumps(base), [(str(port), json.dumps(cfg.services_on(port))) for port in cfg.ports()]
+
+
+def _gost_describe(cfg: gost_config.GostConfig, key: str, native: str) -> Tunnel:
+    tunnel = gost_tunnel(cfg.rule(int(key)))
+    tunnel.native = native
+    return tunnel
+
+
+def _gost_build(base: str, natives: List[str]) -> gost_config.GostConfig:
+    data = json.loads(base) if base else {}
+    data["services"] = data.get("services", []) + [service for native in natives for service in json.loads(native)]
+    return gost_config.GostConfig(data)
+
+
+def _haproxy_read() -> Optional[haproxy_config.HAProxyConfig]:
+    return haproxy_config.load(HAPROXY_CONFIG_PATH) if os.path.exists(HAPROXY_CONFIG_PATH) else None
+
+
+def _section_key(section: haproxy_config.Section) -> str:
+    # Frontends are keyed by name, as tunnels always were; other sections by kind too.
+    if section.kind == "frontend" and section.name:
+        return section.name
+    return f"{section.kind} {section.name}" if section.name else section.kind
+
+
+def _haproxy_split(cfg: haproxy_config.HAProxyConfig) -> Tuple[str, List[Tuple[str, str]]]:
+    return "".join(cfg.preamble), _unique((_section_key(section), section.text()) for section in cfg.sections)
+
+
+def _haproxy_describe(cfg: haproxy_config.HAProxyConfig, key: str, native: str) -> Tunnel:
+    tunnel = haproxy_tunnel(cfg, key) if key in cfg.frontends else None
+    if tunnel is None:
+        tunnel = Tunnel("haproxy", key, {}, listed=False)
+    tunnel.native = native
+    return tunnel
+
+
+def _xray_read() -> Optional[Dict[str, Any]]:
+    if not os.path.exists(XRAY_CONFIG_PATH):
+        return None
+    with open(XRAY_CONFIG_PATH, "r") as f:
+        return json.load(f)
+
+
+def _xray_split(data: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str]]]:
+    inbounds = data.get("inbounds", [])
+    return json.dumps(dict(data, inbounds=[])), _unique((xray_key(inbound), json.dumps(inbound)) for inbound in inbounds)
+
+
+def _xray_describe(_data: Dict[str, Any], key: str, native: str) -> Tunnel:
+    tunnel = xray_tunnel(json.loads(native))
+    tunnel.key, tunnel.native = key, native
+    return tunnel
+
+
+def _xray_build(base: str, natives: List[str]) -> Dict[str, Any]:
+    data = json.loads(base) if base else {}
+    data["inbounds"] = [json.loads(native) for native in natives]
+    return data
+
+
+CODECS: Dict[str, Codec] = {
+    "gost": Codec(
+        lambda: GOST_CONFIG_PATH, _gost_read, lambda text: gost_config.GostConfig(json.loads(text)),
+        _gost_split, _gost_describe, _gost_build,
+        lambda base, natives: json.dumps(_gost_build(base, natives).data, indent=2),
+    ),
+    "haproxy": Codec(
+        lambda: HAPROXY_CONFIG_PATH, _haproxy_read, haproxy_config.HAProxyConfig.parse,
+        _haproxy_split, _haproxy_describe,
+        lambda base, natives: haproxy_config.HAProxyConfig.parse(base + "".join(natives)),
+        lambda base, natives: base + "".join(natives),
+    ),
+    "xray": Codec(
+        lambda: XRAY_CONFIG_PATH, _xray_read, json.loads, _xray_split, _xray_describe, _xray_build,
+        lambda base, natives: json.dumps(_xray_build(base, natives), indent=4),
+    ),
+}
+
+
+def _import(service: str) -> Tuple[str, List[Tunnel]]:
+    """The service's ``base`` and rows, parsed from its native files."""
+    codec = CODECS.get(service)
+    if codec is None:
+        return "", IMPORTERS[service]()
+    model = codec.read()
+    if model is None:
+        return "", []
+    base, pieces = codec.split(model)
+    return base, [codec.describe(model, key, native) for key, native in pieces]
+
+
+def _source_paths(service: str) -> Tuple[str, ...]:
+    # Looked up on each call so forks (and the benchmarks) can repoint the module paths.
+    return {
+        "gost": (GOST_CONFIG_PATH, GOST_SERVICE_PATH),
+        "haproxy": (HAPROXY_CONFIG_PATH,),
+        "xray": (XRAY_CONFIG_PATH,),
+        "iptables": (iptables_nat.RULES_FILES["ipv4"],),
+        "nftables": (NFTABLES_RULES_PATH,),
+    }[service]
+
+
+def signature(service: str) -> str:
+    """What the service's files look like now, stored with every import and write."""
+    parts = [ENTRY_FORMAT]
+    for path in _source_paths(service):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append("-")
+    if service == "iptables":
+        parts.append(str(int(time.time() // IPTABLES_TTL)))
+    return ",".join(parts)
+
+
+# --- storage ---
+
+_local = threading.local()
+
+
+def db_path() -> str:
+    return os.environ.get(PATH_ENV) or str(resolve_config_dir() / DB_FILENAME)
+
+
+def _connect() -> sqlite3.Connection:
+    """This thread's connection to the registry (sqlite connections are not shared)."""
+    path = db_path()
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Everything in it can be re-imported from the native files.
+            conn.executescript("DROP TABLE IF EXISTS tunnels; DROP TABLE IF EXISTS bindings; DROP TABLE IF EXISTS sources;")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+        connections[path] = conn
+    return conn
+
+
+def _insert(conn: sqlite3.Connection, tunnels: Sequence[Tunnel], start: int) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO tunnels (service, key, position, port, destination, protocols, listed, entry, native)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (t.service, t.key, start + index, t.port, t.destination, t.protocols, int(t.listed), json.dumps(t.entry),
+             t.native)
+            for index, t in enumerate(tunnels)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO bindings (service, key, first, last) VALUES (?, ?, ?, ?)",
+        [(t.service, t.key, first, last) for t in tunnels for first, last in t.ports],
+    )
+
+
+def _store_signature(conn: sqlite3.Connection, service: str, value: str, base: str) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO sources (service, signature, imported_at, base) VALUES (?, ?, ?, ?)",
+        (service, value, time.time(), base),
+    )
+
+
+def _replace(conn: sqlite3.Connection, service: str) -> int:
+    value = signature(service)
+    base, tunnels = _import(service)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM tunnels WHERE service = ?", (service,))
+        conn.execute("DELETE FROM bindings WHERE service = ?", (service,))
+        _insert(conn, tunnels, 0)
+        _store_signature(conn, service, value, base)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return sum(t.listed for t in tunnels)
+
+
+def _stored_signature(conn: sqlite3.Connection, service: str) -> Optional[str]:
+    row = conn.execute("SELECT signature FROM sources WHERE service = ?", (service,)).fetchone()
+    return row[0] if row else None
+
+
+def _sync(conn: sqlite3.Connection, services: Iterable[str]) -> None:
+    for service in services:
+        if _stored_signature(conn, service) != signature(service):
+            _replace(conn, service)
+
+
+def sync(services: Iterable[str] = SERVICES) -> None:
+    """Re-import every service whose files changed since the registry last saw them."""
+    _sync(_connect(), services)
+
+
+def rebuild(services: Iterable[str] = SERVICES) -> Dict[str, int]:
+    """Re-import ``services`` from their native files; returns the tunnel count per service."""
+    conn = _connect()
+    return {service: _replace(conn, service) for service in services}
+
+
+def _document(conn: sqlite3.Connection, service: str, base: Optional[str] = None) -> Tuple[str, List[str]]:
+    """The service's stored ``base`` and its rows' natives in file order."""
+    if base is None:
+        row = conn.execute("SELECT base FROM sources WHERE service = ?", (service,)).fetchone()
+        base = row[0] if row else ""
+    rows = conn.execute("SELECT native FROM tunnels WHERE service = ? ORDER BY position", (service,))
+    return base, [row[0] for row in rows]
+
+
+def load(service: str) -> Any:
+    """The service's config built from its rows, for an action to edit.
+
+    The service is re-imported first if its files changed, so hand edits are
+    kept. Pass the edited config to :func:`write`. Raises ``FileNotFoundError``
+    when the service has no config file.
+    """
+    codec = CODECS[service]
+    path = codec.path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    try:
+        conn = _connect()
+    except (sqlite3.Error, OSError):
+        conn = None
+    if conn is not None:
+        try:
+            _sync(conn, (service,))
+            return codec.build(*_document(conn, service))
+        except sqlite3.Error:
+            pass
+    with open(path, "r") as f:
+        return codec.parse(f.read())
+
+
+def write(service: str, model: Any, validate: Optional[Validator] = None) -> None:
+    """Store an edited config in the registry and write the native file rendered from it.
+
+    Only rows whose text changed are described and rewritten; the rest just
+    move. The file is written inside the transaction, so a config that
+    ``validate`` rejects leaves the rows as they were.
+    """
+    codec = CODECS[service]
+    path = codec.path()
+    base, pieces = codec.split(model)
+    try:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+    except (sqlite3.Error, OSError):
+        write_file(path, codec.render(base, [native for _, native in pieces]), validate)
+        return
+    try:
+        stored = {
+            key: (position, native)
+            for key, position, native in conn.execute(
+                "SELECT key, position, native FROM tunnels WHERE service = ?", (service,)
+            )
+        }
+        wanted = {key for key, _ in pieces}
+        gone = [(service, key) for key in stored if key not in wanted]
+        conn.executemany("DELETE FROM tunnels WHERE service = ? AND key = ?", gone)
+        conn.executemany("DELETE FROM bindings WHERE service = ? AND key = ?", gone)
+        moved = []
+        for position, (key, native) in enumerate(pieces):
+            old = stored.get(key)
+            if old is None or old[1] != native:
+                conn.execute("DELETE FROM bindings WHERE service = ? AND key = ?", (service, key))
+                _insert(conn, [codec.describe(model, key, native)], position)
+            elif old[0] != position:
+                moved.append((position, service, key))
+        conn.executemany("UPDATE tunnels SET position = ? WHERE service = ? AND key = ?", moved)
+        write_file(path, codec.render(*_document(conn, service, base)), validate)
+        _store_signature(conn, service, signature(service), base)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        _rollback(conn)
+        # The file must still change; the stale rows are re-imported on the next read.
+        write_file(path, codec.render(base, [native for _, native in pieces]), validate)
+    except BaseException:
+        _rollback(conn)
+        raise
+
+
+def _rollback(conn: sqlite3.Connection) -> None:
+    try:
+        conn.execute("ROLLBACK")
+    except sqlite3.Error:
+        pass
+
+
+# --- queries ---
+
+# (db path, service) -> (stored signature, entries); decoding 10k JSON rows costs more than the query.
+_entries_cache: Dict[Tuple[str, str], Tuple[str, List[Dict[str, Any]]]] = {}
+
+
+def entries(service: str) -> List[Dict[str, Any]]:
+    """The service's tunnels in config order, as its ``list_*`` function reports them."""
+    try:
+        try:
+            conn = _connect()
+            _sync(conn, (service,))
+            stored = _stored_signature(conn, service)
+            cache_key = (db_path(), service)
+            cached = _entries_cache.get(cache_key)
+            if cached is not None and cached[0] == stored:
+                return list(cached[1])
+            rows = conn.execute(
+                "SELECT entry FROM tunnels WHERE service = ? AND listed ORDER BY position", (service,)
+            ).fetchall()
+            found = [json.loads(row[0]) for row in rows]
+            _entries_cache[cache_key] = (stored, found)
+            return list(found)
+        except (sqlite3.Error, OSError):
+            return [t.entry for t in IMPORTERS[service]() if t.listed]
+    except (OSError, ValueError):
+        return []
+
+
+def claims() -> List[Tuple[int, int, str]]:
+    """``(first, last, service)`` for every port range a backend's config forwards.
+
+    A service whose config cannot be read contributes nothing; the action that
+    owns it reports the error itself.
+    """
+    try:
+        conn = _connect()
+    except (sqlite3.Error, OSError):
+        conn = None
+    found: List[Tuple[int, int, str]] = []
+    for service in SERVICES:
+        try:
+            if conn is not None:
+                try:
+                    _sync(conn, (service,))
+                    found.extend(conn.execute(
+                        "SELECT first, last, service FROM bindings WHERE service = ?", (service,)
+                    ).fetchall())
+                    continue
+                except sqlite3.Error:
+                    pass
+            found.extend((first, last, service) for t in IMPORTERS[service]() for first, last in t.ports)
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return found
+
+
+def _imported(services: Iterable[str]) -> List[Tunnel]:
+    """Tunnels parsed straight from the native files, skipping services that cannot be read."""
+    found: List[Tunnel] = []
+    for service in services:
+        try:
+            found.extend(IMPORTERS[service]())
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return found
+
+
+def lookup(port: int) -> List[Dict[str, Any]]:
+    """Every tunnel listening on ``port``, with its service and key."""
+    try:
+        conn = _connect()
+        sync()
+        rows = conn.execute(
+            "SELECT t.service, t.key, t.destination, t.protocols, t.entry FROM bindings b"
+            " JOIN tunnels t ON t.service = b.service AND t.key = b.key"
+            " WHERE b.first <= ? AND b.last >= ? ORDER BY t.service, t.position",
+            (port, port),
+        ).fetchall()
+    except (sqlite3.Error, OSError):
+        return [
+            {"service": t.service, "key": t.key, "destination": t.destination, "protocols": t.protocols, "entry": t.entry}
+            for t in sorted(_imported(SERVICES), key=lambda t: t.service)
+            if any(first <= port <= last for first, last in t.ports)
+        ]
+    return [
+        {"service": service, "key": key, "destination": destination, "protocols": protocols, "entry": json.loads(entry)}
+        for service, key, destination, protocols, entry in rows
+    ]
+
+
+def tunnels(service: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Every registered tunnel (or one service's) with its ports, for ``registry list``.
+
+    A database that is locked, corrupt or read-only is bypassed: the tunnels
+    are then parsed from the native files, as :func:`entries` does.
+    """
+    services = (service,) if service else SERVICES
+    try:
+        conn = _connect()
+        sync(services)
+        query = "SELECT service, key, destination, protocols FROM tunnels WHERE listed"
+        params: Tuple[Any, ...] = ()
+        if service:
+            query += " AND service = ?"
+            params = (service,)
+        rows = conn.execute(query + " ORDER BY service, position", params).fetchall()
+        binding_query = "SELECT service, key, first, last FROM bindings" + (" WHERE service = ?" if service else "")
+        ports: Dict[Tuple[str, str], List[str]] = {}
+        for svc, key, first, last in conn.execute(binding_query, params):
+            ports.setdefault((svc, key), []).append(format_interval(first, last))
+    except (sqlite3.Error, OSError):
+        return [
+            {"service": t.service, "key": t.key, "ports": [format_interval(first, last) for first, last in t.ports],
+             "destination": t.destination, "protocols": t.protocols}
+            for t in sorted(_imported(services), key=lambda t: t.service) if t.listed
+        ]
+    return [
+        {"service": svc, "key": key, "ports": ports.get((svc, key), []), "destination": destination, "protocols": protocols}
+        for svc, key, destination, protocols in rows
+    ]
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""Coalesced service reloads.
+
+Without a scheduler, a mutating action reloads its service as soon as the
+config file is written; this is what a one-off CLI command does. Long-running
+processes (the Web UI and ``shifter daemon``) install a
+:class:`ReloadScheduler` instead. :func:`request` then only records that the
+service needs a reload. The scheduler waits until no further change has
+arrived for ``window`` seconds, but never more than ``max_delay`` after the
+first one. It then runs a single reload and resolves every waiting
+:class:`ReloadTicket` with the same :class:`ReloadOutcome`. If that reload
+fails and the last working config is restored, every change in the burst is
+rolled back together; the outcome lists them so each caller can say so.
+
+Reloads run under the same per-service lock as the actions, so a reload never
+reads a config file another action is half way through writing.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+from .results import ActionResult
+
+DEFAULT_WINDOW = 1.0
+WINDOW_ENV = "SHIFTER_RELOAD_WINDOW"
+
+# Returns False when the service did not come back up (see safe_write.reload_checked).
+ReloadFunc = Callable[[ActionResult], Optional[bool]]
+
+
+@dataclass
+class ReloadOutcome:
+    """Result of one coalesced reload, shared by every change it applied."""
+
+    service: str
+    success: bool
+    changes: int
+    seq: int
+    finished_at: float
+    details: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    # What each ticket changed, in request order, and whether a failed
+    # reload restored the last working config (undoing all of them).
+    applied: List[str] = field(default_factory=list)
+    rolled_back: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class ReloadTicket:
+    """A caller's claim on the reload that will apply its change."""
+
+    service: str
+    seq: int
+    future: "Future[ReloadOutcome]"
+    change: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"service": self.service, "ticket": self.seq, "change": self.change, "status": "pending"}
+
+
+class _Pending:
+    def __init__(self, reload_func: ReloadFunc, now: float):
+        self.reload_func = reload_func
+        self.first_at = now
+        self.tickets: List[ReloadTicket] = []
+        self.timer: Optional[threading.Timer] = None
+
+
+class ReloadScheduler:
+    """Debounce reload requests per service and run one reload per burst."""
+
+    def __init__(
+        self,
+        window: float = DEFAULT_WINDOW,
+        max_delay: Optional[float] = None,
+        lock_for: Optional[Callable[[str], ContextManager[Any]]] = None,
+        on_reload: Optional[Callable[[ReloadOutcome], None]] = None,
+    ):
+        self.window = max(window, 0.0)
+        self.max_delay = max_delay if max_delay is not None else max(self.window * 10, 5.0)
+        self._lock_for = lock_for or (lambda _service: contextlib.nullcontext())
+        self._on_reload = on_reload
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Pending] = {}
+        self._seq: Dict[str, int] = {}
+        self._last: Dict[str, ReloadOutcome] = {}
+        self._closed = False
+
+    def request(self, service: str, reload_func: ReloadFunc, change: str = "") -> ReloadTicket:
+        """Queue a reload of ``service`` and return the ticket it will resolve.
+
+        ``change`` describes the caller's change in failure reports.
+        """
+        now = time.monotonic()
+        with self._lock:
+            seq = self._seq.get(service, 0) + 1
+            self._seq[service] = seq
+            ticket = ReloadTicket(service, seq, Future(), change or f"{service} change #{seq}")
+            if self._closed:
+                run_now = True
+                pending = _Pending(reload_func, now)
+            else:
+                run_now = False
+                pending = self._pending.setdefault(service, _Pending(reload_func, now))
+                # The latest function wins; they only differ if a module was reloaded.
+                pending.reload_func = reload_func
+                if pending.timer is not None:
+                    pending.timer.cancel()
+                delay = min(self.window, max(pending.first_at + self.max_delay - now, 0.0))
+                pending.timer = threading.Timer(delay, self._fire, (service,))
+                pending.timer.daemon = True
+                pending.timer.start()
+            pending.tickets.append(ticket)
+        if run_now:
+            # Callers hold the service lock already; run inline without taking it.
+            self._run(service, pending, lock=False)
+        return ticket
+
+    def flush(self) -> None:
+        """Run every queued reload now (used at shutdown)."""
+        with self._lock:
+            services = list(self._pending)
+        for service in services:
+            self._fire(service)
+
+    def close(self) -> None:
+        """Flush queued reloads; later requests reload immediately."""
+        with self._lock:
+            self._closed = True
+        self.flush()
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """Return ``{service: {pending, requested, last}}`` for display and polling."""
+        with self._lock:
+            return {
+                service: {
+                    "pending": len(self._pending[service].tickets) if service in self._pending else 0,
+                    "requested": seq,
+                    "last": self._last[service].to_dict() if service in self._last else None,
+                }
+                for service, seq in self._seq.items()
+            }
+
+    def _fire(self, service: str) -> None:
+        with self._lock:
+            pending = self._pending.pop(service, None)
+            if pending is None:
+                return
+            if pending.timer is not None:
+                pending.timer.cancel()
+        self._run(service, pending)
+
+    def _run(self, service: str, pending: _Pending, lock: bool = True) -> None:
+        result = ActionResult()
+        try:
+            with self._lock_for(service) if lock else contextlib.nullcontext():
+                success = pending.reload_func(result) is not False
+        except Exception as exc:  # keep the tickets resolvable whatever the reload does
+            result.warn(f"Reload of {service} crashed: {exc}")
+            success = False
+        outcome = ReloadOutcome(
+            service=service,
+            success=success,
+            changes=len(pending.tickets),
+            seq=max(ticket.seq for ticket in pending.tickets),
+            finished_at=time.time(),
+            details=result.details,
+            errors=result.errors,
+            applied=[ticket.change for ticket in pending.tickets],
+            rolled_back=not success and bool(result.data.get("restored")),
+        )
+        with self._lock:
+            self._last[service] = outcome
+        for ticket in pending.tickets:
+            ticket.future.set_result(outcome)
+        if self._on_reload is not None:
+            self._on_reload(outcome)
+
+
+def window_from_env(default: float = DEFAULT_WINDOW) -> float:
+    """Return the reload window configured through ``SHIFTER_RELOAD_WINDOW``."""
+    try:
+        return max(float(os.environ.get(WINDOW_ENV, default)), 0.0)
+    except ValueError:
+        return default
+
+
+_scheduler: Optional[ReloadScheduler] = None
+_local = threading.local()
+
+
+def install(scheduler: Optional[ReloadScheduler]) -> Optional[ReloadScheduler]:
+    """Make ``scheduler`` handle every reload request; returns the previous one."""
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    return previous
+
+
+def current() -> Optional[ReloadScheduler]:
+    return _scheduler
+
+
+def request(service: str, result: ActionResult, reload_func: ReloadFunc) -> bool:
+    """Reload ``service`` now, or queue a coalesced reload when a scheduler is installed.
+
+    Returns False only when an immediate reload failed; a queued reload
+    reports through its ticket instead.
+    """
+    scheduler = _scheduler
+    if scheduler is None:
+        return reload_func(result) is not False
+    ticket = scheduler.request(service, reload_func, getattr(_local, "change", ""))
+    result.step(f"Reload of {service} queued; changes within {scheduler.window:g}s are applied together.")
+    tickets = getattr(_local, "tickets", None)
+    if tickets is not None:
+        tickets.append(ticket)
+    return True
+
+
+@contextlib.contextmanager
+def collecting(change: str = "") -> Iterator[List[ReloadTicket]]:
+    """Collect the tickets queued by actions run on this thread inside the block.
+
+    ``change`` labels those tickets, so a failed reload can name what it undid.
+    """
+    previous = getattr(_local, "tickets", None), getattr(_local, "change", "")
+    _local.tickets, _local.change = [], change
+    try:
+        yield _local.tickets
+    finally:
+        _local.tickets, _local.change = previous
+
+
+def wait(result: ActionResult, tickets: List[ReloadTicket], timeout: Optional[float] = None) -> ActionResult:
+    """Block until the tickets' reloads ran and report them on ``result``.
+
+    A change that was written but whose reload failed fails the result. When
+    the reload restored the last working config, the change was rolled back
+    along with every other change coalesced into that reload; those are named.
+    """
+    outcomes = []
+    for ticket in tickets:
+        outcome = ticket.future.result(timeout)
+        outcomes.append(outcome.to_dict())
+        for line in outcome.details:
+            result.step(line)
+        for line in outcome.errors:
+            result.warn(line)
+        if outcome.success:
+            result.step(f"{outcome.service} reloaded; {outcome.changes} change(s) went live together.")
+        elif result.success:
+            result.fail(f"{result.message} {failure_text(outcome, ticket.change)}".strip())
+    if outcomes:
+        result.data["reload"] = outcomes
+    return result
+
+
+def failure_text(outcome: ReloadOutcome, change: str = "") -> str:
+    """Explain a failed reload to the owner of ``change`` (one of ``outcome.applied``)."""
+    if not outcome.rolled_back:
+        return f"The {outcome.service} reload failed; the change is written but {outcome.service} is not running it."
+    others = list(outcome.applied)
+    if change in others:
+        others.remove(change)
+    text = f"The {outcome.service} reload failed and the last working config was restored, so this change was rolled back."
+    if others:
+        text += f" Rolled back with it: {'; '.join(others)}."
+    return text
+
+
+def pending(result: ActionResult, tickets: List[ReloadTicket]) -> ActionResult:
+    """Report queued tickets on ``result`` without waiting for them."""
+    if tickets:
+        result.data["reload"] = [ticket.to_dict() for ticket in tickets]
+    return result
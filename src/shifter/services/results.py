@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""Structured outcomes returned by the service actions.
+
+Service functions report progress and errors through an :class:`ActionResult`
+instead of printing, so the CLI, the Web UI and any other caller can render
+the same outcome in their own way.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List
+
+
+@dataclass
+class ActionResult:
+    """Outcome of a service action.
+
+    ``details`` collects progress lines in order, ``errors`` collects non-fatal
+    problems such as a helper command that failed, and ``message`` is the final
+    summary. ``success`` is False only when the action itself did not complete.
+    """
+
+    success: bool = True
+    message: str = ""
+    details: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def step(self, line: str) -> None:
+        """Record a progress line."""
+        self.details.append(line)
+
+    def warn(self, line: str) -> None:
+        """Record a non-fatal error."""
+        self.errors.append(line)
+
+    def ok(self, message: str) -> "ActionResult":
+        self.success = True
+        self.message = message
+        return self
+
+    def fail(self, message: str) -> "ActionResult":
+        self.success = False
+        self.message = message
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def text(self) -> str:
+        """Render every line as plain text (details, errors, then the summary)."""
+        lines = [*self.details, *self.errors]
+        if self.message:
+            lines.append(self.message)
+        return "\n".join(lines)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""Validated, atomic config writes with rollback to the last working file.
+
+:func:`write_file` renders the new content to a temp file next to the target
+and fsyncs it. It then hands the temp file to a validator (``haproxy -c``,
+``xray run -test`` or ``systemd-analyze verify``) and only renames it into
+place if the validator accepts it. A crash or a rejected config therefore
+leaves the old file untouched; readers never see a half-written one.
+
+:func:`reload_checked` wraps a service reload. When the service is still
+running afterwards, the file is copied to ``<path>.last-good``. When it is
+not, that copy is restored and the service restarted, so a config that passed
+validation but still broke the daemon does not keep the tunnels down.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Optional
+
+from . import systemd
+from .commands import run_command
+from .config import XRAY_BINARY_PATH
+from .results import ActionResult
+
+GOOD_SUFFIX = ".last-good"
+VALIDATE_TIMEOUT = 30.0
+
+Validator = Callable[[str], None]
+
+
+class ValidationError(Exception):
+    """The new content was rejected; the file on disk is unchanged."""
+
+
+def _fsync_dir(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_file(path: str, content: str, validate: Optional[Validator] = None, mode: Optional[int] = None) -> None:
+    """Atomically replace ``path`` with ``content`` once ``validate`` accepts it.
+
+    Raises ValidationError or OSError; on either, ``path`` is left as it was.
+    The file keeps its mode and owner unless ``mode`` is given.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    # Keep the extension: xray picks the config format from it.
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{base}.", suffix=f".tmp{ext}")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        os.chmod(tmp, mode if mode is not None else (current.st_mode & 0o7777 if current else 0o644))
+        if current is not None:
+            try:
+                os.chown(tmp, current.st_uid, current.st_gid)
+            except OSError:
+                pass
+        if validate is not None:
+            validate(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+
+# --- validators: raise ValidationError; a missing tool skips the check ---
+
+def _check(command, what: str) -> None:
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=VALIDATE_TIMEOUT)
+    except FileNotFoundError:
+        return
+    except subprocess.TimeoutExpired:
+        raise ValidationError(f"{what} validation timed out after {VALIDATE_TIMEOUT:g}s.")
+    if completed.returncode != 0:
+        output = (completed.stderr or completed.stdout).strip()
+        raise ValidationError(f"{what} rejected the new configuration:\n{output}")
+
+
+def check_haproxy(path: str) -> None:
+    _check(["haproxy", "-c", "-f", path], "HAProxy")
+
+
+def check_xray(path: str) -> None:
+    _check([XRAY_BINARY_PATH, "run", "-test", "-config", path], "Xray")
+
+
+def check_unit(path: str, unit_name: str) -> None:
+    """Verify a unit file; systemd derives the unit name from the file name, so check a named copy."""
+    with tempfile.TemporaryDirectory(prefix="shifter-unit-") as directory:
+        named = os.path.join(directory, unit_name)
+        shutil.copyfile(path, named)
+        _check(["systemd-analyze", "verify", named], unit_name)
+
+
+# --- last known good copies and rollback ---
+
+def remember_good(path: str) -> None:
+    """Record ``path`` as the config the service last ran with successfully."""
+    try:
+        with open(path, "r") as f:
+            write_file(path + GOOD_SUFFIX, f.read())
+    except OSError:
+        pass
+
+
+def ensure_good(path: str, service: str) -> None:
+    """Keep the running config as the rollback point if none was recorded yet.
+
+    Call before the first write; it only costs a ``systemctl show`` once.
+    """
+    if not os.path.exists(path + GOOD_SUFFIX) and os.path.exists(path) and systemd.is_active(service):
+        remember_good(path)
+
+
+def reload_checked(
+    result: ActionResult,
+    service: str,
+    path: str,
+    reload_func: Callable[[ActionResult], None],
+    settle: float = 0.0,
+) -> bool:
+    """Run ``reload_func`` and roll ``path`` back if ``service`` is not running afterwards.
+
+    ``settle`` gives services that may die after acknowledging a reload or a
+    restart (GOST's SIGHUP, Type=simple units) time to do so before the check.
+    """
+    reload_func(result)
+    if settle:
+        time.sleep(settle)
+    if systemd.is_active(service):
+        remember_good(path)
+        return True
+    good = path + GOOD_SUFFIX
+    if not os.path.exists(good):
+        result.warn(f"{service} is not running after the change and there is no earlier working config to restore.")
+        return False
+    result.warn(f"{service} is not running after the change; restoring the last working {path}.")
+    try:
+        with open(good, "r") as f:
+            write_file(path, f.read())
+    except OSError as e:
+        result.warn(f"Could not restore {path}: {e}")
+        return False
+    # Tells a coalesced reload that every change it carried was undone.
+    result.data["restored"] = True
+    run_command(["sudo", "systemctl", "restart", service], result)
+    if systemd.is_active(service):
+        result.warn(f"{service} is running again on the restored config.")
+    else:
+        result.warn(f"{service} did not start with the restored config either.")
+    return False
+
+
+def rolled_back(result: ActionResult, service: str) -> ActionResult:
+    """Fail an action whose change was undone by :func:`reload_checked`."""
+    return result.fail(f"{service} did not stay up with the change; the last working configuration was restored if one was recorded.")
@@ -1,106 +1,56 @@
 #!/usr/bin/env python3
 
+"""Status collection for the managed services.
+
+Every probe is a coroutine so the web server can await them without blocking
+the event loop. The synchronous helpers used by the CLI wrap the same engine,
+so a full host check costs roughly as much as its slowest probe. With
+``probe_rounds`` set, destination reachability checks (see services.probes)
+run alongside and their summaries land under each service's ``probes`` key.
+"""
+
 import os
-import subprocess
-import re
 import json
-import sys
+import asyncio
 from collections import defaultdict
-from .config import GOST_SERVICE_PATH, HAPROXY_CONFIG_PATH, XRAY_CONFIG_PATH
-from .system_info import get_system_info
+from .config import GOST_CONFIG_PATH, GOST_SERVICE_PATH, HAPROXY_CONFIG_PATH, XRAY_CONFIG_PATH
+from .system_info import get_persistence_info
+from . import gost_config, haproxy, haproxy_config, iptables_nat, probes, systemd, xray_stats
+from .xray_api import XrayAPIError
 
-def _run_command(command, **kwargs):
-    try:
-        return subprocess.run(command, check=True, text=True, capture_output=True, **kwargs)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return None
+# Upper bound, in seconds, for any single probe (the systemctl snapshot or an iptables-save fork).
+PROBE_TIMEOUT = 5.0
+# Pause between destination probe rounds when ``probe_rounds`` > 1.
+PROBE_ROUND_INTERVAL = 0.5
 
-def _get_iptables_persistence_info():
-    """Helper moved here to be self-contained."""
-    info = get_system_info()
-    if info['package_manager'] == 'apt':
-        return {'package': 'iptables-persistent', 'service': 'netfilter-persistent'}
-    elif info['package_manager'] in ['dnf', 'yum']:
-        return {'package': 'iptables-services', 'service': 'iptables'}
-    else:
-        return {'package': 'iptables-persistent', 'service': 'iptables'}
-
-def _get_systemd_status(service_name):
-    status = {'active': 'inactive', 'enabled': 'disabled'}
+async def _systemd_snapshot(units, timeout=PROBE_TIMEOUT):
+    """Fetches the state of every unit in one systemctl round trip."""
     try:
-        active_result = subprocess.run(
-            ["systemctl", "is-active", "--quiet", service_name],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        if active_result.returncode == 0:
-            status['active'] = 'active'
-        
-        enabled_result = subprocess.run(
-            ["systemctl", "is-enabled", "--quiet", service_name],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        if enabled_result.returncode == 0:
-            status['enabled'] = 'enabled'
-    except FileNotFoundError:
-        print("Warning: systemctl not found.", file=sys.stderr)
-        status = {'active': 'unknown', 'enabled': 'unknown'}
-    return status
-
-def get_gost_status():
-    status = _get_systemd_status('gost')
+        snapshot = await systemd.query_units_async(units, timeout)
+    except (FileNotFoundError, asyncio.TimeoutError):
+        return {}
+    return {unit: systemd.to_status(properties) for unit, properties in snapshot.items()}
+
+def _read_gost_details():
     details = []
-    if os.path.exists(GOST_SERVICE_PATH):
-        try:
-            with open(GOST_SERVICE_PATH, 'r') as f:
-                content = f.read()
-            exec_line = re.search(r"^ExecStart=.*$", content, re.MULTILINE)
-            if exec_line:
-                rules_map = defaultdict(set)
-                found_rules = re.findall(r'-L=(tcp|udp)://:(\d+)/([^ ]+)', exec_line.group(0))
-                for proto, port, dest in found_rules:
-                    rules_map[(port, dest)].add(proto.upper())
-                
-                for (port, dest), protos in sorted(rules_map.items()):
-                    proto_str = "/".join(sorted(list(protos)))
-                    details.append(f"{proto_str} Port {port} -> {dest}")
-        except IOError:
-            details.append("Error reading service file.")
-    status['details'] = details
-    return status
+    try:
+        for rule in gost_config.read_rules(GOST_CONFIG_PATH, GOST_SERVICE_PATH):
+            details.append(f"{rule['protocols']} Port {rule['port']} -> {rule['domain']}")
+    except (IOError, ValueError):
+        details.append("Error reading GOST configuration.")
+    return details
 
-def get_haproxy_status():
-    status = _get_systemd_status('haproxy')
+def _read_haproxy_details():
     details = []
     if os.path.exists(HAPROXY_CONFIG_PATH):
         try:
-            with open(HAPROXY_CONFIG_PATH, 'r') as f:
-                content = f.read()
-            
-            frontend_pattern = re.compile(r"frontend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
-            backend_pattern = re.compile(r"backend\s+([^\s]+)\n(.*?)(?=\nfrontend|\nbackend|\Z)", re.DOTALL)
-            frontends = {m.group(1): m.group(2) for m in frontend_pattern.finditer(content)}
-            backends = {m.group(1): m.group(2) for m in backend_pattern.finditer(content)}
-
-            for fe_name, fe_config in frontends.items():
-                bind_match = re.search(r"bind\s+.*?:(\d+)", fe_config)
-                backend_match = re.search(r"default_backend\s+([^\s]+)", fe_config)
-                port = bind_match.group(1) if bind_match else "N/A"
-                be_name = backend_match.group(1) if backend_match else "N/A"
-                destination = "N/A"
-                if be_name in backends:
-                    server_match = re.search(r"server\s+\w+\s+([^\s]+)", backends[be_name])
-                    if server_match:
-                        destination = server_match.group(1)
-                details.append(f"Port {port} ({fe_name}) -> {destination}")
+            for tunnel in haproxy_config.load(HAPROXY_CONFIG_PATH).tunnels():
+                details.append(f"Port {tunnel['port']} ({tunnel['frontend']}) -> {haproxy.describe_servers(tunnel)}")
         except IOError:
             details.append("Error reading config file.")
-    status['details'] = sorted(details)
-    return status
+    return sorted(details)
 
-def get_xray_status():
-    status = _get_systemd_status('xray')
+def _read_xray_details():
     details = []
     if os.path.exists(XRAY_CONFIG_PATH):
         try:
@@ -121,47 +71,133 @@ def get_xray_status():
                      details.append(f"Port {port} ({tag}) -> Protocol: {protocol}")
         except (json.JSONDecodeError, IOError):
             details.append("Error reading config file.")
-    status['details'] = sorted(details)
-    return status
+    return sorted(details)
 
-def get_iptables_status():
-    """Gathers status and port forwarding rules from iptables."""
-    persistence = _get_iptables_persistence_info()
-    status = _get_systemd_status(persistence['service'])
+def _format_iptables_details(table):
     details = []
-    
-    iptables_result = _run_command(["sudo", "iptables-save"])
-    if iptables_result:
-        rules_map = defaultdict(set)
-        for line in iptables_result.stdout.splitlines():
-            if "-A PREROUTING" in line and "-j DNAT" in line:
-                proto_match = re.search(r"-p\s+(tcp|udp)", line)
-                dports_match = re.search(r"--dports\s+([\d,]+)", line)
-                dest_match = re.search(r"--to-destination\s+([\d\.]+)", line)
-
-                if proto_match and dports_match and dest_match:
-                    protocol = proto_match.group(1).upper()
-                    dports = dports_match.group(1)
-                    dest_ip = dest_match.group(1)
-                    for port in dports.split(','):
-                        rules_map[(port, dest_ip)].add(protocol)
-        
-        for (port, dest_ip), protos in sorted(rules_map.items()):
-            proto_str = "/".join(sorted(list(protos)))
-            details.append(f"Port(s) {port} ({proto_str}) -> {dest_ip}")
-
-    status['details'] = details
-    return status
-
-def get_all_services_status():
+    rules_map = defaultdict(set)
+    for record in table.forwards():
+        for port in record.port_labels():
+            rules_map[(port, record.destination)].add(record.proto.upper())
+
+    for (port, destination), protos in sorted(rules_map.items()):
+        proto_str = "/".join(sorted(list(protos)))
+        details.append(f"Port(s) {port} ({proto_str}) -> {destination}")
+    return details
+
+async def _iptables_rules(timeout):
+    table = await asyncio.to_thread(iptables_nat.load, "ipv4", timeout)
+    return _format_iptables_details(table) if table is not None else []
+
+_DETAIL_PROBES = {
+    'gost': lambda timeout: asyncio.to_thread(_read_gost_details),
+    'haproxy': lambda timeout: asyncio.to_thread(_read_haproxy_details),
+    'xray': lambda timeout: asyncio.to_thread(_read_xray_details),
+    'iptables': _iptables_rules,
+}
+
+def _read_xray_traffic():
+    """Per-inbound counters from the Xray StatsService, or None if unavailable."""
+    try:
+        return xray_stats.collect()
+    except XrayAPIError:
+        return None
+
+# Extra probes whose result is stored under its own key of the status dict.
+_EXTRA_PROBES = {
+    'xray': ('traffic', lambda timeout: asyncio.to_thread(_read_xray_traffic)),
+}
+
+async def _guarded_extra(service, timeout):
+    try:
+        return await asyncio.wait_for(_EXTRA_PROBES[service][1](timeout), timeout)
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return None
+
+def _unit_name(service):
+    if service == 'iptables':
+        return get_persistence_info()['service']
+    return service
+
+async def _guarded_details(service, timeout):
+    """Runs one detail probe, turning timeouts and crashes into a message."""
+    try:
+        return await asyncio.wait_for(_DETAIL_PROBES[service](timeout), timeout)
+    except asyncio.TimeoutError:
+        return [f"Status probe timed out after {timeout:g}s."]
+    except (OSError, KeyError) as e:
+        return [f"Status probe failed: {e}"]
+
+async def _destination_probes(services, rounds):
+    if not rounds:
+        return None
+    try:
+        return await probes.ProbeEngine().sample(rounds, PROBE_ROUND_INTERVAL, services)
+    except (OSError, ValueError):
+        return None
+
+async def _collect_status(services, timeout=PROBE_TIMEOUT, probe_rounds=0):
+    """Fills the status dicts of ``services`` from one systemd snapshot plus
+    their configuration probes, all running concurrently."""
+    units = {}
+    for service in services:
+        try:
+            units[service] = _unit_name(service)
+        except (OSError, KeyError):
+            units[service] = None
+    extras = [service for service in services if service in _EXTRA_PROBES]
+    snapshot, destinations, *details = await asyncio.gather(
+        _systemd_snapshot([unit for unit in units.values() if unit], timeout),
+        _destination_probes(services, probe_rounds),
+        *(_guarded_details(service, timeout) for service in services),
+        *(_guarded_extra(service, timeout) for service in extras),
+    )
+    details, extra_values = details[:len(services)], dict(zip(extras, details[len(services):]))
+    results = {}
+    for service, service_details in zip(services, details):
+        status = dict(snapshot.get(units[service]) or systemd.UNKNOWN_STATUS)
+        status['details'] = service_details
+        if extra_values.get(service) is not None:
+            status[_EXTRA_PROBES[service][0]] = extra_values[service]
+        if destinations is not None:
+            status['probes'] = destinations.get(service, [])
+        results[service] = status
+    return results
+
+async def probe_gost_status(timeout=PROBE_TIMEOUT, probe_rounds=0):
+    return (await _collect_status(['gost'], timeout, probe_rounds))['gost']
+
+async def probe_haproxy_status(timeout=PROBE_TIMEOUT, probe_rounds=0):
+    return (await _collect_status(['haproxy'], timeout, probe_rounds))['haproxy']
+
+async def probe_xray_status(timeout=PROBE_TIMEOUT, probe_rounds=0):
+    return (await _collect_status(['xray'], timeout, probe_rounds))['xray']
+
+async def probe_iptables_status(timeout=PROBE_TIMEOUT, probe_rounds=0):
+    """Gathers status and port forwarding rules from iptables."""
+    return (await _collect_status(['iptables'], timeout, probe_rounds))['iptables']
+
+async def gather_all_services_status(timeout=PROBE_TIMEOUT, probe_rounds=0):
+    """Runs every service probe at once and returns a single dictionary."""
+    return await _collect_status(list(_DETAIL_PROBES), timeout, probe_rounds)
+
+def get_gost_status(probe_rounds=0):
+    return asyncio.run(probe_gost_status(probe_rounds=probe_rounds))
+
+def get_haproxy_status(probe_rounds=0):
+    return asyncio.run(probe_haproxy_status(probe_rounds=probe_rounds))
+
+def get_xray_status(probe_rounds=0):
+    return asyncio.run(probe_xray_status(probe_rounds=probe_rounds))
+
+def get_iptables_status(probe_rounds=0):
+    """Gathers status and port forwarding rules from iptables."""
+    return asyncio.run(probe_iptables_status(probe_rounds=probe_rounds))
+
+def get_all_services_status(probe_rounds=0):
     """Orchestrates all detailed status checks and returns a single dictionary."""
-    return {
-        'gost': get_gost_status(),
-        'haproxy': get_haproxy_status(),
-        'xray': get_xray_status(),
-        'iptables': get_iptables_status(),
-    }
+    return asyncio.run(gather_all_services_status(probe_rounds=probe_rounds))
 
 if __name__ == '__main__':
     status_data = get_all_services_status()
-    print(json.dumps(status_data, indent=4))
\ No newline at end of file
+    print(json.dumps(status_data, indent=4))
@@ -1,41 +1,123 @@
 #!/usr/bin/env python3
 
-import platform
+"""Host facts: distribution, package manager and iptables persistence service.
+
+They cannot change while a process runs, so they are detected once per process.
+Set ``SHIFTER_HOST_CACHE=1`` to also keep them in ``host_facts.json`` in the
+config directory. That entry is keyed on the mtimes of the release files, so
+an OS upgrade invalidates it.
+"""
+
+import json
 import os
+import platform
+import threading
 
-def get_system_info():
-    system_info = {}
-    
+from .config import resolve_config_dir
+
+RELEASE_FILES = ('/etc/redhat-release', '/etc/os-release')
+CACHE_ENV = "SHIFTER_HOST_CACHE"
+CACHE_FILENAME = "host_facts.json"
+
+_lock = threading.Lock()
+_facts = None
+
+def _detect_distro():
     if os.path.exists('/etc/redhat-release'):
         with open('/etc/redhat-release') as f:
             release_info = f.read()
             if "Rocky" in release_info:
-                distro_id = "rocky"
+                return "rocky"
             elif "AlmaLinux" in release_info:
-                distro_id = "almalinux"
-            else:
-                distro_id = "centos"
+                return "almalinux"
+            return "centos"
     elif os.path.exists('/etc/os-release'):
         with open('/etc/os-release') as f:
             lines = f.readlines()
             info_dict = dict(line.strip().split('=', 1) for line in lines if '=' in line)
-            distro_id = info_dict.get('ID', '').strip('"')
-    else:
-        distro_id = platform.system().lower()
+            return info_dict.get('ID', '').strip('"')
+    return platform.system().lower()
 
+def _detect(distro_id):
+    facts = {'distro': distro_id, 'package_manager': None, 'service_manager': None}
     if distro_id in ["ubuntu", "debian"]:
-        system_info['package_manager'] = "apt"
-        system_info['service_manager'] = "systemctl"
+        facts['package_manager'] = "apt"
+        facts['service_manager'] = "systemctl"
     elif distro_id in ["rocky", "almalinux", "fedora"]:
-        system_info['package_manager'] = "dnf"
-        system_info['service_manager'] = "systemctl"
+        facts['package_manager'] = "dnf"
+        facts['service_manager'] = "systemctl"
     elif distro_id == "centos":
-        system_info['package_manager'] = "yum"
-        system_info['service_manager'] = "systemctl"
+        facts['package_manager'] = "yum"
+        facts['service_manager'] = "systemctl"
+
+    if facts['package_manager'] == 'apt':
+        facts['persistence'] = {'package': 'iptables-persistent', 'service': 'netfilter-persistent'}
+    elif facts['package_manager'] in ['dnf', 'yum']:
+        facts['persistence'] = {'package': 'iptables-services', 'service': 'iptables'}
     else:
-        raise OSError(f"Unsupported OS: {distro_id}")
+        facts['persistence'] = {'package': 'iptables-persistent', 'service': 'iptables'}
+    return facts
+
+def _release_signature():
+    signature = []
+    for path in RELEASE_FILES:
+        try:
+            signature.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return signature
+
+def _load_from_disk(path, signature):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('signature') != signature:
+        return None
+    return cached.get('facts')
+
+def _save_to_disk(path, signature, facts):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'signature': signature, 'facts': facts}, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def host_facts():
+    """Returns the detected facts, computing them at most once per process."""
+    global _facts
+    with _lock:
+        if _facts is None:
+            use_disk = os.environ.get(CACHE_ENV, "").lower() in {"1", "true", "yes"}
+            path = str(resolve_config_dir() / CACHE_FILENAME)
+            signature = _release_signature()
+            facts = _load_from_disk(path, signature) if use_disk else None
+            if facts is None:
+                facts = _detect(_detect_distro())
+                if use_disk:
+                    _save_to_disk(path, signature, facts)
+            _facts = facts
+        return _facts
+
+def clear_cache():
+    """Forgets the facts detected by this process (the on-disk entry validates itself)."""
+    global _facts
+    with _lock:
+        _facts = None
+
+def get_system_info():
+    facts = host_facts()
+    if facts['package_manager'] is None:
+        raise OSError(f"Unsupported OS: {facts['distro']}")
+    return {'package_manager': facts['package_manager'], 'service_manager': facts['service_manager']}
 
-    return system_info
+def get_persistence_info():
+    """Returns the iptables persistence package and service name for this OS."""
+    return dict(host_facts()['persistence'])
 
 if __name__ == '__main__':
     try:
@@ -43,4 +125,4 @@ if __name__ == '__main__':
         print(f"Package Manager: {info['package_manager']}")
         print(f"Service Manager: {info['service_manager']}")
     except OSError as e:
-        print(e)
\ No newline at end of file
+        print(e)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""Batched systemd unit state queries.
+
+A single ``systemctl show`` call answers every question Shifter asks about its
+units (active/enabled state, main PID, restart count and resource accounting),
+instead of one ``is-active``/``is-enabled`` fork per unit and question.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional
+
+UNIT_PROPERTIES = (
+    "Id",
+    "LoadState",
+    "ActiveState",
+    "SubState",
+    "UnitFileState",
+    "MainPID",
+    "NRestarts",
+    "MemoryCurrent",
+    "CPUUsageNSec",
+)
+
+# Unit file states for which ``systemctl is-enabled`` exits successfully.
+ENABLED_STATES = frozenset({
+    "enabled",
+    "enabled-runtime",
+    "static",
+    "alias",
+    "indirect",
+    "generated",
+    "transient",
+})
+
+# Active states for which ``systemctl is-active`` exits successfully.
+ACTIVE_STATES = frozenset({"active", "reloading"})
+
+UNKNOWN_STATUS: Dict[str, Any] = {"active": "unknown", "enabled": "unknown"}
+
+
+def show_command(units: Iterable[str]) -> List[str]:
+    """Return the ``systemctl show`` invocation covering all ``units``."""
+    return ["systemctl", "show", f"--property={','.join(UNIT_PROPERTIES)}", "--", *units]
+
+
+def parse_show_output(output: str, units: List[str]) -> Dict[str, Dict[str, str]]:
+    """Split ``systemctl show`` output into one property dict per requested unit.
+
+    systemd prints one block per unit, separated by blank lines, in the order
+    the units were given on the command line.
+    """
+    blocks: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append(current)
+                current = {}
+            continue
+        key, _, value = line.partition("=")
+        current[key] = value
+    if current:
+        blocks.append(current)
+    return dict(zip(units, blocks))
+
+
+def _int_or_none(value: Optional[str]) -> Optional[int]:
+    # Accounting properties read "[not set]" when accounting is disabled.
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def to_status(properties: Dict[str, str]) -> Dict[str, Any]:
+    """Convert raw unit properties into Shifter's status dictionary."""
+    if not properties:
+        return dict(UNKNOWN_STATUS)
+    main_pid = _int_or_none(properties.get("MainPID"))
+    return {
+        "active": "active" if properties.get("ActiveState") in ACTIVE_STATES else "inactive",
+        "enabled": "enabled" if properties.get("UnitFileState") in ENABLED_STATES else "disabled",
+        "sub_state": properties.get("SubState") or "unknown",
+        "main_pid": main_pid or None,
+        "restarts": _int_or_none(properties.get("NRestarts")),
+        "memory_bytes": _int_or_none(properties.get("MemoryCurrent")),
+        "cpu_nsec": _int_or_none(properties.get("CPUUsageNSec")),
+    }
+
+
+def query_units(units: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Dict[str, str]]:
+    """Fetch the properties of every unit in one ``systemctl show`` call.
+
+    Raises FileNotFoundError when systemctl is missing and
+    subprocess.TimeoutExpired when it does not answer within ``timeout``.
+    """
+    unit_list = list(units)
+    if not unit_list:
+        return {}
+    result = subprocess.run(
+        show_command(unit_list),
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    return parse_show_output(result.stdout, unit_list)
+
+
+async def query_units_async(units: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Dict[str, str]]:
+    """Asyncio counterpart of :func:`query_units` for use inside the event loop."""
+    unit_list = list(units)
+    if not unit_list:
+        return {}
+    process = await asyncio.create_subprocess_exec(
+        *show_command(unit_list),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return parse_show_output(stdout.decode(errors="replace"), unit_list)
+
+
+def get_unit_statuses(units: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """Return status dictionaries for ``units`` from a single snapshot."""
+    unit_list = list(units)
+    try:
+        snapshot = query_units(unit_list, timeout)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        snapshot = {}
+    return {unit: to_status(snapshot.get(unit, {})) for unit in unit_list}
+
+
+def is_active(unit: str) -> bool:
+    """Return True when ``unit`` is running, mirroring ``systemctl is-active``."""
+    return get_unit_statuses([unit])[unit]["active"] == "active"
@@ -2,137 +2,245 @@
 
 import os
 import json
-import subprocess
-import re
-import sys
 from .config import XRAY_CONFIG_PATH, load_json_template
+from . import bulk, ports, registry, reload, safe_write, systemd
+from .commands import run_command
+from .results import ActionResult
+from .xray_api import XrayAPIClient, XrayAPIError, api_address
 
-def _run_command(command, **kwargs):
-    try:
-        return subprocess.run(command, check=True, text=True, **kwargs)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error executing command: {' '.join(command if isinstance(command, list) else command)}\n{e}", file=sys.stderr)
-        return None
+BULK_ADD_FIELDS = (("address", str), ("port", bulk.port))
+BULK_REMOVE_FIELDS = (("port", bulk.port),)
+# systemctl restart returns once Xray is forked; give a bad config time to kill it.
+RESTART_SETTLE_SECONDS = 1.0
 
 def is_xray_active():
-    result = subprocess.run(["systemctl", "is-active", "--quiet", "xray"])
-    return result.returncode == 0
+    return systemd.is_active("xray")
+
+def _load_config():
+    """Returns config.json as the tunnel registry holds it (see services.registry)."""
+    return registry.load("xray")
+
+def _write_config(config_data):
+    """Stores the config in the tunnel registry and replaces config.json with the file
+    rendered from it, validated with ``xray run -test`` (see services.safe_write)."""
+    safe_write.ensure_good(XRAY_CONFIG_PATH, "xray")
+    registry.write("xray", config_data, safe_write.check_xray)
+
+def _apply_live(result, config_data, added=(), removed=()):
+    """Applies inbound changes through the running instance's HandlerService.
+
+    config.json has already been written; restart only if the API is unreachable
+    or rejects the change, so existing relay connections survive normal edits.
+    Returns False when a restart was needed and the change was rolled back.
+    """
+    removed_tags = [inbound.get('tag') for inbound in removed]
+    if None in removed_tags:
+        result.warn("An inbound without a tag cannot be removed live.")
+    else:
+        client = XrayAPIClient(api_address(config_data))
+        try:
+            if not client.is_available():
+                raise XrayAPIError(f"Xray API at {client.server} is unreachable.")
+            client.remove_inbounds(removed_tags)
+            client.add_inbounds(list(added))
+            result.step(f"Applied {len(added)} added and {len(removed_tags)} removed inbound(s) through the Xray API.")
+            safe_write.remember_good(XRAY_CONFIG_PATH)
+            return True
+        except XrayAPIError as e:
+            result.warn(str(e))
+    return reload.request("xray", result, _restart_xray)
+
+def _restart_xray(result):
+    """Restart, restoring the last working config.json if Xray does not stay up."""
+    return safe_write.reload_checked(result, "xray", XRAY_CONFIG_PATH, _restart_now, settle=RESTART_SETTLE_SECONDS)
+
+def _restart_now(result):
+    result.step("Restarting Xray to apply the configuration...")
+    run_command(["sudo", "systemctl", "restart", "xray"], result)
 
 def install_xray(address, port):
+    result = ActionResult()
+    conflict = ports.scan().conflict(port, "xray")
+    if conflict:
+        return result.fail(f"Port {port} is {conflict}. Please choose another.")
     if is_xray_active():
-        print("Xray is already active. Proceeding with reinstallation...")
-    print("Installing Xray...")
+        result.step("Xray is already active. Proceeding with reinstallation...")
+    result.step("Installing Xray...")
     install_cmd = 'bash -c "$(curl -sL https://github.com/XTLS/Xray-install/raw/main/install-release.sh)" @ install'
-    _run_command(install_cmd, shell=True)
-    print("Xray installation completed.")
+    run_command(install_cmd, result, shell=True)
+    result.step("Xray installation completed.")
     try:
         config_data = load_json_template("config.json")
         config_data['inbounds'][1]['port'] = port
         config_data['inbounds'][1]['settings']['address'] = address
         config_data['inbounds'][1]['settings']['port'] = port
         config_data['inbounds'][1]['tag'] = f"inbound-{port}"
-        with open(XRAY_CONFIG_PATH, 'w') as f:
-            json.dump(config_data, f, indent=4)
-        _run_command(["sudo", "systemctl", "restart", "xray"])
+        registry.write("xray", config_data, safe_write.check_xray)
+        run_command(["sudo", "systemctl", "restart", "xray"], result)
         if is_xray_active():
-            print("Xray installed and configured successfully.")
-        else:
-            print("Xray service failed to start.", file=sys.stderr)
-    except (requests.RequestException, json.JSONDecodeError, IOError) as e:
-        print(f"An error occurred during configuration: {e}", file=sys.stderr)
+            return result.ok("Xray installed and configured successfully.")
+        return result.fail("Xray service failed to start.")
+    except (json.JSONDecodeError, IOError, safe_write.ValidationError) as e:
+        return result.fail(f"An error occurred during configuration: {e}")
 
 def get_xray_status_details():
+    result = ActionResult()
     status = "active" if is_xray_active() else "inactive"
-    print(f"Xray Service Status: {status}")
-    print("\nConfigured Inbounds (from config.json):")
+    result.step(f"Xray Service Status: {status}")
+    result.step("")
+    result.step("Configured Inbounds (from config.json):")
     inbounds = list_inbounds()
+    result.data['inbounds'] = inbounds
     if not inbounds:
-        print("  - No inbounds defined in config.")
-        return
+        result.step("  - No inbounds defined in config.")
+        return result
     for inbound in inbounds:
-        print(f"  - Tag: {inbound['tag']:<15} Port: {inbound['port']:<5} -> Destination: {inbound['destination']}")
+        result.step(f"  - Tag: {inbound['tag']:<15} Port: {inbound['port']:<5} -> Destination: {inbound['destination']}")
+    return result
+
+def _dokodemo_inbound(address, port):
+    return { "listen": None, "port": port, "protocol": "dokodemo-door", "settings": { "address": address, "followRedirect": False, "network": "tcp,udp", "port": port }, "tag": f"inbound-{port}" }
 
 def add_another_inbound(address, port):
+    result = ActionResult()
     if not is_xray_active():
-        print("Xray is not active. Please start it before adding an inbound.", file=sys.stderr)
-        return
+        return result.fail("Xray is not active. Please start it before adding an inbound.")
     try:
-        with open(XRAY_CONFIG_PATH, 'r') as f:
-            config_data = json.load(f)
+        config_data = _load_config()
     except (IOError, json.JSONDecodeError):
-        print("Could not read or parse Xray config file.", file=sys.stderr)
-        return
+        return result.fail("Could not read or parse Xray config file.")
     existing_ports = {inbound.get('port') for inbound in config_data['inbounds']}
     if port in existing_ports:
-        print(f"Port {port} is already in use. Please choose another.", file=sys.stderr)
-        return
-    new_inbound = { "listen": None, "port": port, "protocol": "dokodemo-door", "settings": { "address": address, "followRedirect": False, "network": "tcp,udp", "port": port }, "tag": f"inbound-{port}" }
+        return result.fail(f"Port {port} is already in use. Please choose another.")
+    conflict = ports.scan().conflict(port, "xray")
+    if conflict:
+        return result.fail(f"Port {port} is {conflict}. Please choose another.")
+    new_inbound = _dokodemo_inbound(address, port)
     config_data['inbounds'].append(new_inbound)
     try:
-        with open(XRAY_CONFIG_PATH, 'w') as f:
-            json.dump(config_data, f, indent=4)
-        _run_command(["sudo", "systemctl", "restart", "xray"])
-        print("Additional inbound added successfully.")
-    except IOError as e:
-        print(f"Failed to write to config file: {e}", file=sys.stderr)
+        _write_config(config_data)
+        if not _apply_live(result, config_data, added=[new_inbound]):
+            return safe_write.rolled_back(result, "Xray")
+        return result.ok("Additional inbound added successfully.")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Failed to write to config file: {e}")
 
-def list_inbounds():
-    """Parses config.json and returns a list of configured inbounds."""
-    if not os.path.exists(XRAY_CONFIG_PATH):
-        return []
+def add_inbounds_bulk(entries):
+    """Adds many inbounds with one config write and one live API update (see services.bulk)."""
+    result = ActionResult()
+    if not is_xray_active():
+        return result.fail("Xray is not active. Please start it before adding an inbound.")
+    try:
+        config_data = _load_config()
+    except (IOError, json.JSONDecodeError):
+        return result.fail("Could not read or parse Xray config file.")
+    existing_ports = {inbound.get('port') for inbound in config_data['inbounds']}
+    bulk.reject_duplicates(entries, "port")
+    for entry in bulk.pending(entries):
+        if entry.values["port"] in existing_ports:
+            entry.reject(f"port {entry.values['port']} is already in use")
+    conflicts = ports.check_ports([entry.values["port"] for entry in bulk.pending(entries)], "xray")
+    for entry in bulk.pending(entries):
+        if entry.values["port"] in conflicts:
+            entry.reject(f"port {entry.values['port']} is {conflicts[entry.values['port']]}")
+    if not bulk.check(result, entries):
+        return result
+    added = [_dokodemo_inbound(entry.values["address"], entry.values["port"]) for entry in entries]
+    config_data['inbounds'].extend(added)
+    try:
+        _write_config(config_data)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Failed to write to config file: {e}")
+    if not _apply_live(result, config_data, added=added):
+        return safe_write.rolled_back(result, "Xray")
+    return bulk.complete(result, entries, f"Added {len(entries)} inbound(s).")
+
+def remove_inbounds_bulk(entries):
+    """Removes many inbounds with one config write and one live API update (see services.bulk)."""
+    result = ActionResult()
     try:
-        with open(XRAY_CONFIG_PATH, 'r') as f:
-            config_data = json.load(f)
-        
-        inbounds_data = []
-        for inbound in config_data.get('inbounds', []):
-            if inbound.get('tag') == 'api':
-                continue
-            tag = inbound.get('tag', 'N/A')
-            port = inbound.get('port', 'N/A')
-            destination = "N/A"
-            if inbound.get('protocol') == 'dokodemo-door':
-                address = inbound.get('settings', {}).get('address', 'N/A')
-                dest_port = inbound.get('settings', {}).get('port', 'N/A')
-                destination = f"{address}:{dest_port}"
-            inbounds_data.append({'tag': tag, 'port': port, 'destination': destination})
-        return inbounds_data
+        config_data = _load_config()
     except (IOError, json.JSONDecodeError):
-        return []
+        return result.fail("Could not read or parse Xray config file.")
+    existing_ports = {inbound.get('port') for inbound in config_data['inbounds']}
+    bulk.reject_duplicates(entries, "port")
+    for entry in bulk.pending(entries):
+        if entry.values["port"] not in existing_ports:
+            entry.reject("no inbound with this port")
+    if not bulk.check(result, entries):
+        return result
+    removed_ports = {entry.values["port"] for entry in entries}
+    removed = [ib for ib in config_data['inbounds'] if ib.get('port') in removed_ports]
+    config_data['inbounds'] = [ib for ib in config_data['inbounds'] if ib.get('port') not in removed_ports]
+    try:
+        _write_config(config_data)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Failed to write config file: {e}")
+    if not _apply_live(result, config_data, removed=removed):
+        return safe_write.rolled_back(result, "Xray")
+    return bulk.complete(result, entries, f"Removed {len(entries)} inbound(s).")
+
+def apply_inbounds(add, remove):
+    """Removes the inbounds on ``remove`` ports, then adds ``add`` ({port: (address, dest_port)}),
+    with one config write and one live update (see services.desired). Ports were checked by the caller."""
+    result = ActionResult()
+    try:
+        config_data = _load_config()
+    except (IOError, json.JSONDecodeError):
+        return result.fail("Could not read or parse Xray config file.")
+    dropped = set(remove) | set(add)
+    removed = [ib for ib in config_data['inbounds'] if ib.get('port') in dropped]
+    config_data['inbounds'] = [ib for ib in config_data['inbounds'] if ib.get('port') not in dropped]
+    added = []
+    for port, (address, dest_port) in add.items():
+        inbound = _dokodemo_inbound(address, port)
+        inbound['settings']['port'] = dest_port
+        added.append(inbound)
+    config_data['inbounds'].extend(added)
+    try:
+        _write_config(config_data)
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Failed to write config file: {e}")
+    if not _apply_live(result, config_data, added=added, removed=removed):
+        return safe_write.rolled_back(result, "Xray")
+    return result.ok(f"Xray: {len(add)} inbound(s) added or changed, {len(remove)} removed.")
+
+def list_inbounds():
+    """Returns the configured inbounds (from the tunnel registry, see services.registry)."""
+    return registry.entries("xray")
 
 def remove_inbound_by_port(port_to_remove):
     """Removes an inbound configuration by its port number."""
+    result = ActionResult()
     try:
         port_to_remove = int(port_to_remove)
-        with open(XRAY_CONFIG_PATH, 'r') as f:
-            config_data = json.load(f)
+        config_data = _load_config()
     except (IOError, json.JSONDecodeError, ValueError) as e:
-        print(f"Could not read, parse, or validate port: {e}", file=sys.stderr)
-        return
+        return result.fail(f"Could not read, parse, or validate port: {e}")
 
-    original_count = len(config_data['inbounds'])
+    removed = [ib for ib in config_data['inbounds'] if ib.get('port') == port_to_remove]
     config_data['inbounds'] = [ib for ib in config_data['inbounds'] if ib.get('port') != port_to_remove]
-    
-    if len(config_data['inbounds']) == original_count:
-        print(f"No inbound found with port {port_to_remove}.", file=sys.stderr)
-        return
-    
+
+    if not removed:
+        return result.fail(f"No inbound found with port {port_to_remove}.")
+
     try:
-        with open(XRAY_CONFIG_PATH, 'w') as f:
-            json.dump(config_data, f, indent=4)
-        _run_command(["sudo", "systemctl", "restart", "xray"])
-        print(f"Inbound configuration for port {port_to_remove} removed successfully.")
-    except IOError as e:
-        print(f"Failed to write config file: {e}", file=sys.stderr)
+        _write_config(config_data)
+        if not _apply_live(result, config_data, removed=removed):
+            return safe_write.rolled_back(result, "Xray")
+        return result.ok(f"Inbound configuration for port {port_to_remove} removed successfully.")
+    except (IOError, safe_write.ValidationError) as e:
+        return result.fail(f"Failed to write config file: {e}")
 
 def uninstall_xray():
-    print("Uninstalling Xray...")
-    _run_command(["sudo", "systemctl", "disable", "--now", "xray"])
+    result = ActionResult()
+    result.step("Uninstalling Xray...")
+    run_command(["sudo", "systemctl", "disable", "--now", "xray"], result)
     if os.path.exists(XRAY_CONFIG_PATH):
         try:
             os.remove(XRAY_CONFIG_PATH)
         except OSError as e:
-            print(f"Could not remove config file: {e}", file=sys.stderr)
+            result.warn(f"Could not remove config file: {e}")
     uninstall_cmd = 'bash -c "$(curl -sL https://github.com/XTLS/Xray-install/raw/main/install-release.sh)" @ remove'
-    _run_command(uninstall_cmd, shell=True)
-    print("Xray has been uninstalled.")
+    run_command(uninstall_cmd, result, shell=True)
+    return result.ok("Xray has been uninstalled.")
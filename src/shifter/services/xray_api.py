@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Client for Xray's gRPC API (HandlerService/StatsService) on the ``api`` inbound.
+
+Calls go through the ``xray api`` subcommands of the installed binary, which
+speak gRPC to the running instance, so no gRPC dependency is needed here.
+Inbounds added or removed this way take effect without a restart; callers
+still write ``config.json`` so the change survives one.
+"""
+
+from __future__ import annotations
+
+import json
+import socket
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import XRAY_API_ADDRESS, XRAY_BINARY_PATH
+
+
+class XrayAPIError(RuntimeError):
+    """Raised when the API is unreachable or rejects a call."""
+
+
+def api_address(config_data: Optional[Dict[str, Any]]) -> str:
+    """Return ``host:port`` of the config's API inbound, or the packaged default."""
+    if not config_data:
+        return XRAY_API_ADDRESS
+    tag = (config_data.get("api") or {}).get("tag")
+    for inbound in config_data.get("inbounds", []):
+        if tag and inbound.get("tag") == tag and inbound.get("port"):
+            return f"{inbound.get('listen') or '127.0.0.1'}:{inbound['port']}"
+    return XRAY_API_ADDRESS
+
+
+class XrayAPIClient:
+    """Run ``xray api <command> -s <server>`` against the live instance."""
+
+    def __init__(self, server: str = XRAY_API_ADDRESS, binary: str = XRAY_BINARY_PATH, timeout: float = 5.0):
+        self.server = server
+        self.binary = binary
+        self.timeout = timeout
+
+    def _call(self, command: str, args: Iterable[str] = (), stdin: Optional[str] = None) -> str:
+        argv = [self.binary, "api", command, "-s", self.server, "-t", str(max(1, int(self.timeout)))]
+        argv.extend(args)
+        try:
+            completed = subprocess.run(
+                argv, input=stdin, capture_output=True, text=True, timeout=self.timeout + 1
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise XrayAPIError(f"Xray API call '{command}' failed: {e}") from e
+        if completed.returncode != 0:
+            output = (completed.stderr or completed.stdout).strip()
+            raise XrayAPIError(f"Xray API call '{command}' failed: {output}")
+        return completed.stdout
+
+    def is_available(self) -> bool:
+        host, _, port = self.server.rpartition(":")
+        try:
+            with socket.create_connection((host, int(port)), timeout=min(self.timeout, 1.0)):
+                return True
+        except (OSError, ValueError):
+            return False
+
+    # --- HandlerService ---
+    def add_inbounds(self, inbounds: List[Dict[str, Any]]) -> None:
+        """AddInbound for each config object (read by ``xray api adi`` from stdin)."""
+        if inbounds:
+            self._call("adi", stdin=json.dumps({"inbounds": inbounds}))
+
+    def remove_inbounds(self, tags: Iterable[str]) -> None:
+        """RemoveInbound by tag; without ``-tags`` ``xray api rmi`` reads its arguments as config files."""
+        tags = list(tags)
+        if tags:
+            self._call("rmi", ["-tags", *tags])
+
+    # --- StatsService ---
+    def query_stats(self, pattern: str = "", reset: bool = False) -> Dict[str, int]:
+        """QueryStats for every counter whose name contains ``pattern``, in one call."""
+        args = ["-pattern", pattern]
+        if reset:
+            args.append("-reset")
+        output = self._call("statsquery", args)
+        try:
+            stats = json.loads(output or "{}").get("stat") or []
+        except (ValueError, AttributeError) as e:
+            raise XrayAPIError(f"Unexpected statsquery response: {output[:200]}") from e
+        # Zero-valued counters omit "value" in protobuf's JSON encoding.
+        return {stat["name"]: int(stat.get("value", 0)) for stat in stats if "name" in stat}
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""Per-inbound traffic counters from Xray's StatsService.
+
+The packaged config enables ``statsInboundUplink``/``statsInboundDownlink``, so
+Xray keeps ``inbound>>>inbound-<port>>>>traffic>>>uplink|downlink`` counters.
+One ``statsquery`` call fetches all of them. :func:`collect` keeps the previous
+sample in the Shifter config directory, so rates can be computed between
+separate CLI runs and the totals survive the counter resets caused by
+restarting Xray. :func:`sample` keeps it in a caller-owned dict instead, for
+long-running readers such as the metrics collector that must not move the
+shared rate window.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .config import XRAY_CONFIG_PATH, resolve_config_dir
+from .xray_api import XrayAPIClient, api_address
+
+TAG_PREFIX = "inbound-"
+INBOUND_PATTERN = f"inbound>>>{TAG_PREFIX}"
+DIRECTIONS = ("uplink", "downlink")
+STATE_FILENAME = "xray_stats.json"
+DEFAULT_TIMEOUT = 5.0
+
+
+def state_path() -> Path:
+    return resolve_config_dir() / STATE_FILENAME
+
+
+def parse_counters(stats: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+    """Group ``inbound>>>inbound-PORT>>>traffic>>>DIR`` counters by inbound tag."""
+    counters: Dict[str, Dict[str, int]] = {}
+    for name, value in stats.items():
+        parts = name.split(">>>")
+        if len(parts) == 4 and parts[0] == "inbound" and parts[1].startswith(TAG_PREFIX) and parts[2] == "traffic" and parts[3] in DIRECTIONS:
+            counters.setdefault(parts[1], dict.fromkeys(DIRECTIONS, 0))[parts[3]] = value
+    return counters
+
+
+def compute_traffic(state: Dict[str, Any], counters: Dict[str, Dict[str, int]], now: float):
+    """Return ``(traffic, new_state)`` for a fresh sample of ``counters``.
+
+    A counter lower than the previous sample means Xray restarted and began
+    counting from zero: the old value is folded into a per-tag offset so totals
+    keep growing, and the new value alone is the delta for the rate.
+    """
+    previous = state.get("counters", {})
+    offsets = state.get("offsets", {})
+    elapsed = now - state["timestamp"] if state.get("timestamp") else None
+    traffic: Dict[str, Dict[str, Any]] = {}
+    new_offsets: Dict[str, Dict[str, int]] = {}
+    for tag, current in sorted(counters.items()):
+        prev = previous.get(tag)
+        offset = dict(offsets.get(tag) or dict.fromkeys(DIRECTIONS, 0))
+        entry: Dict[str, Any] = {"reset": False}
+        for direction in DIRECTIONS:
+            value = current.get(direction, 0)
+            delta: Optional[int] = None
+            if prev is not None:
+                if value < prev.get(direction, 0):
+                    offset[direction] += prev.get(direction, 0)
+                    entry["reset"] = True
+                    delta = value
+                else:
+                    delta = value - prev.get(direction, 0)
+            entry[f"{direction}_bytes"] = offset[direction] + value
+            entry[f"{direction}_rate"] = delta / elapsed if delta is not None and elapsed else None
+        traffic[tag] = entry
+        new_offsets[tag] = offset
+    return traffic, {"timestamp": now, "counters": counters, "offsets": new_offsets}
+
+
+def _load_state(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path: Path, state: Dict[str, Any]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _config_data() -> Optional[Dict[str, Any]]:
+    try:
+        with open(XRAY_CONFIG_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _query(client: Optional[XrayAPIClient], timeout: float) -> Dict[str, Dict[str, int]]:
+    client = client or XrayAPIClient(api_address(_config_data()), timeout=timeout)
+    return parse_counters(client.query_stats(INBOUND_PATTERN))
+
+
+def collect(client: Optional[XrayAPIClient] = None, path: Optional[Path] = None,
+            timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+    """Sample all inbound counters and return totals and rates keyed by tag.
+
+    Raises ``XrayAPIError`` when the API cannot be queried.
+    """
+    path = path or state_path()
+    traffic, state = compute_traffic(_load_state(path), _query(client, timeout), time.time())
+    _save_state(path, state)
+    return traffic
+
+
+def sample(state: Dict[str, Any], client: Optional[XrayAPIClient] = None,
+           timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+    """Like :func:`collect`, but the previous sample lives in ``state`` (updated in place)."""
+    traffic, new_state = compute_traffic(state, _query(client, timeout), time.time())
+    state.clear()
+    state.update(new_state)
+    return traffic
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "n/a"
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(value) < 1024 or unit == "TiB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+def format_rate(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{format_bytes(value)}/s"
@@ -1,5 +1,5 @@
 """Web UI components for the Shifter toolkit."""
 
-from .app import create_app
+from .app import create_agent_app, create_app
 
-__all__ = ["create_app"]
+__all__ = ["create_agent_app", "create_app"]
@@ -0,0 +1,251 @@
+"""Versioned JSON API for automation (``/api/v1``).
+
+Reads accept an API token (``Authorization: Bearer shf_...``) or a logged-in
+Web UI session; changes require a token. The agent app (``shifter-toolkit
+agent``) serves the same routes without sessions, so there every call needs a
+token. Every GET response carries an ETag
+derived from what the data comes from: config file signatures for GOST,
+HAProxy and Xray, the snapshot version for status, and a content hash for the
+live iptables table. A matching ``If-None-Match`` gets an empty 304, so
+pollers pay for a ``stat`` rather than for a parse and a JSON body.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from aiohttp import web
+from aiohttp_session import get_session
+
+from ..services import actions, desired, gost, haproxy, iptables_nat, ports, reload, xray
+from ..services.config import (
+    GOST_CONFIG_PATH,
+    GOST_SERVICE_PATH,
+    HAPROXY_CONFIG_PATH,
+    XRAY_CONFIG_PATH,
+)
+
+# Distinguishes ETags across server restarts, where snapshot versions start over.
+_BOOT_ID = secrets.token_hex(4)
+
+SERVICES = ("gost", "haproxy", "xray", "iptables")
+
+
+def _iptables_tunnels():
+    table = iptables_nat.load()
+    if table is None:
+        return []
+    return [
+        {"port": port, "protocol": record.proto, "destination": record.destination}
+        for record in table.forwards()
+        for port in record.port_labels()
+    ]
+
+
+# service -> (inventory function, files whose signature is the ETag or None for a content hash)
+INVENTORIES: Dict[str, Tuple[Callable[[], Any], Optional[Tuple[str, ...]]]] = {
+    "gost": (gost.list_rules, (GOST_CONFIG_PATH, GOST_SERVICE_PATH)),
+    "haproxy": (haproxy.list_tunnels, (HAPROXY_CONFIG_PATH,)),
+    "xray": (xray.list_inbounds, (XRAY_CONFIG_PATH,)),
+    "iptables": (_iptables_tunnels, None),
+}
+
+# service -> (add action, remove action, name of the field identifying a tunnel in DELETE)
+MUTATIONS = {
+    "gost": ("add", "remove", "port"),
+    "haproxy": ("add", "remove", "frontend_name"),
+    "xray": ("add", "remove", "port"),
+    "iptables": ("install", None, None),
+}
+
+
+def _etag(*parts: Any) -> str:
+    digest = hashlib.sha1("\0".join(str(part) for part in (_BOOT_ID, *parts)).encode()).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def _file_signature(paths: Iterable[str]) -> str:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append(f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            signature.append("-")
+    return ",".join(signature)
+
+
+def _not_modified(request: web.Request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _json(request: web.Request, payload: Any, etag: str) -> web.StreamResponse:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return web.Response(status=304, headers=headers)
+    return web.json_response(payload, headers=headers)
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+async def _authenticate(request: web.Request, write: bool = False) -> str:
+    """Return who is calling, raising 401 when neither a token nor a session is valid."""
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        name = request.app["auth_manager"].verify_api_token(header[len("Bearer "):].strip())
+        if name:
+            return f"token:{name}"
+    elif not write and request.app.get("session_auth", True):
+        session = await get_session(request)
+        if session.get("user"):
+            return "session"
+    raise web.HTTPUnauthorized(
+        text=json.dumps({"error": "A valid API token is required."}),
+        content_type="application/json",
+        headers={"WWW-Authenticate": 'Bearer realm="shifter-api"'},
+    )
+
+
+def _service(request: web.Request) -> str:
+    service = request.match_info["service"]
+    if service not in SERVICES:
+        raise web.HTTPNotFound(text=json.dumps({"error": f"Unknown service: {service}"}), content_type="application/json")
+    return service
+
+
+async def status(request: web.Request):
+    await _authenticate(request)
+    snapshot = request.app["status_snapshot"]
+    await snapshot.wait_ready()
+    etag = _etag("status", snapshot.version)
+    return _json(request, {"version": snapshot.version, "updated_at": snapshot.updated_at, "services": snapshot.services}, etag)
+
+
+async def reloads(request: web.Request):
+    """Per-service reload state: queued changes, the last ticket issued and the last reload."""
+    await _authenticate(request)
+    scheduler = reload.current()
+    return web.json_response({"reloads": scheduler.state() if scheduler is not None else {}})
+
+
+async def free_ports(request: web.Request):
+    """Ports no backend forwards and no local socket holds: ``?count=&start=&end=``."""
+    await _authenticate(request)
+    try:
+        count = min(max(int(request.query.get("count", "1")), 1), 100)
+        start = int(request.query["start"]) if "start" in request.query else None
+        end = int(request.query["end"]) if "end" in request.query else None
+    except ValueError:
+        return _error(400, "count, start and end must be integers.")
+    return web.json_response({"ports": await asyncio.to_thread(ports.suggest, count, start, end)})
+
+
+async def list_tunnels(request: web.Request):
+    await _authenticate(request)
+    service = _service(request)
+    inventory, paths = INVENTORIES[service]
+    if paths is not None:
+        etag = _etag(service, _file_signature(paths))
+        if _not_modified(request, etag):
+            return _json(request, None, etag)
+        tunnels = await asyncio.to_thread(inventory)
+    else:
+        tunnels = await asyncio.to_thread(inventory)
+        etag = _etag(service, hashlib.sha1(json.dumps(tunnels, sort_keys=True).encode()).hexdigest())
+    return _json(request, {"service": service, "tunnels": tunnels}, etag)
+
+
+async def _run(request: web.Request, service: str, action: str, params: Dict[str, Any]) -> web.Response:
+    # By default the response waits for the (coalesced) reload that makes the
+    # change live; ?wait=false answers 202 with a ticket to poll in /reloads.
+    wait = request.query.get("wait", "true").lower() not in {"0", "false", "no"}
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        request.app["action_executor"], actions.run_action, service, action, params, wait
+    )
+    await request.app["status_snapshot"].refresh()
+    if not result.success:
+        status_code = 422
+    elif not wait and result.data.get("reload"):
+        status_code = 202
+    else:
+        status_code = 201 if request.method == "POST" else 200
+    return web.json_response(result.to_dict(), status=status_code)
+
+
+async def add_tunnel(request: web.Request):
+    await _authenticate(request, write=True)
+    service = _service(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "Request body must be a JSON object.")
+    if not isinstance(body, dict):
+        return _error(400, "Request body must be a JSON object.")
+    # Lists (HAProxy's extra "servers") travel as one entry per line, as in the forms.
+    params = {key: "\n".join(map(str, value)) if isinstance(value, list) else str(value) for key, value in body.items()}
+    return await _run(request, service, MUTATIONS[service][0], params)
+
+
+async def remove_tunnel(request: web.Request):
+    await _authenticate(request, write=True)
+    service = _service(request)
+    _, action, field = MUTATIONS[service]
+    if action is None:
+        return _error(405, f"{service} tunnels cannot be removed individually; uninstall the rules instead.")
+    return await _run(request, service, action, {field: request.match_info["tunnel"]})
+
+
+async def apply_state(request: web.Request):
+    """Make the tunnels match a desired-state document (see services.desired).
+
+    The body is the document as a JSON object. ``?plan=true`` only diffs it,
+    so like any read it also accepts a logged-in session; applying needs an
+    API token like any change. Tokens have no scopes: every token may apply.
+    """
+    plan_only = request.query.get("plan", "false").lower() in {"1", "true", "yes"}
+    await _authenticate(request, write=not plan_only)
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "Request body must be a JSON object.")
+    loop = asyncio.get_running_loop()
+    executor = request.app["action_executor"]
+    try:
+        wanted = desired.validate(body, "request body")
+    except desired.DesiredStateError as e:
+        return _error(400, str(e))
+    try:
+        plan = await loop.run_in_executor(executor, desired.plan, wanted)
+    except desired.DesiredStateError as e:
+        # The document was fine; this host could not report its current state.
+        return _error(503, str(e))
+    if plan_only:
+        if plan.conflicts:
+            return web.json_response({"error": "; ".join(plan.conflicts), "plan": plan.to_dict()}, status=409)
+        return web.json_response({"plan": plan.to_dict()})
+    result = await loop.run_in_executor(executor, desired.apply, plan)
+    if plan.changes:
+        await request.app["status_snapshot"].refresh()
+    return web.json_response(result.to_dict(), status=200 if result.success else 422)
+
+
+def setup_api_routes(app: web.Application, route_path: Callable[[str], str]) -> None:
+    app.router.add_get(route_path("/api/v1/status"), status)
+    app.router.add_get(route_path("/api/v1/reloads"), reloads)
+    app.router.add_get(route_path("/api/v1/ports/free"), free_ports)
+    app.router.add_post(route_path("/api/v1/apply"), apply_state)
+    app.router.add_get(route_path("/api/v1/{service}/tunnels"), list_tunnels)
+    app.router.add_post(route_path("/api/v1/{service}/tunnels"), add_tunnel)
+    app.router.add_delete(route_path("/api/v1/{service}/tunnels/{tunnel}"), remove_tunnel)
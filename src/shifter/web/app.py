@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import base64
+from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp_jinja2
 import jinja2
@@ -9,8 +11,12 @@ from aiohttp import web
 from aiohttp_session import setup, get_session
 from aiohttp_session.cookie_storage import EncryptedCookieStorage
 
+from .api import setup_api_routes
 from .routes import setup_routes
 from .auth import AuthManager, AuthConfigError
+from .snapshot import StatusSnapshot
+from ..services import actions, probes, reload
+from ..services.metrics import DEFAULT_MIN_INTERVAL, MetricsCollector
 
 
 def _normalize_base_path(base_path: str) -> str:
@@ -23,6 +29,46 @@ def _normalize_base_path(base_path: str) -> str:
     return "/" if cleaned == "//" else cleaned
 
 
+def _setup_runtime(app: web.Application) -> None:
+    """Action worker pool, status snapshot and reload scheduler shared by the Web UI and the agent."""
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="shifter-action")
+    app["action_executor"] = executor
+
+    async def _shutdown_executor(_app):
+        executor.shutdown(wait=False)
+
+    app.on_cleanup.append(_shutdown_executor)
+
+    # Background destination probes; SHIFTER_PROBE_INTERVAL=0 turns them off.
+    probe_interval = probes.interval_from_env()
+    snapshot = StatusSnapshot(
+        probe_engine=probes.ProbeEngine(checks=probes.checks_from_env()) if probe_interval else None,
+        probe_interval=probe_interval,
+    )
+    app["status_snapshot"] = snapshot
+    app.on_startup.append(snapshot.start)
+    app.on_shutdown.append(snapshot.close_subscribers)
+    app.on_cleanup.append(snapshot.stop)
+
+    # Changes queue a coalesced reload instead of reloading once per request.
+    async def _start_reloads(_app):
+        loop = asyncio.get_running_loop()
+        scheduler = reload.ReloadScheduler(
+            window=reload.window_from_env(),
+            lock_for=actions.service_lock,
+            on_reload=lambda _outcome: loop.call_soon_threadsafe(snapshot.invalidate),
+        )
+        app["reload_scheduler"] = scheduler
+        reload.install(scheduler)
+
+    async def _stop_reloads(_app):
+        reload.install(None)
+        await asyncio.to_thread(app["reload_scheduler"].close)
+
+    app.on_startup.append(_start_reloads)
+    app.on_cleanup.insert(0, _stop_reloads)
+
+
 def create_app(base_path: str = "/", auth_manager: AuthManager | None = None):
     """
     Creates and configures the aiohttp web application instance.
@@ -59,6 +105,16 @@ def create_app(base_path: str = "/", auth_manager: AuthManager | None = None):
 
     app["auth_manager"] = manager
 
+    _setup_runtime(app)
+
+    try:
+        metrics_interval = float(os.environ.get("SHIFTER_METRICS_MIN_INTERVAL", DEFAULT_MIN_INTERVAL))
+    except ValueError:
+        metrics_interval = DEFAULT_MIN_INTERVAL
+    app["metrics_collector"] = MetricsCollector(min_interval=max(metrics_interval, 0.0))
+    # A token lets scrapers authenticate without a Web UI session.
+    app["metrics_token"] = os.environ.get("SHIFTER_METRICS_TOKEN", "")
+
     @web.middleware
     async def _session_user_middleware(request, handler):
         session = await get_session(request)
@@ -76,3 +132,22 @@ def create_app(base_path: str = "/", auth_manager: AuthManager | None = None):
         app.router.add_route("*", "/", not_found_root)
 
     return app
+
+
+def create_agent_app(auth_manager: AuthManager | None = None):
+    """API-only application for ``shifter-toolkit agent``.
+
+    It serves the ``/api/v1`` routes and nothing else: no pages, no sessions,
+    and every request needs an API token.
+    """
+    app = web.Application()
+    app["base_path"] = "/"
+    app["base_path_prefix"] = ""
+    app["session_auth"] = False
+    try:
+        app["auth_manager"] = auth_manager or AuthManager()
+    except AuthConfigError as exc:
+        raise RuntimeError(str(exc)) from exc
+    _setup_runtime(app)
+    setup_api_routes(app, lambda path: path)
+    return app
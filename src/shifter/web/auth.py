@@ -4,40 +4,35 @@
 
 from __future__ import annotations
 
+import hashlib
+import hmac
 import json
 import os
+import secrets
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import bcrypt
 
-CONFIG_DIR_ENV = "SHIFTER_CONFIG_DIR"
-AUTH_FILE_ENV = "SHIFTER_AUTH_FILE"
-HOME_ENV = "SHIFTER_HOME"
-DEFAULT_CONFIG_SUBDIR = "config"
+from ..services.config import (  # noqa: F401 - re-exported for existing importers
+    AUTH_FILE_ENV,
+    CONFIG_DIR_ENV,
+    DEFAULT_CONFIG_SUBDIR,
+    HOME_ENV,
+    _expand_path,
+    resolve_config_dir,
+)
+from ..services.safe_write import write_file
+
 AUTH_FILENAME = "auth.json"
+API_TOKEN_PREFIX = "shf_"
 
 
 class AuthConfigError(RuntimeError):
     """Raised when the authentication configuration is missing or malformed."""
 
 
-def _expand_path(path: str) -> Path:
-    return Path(path).expanduser()
-
-
-def resolve_config_dir() -> Path:
-    """Resolve the configuration directory path."""
-    if auth_file_env := os.environ.get(AUTH_FILE_ENV):
-        return _expand_path(auth_file_env).parent
-    if config_dir_env := os.environ.get(CONFIG_DIR_ENV):
-        return _expand_path(config_dir_env)
-    home_root = os.environ.get(HOME_ENV)
-    if home_root:
-        return _expand_path(home_root) / DEFAULT_CONFIG_SUBDIR
-    return Path.home() / "Shifter" / DEFAULT_CONFIG_SUBDIR
-
-
 def resolve_auth_file() -> Path:
     """Return the expected auth.json file path."""
     if auth_file_env := os.environ.get(AUTH_FILE_ENV):
@@ -58,6 +53,12 @@ def _load_json(path: Path) -> Dict[str, Any]:
         raise AuthConfigError(f"Authentication configuration at {path} is not valid JSON.") from exc
 
 
+def _hash_token(token: str) -> str:
+    # Tokens are 256-bit random strings, so a fast hash is enough; bcrypt would
+    # make every API request cost tens of milliseconds.
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
 class AuthManager:
     """Manager for loading and updating Web UI authentication details."""
 
@@ -65,7 +66,15 @@ class AuthManager:
         self.auth_file = auth_file or resolve_auth_file()
         self._data = self._load()
 
+    def _signature(self) -> Optional[tuple]:
+        try:
+            stat = self.auth_file.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
     def _load(self) -> Dict[str, Any]:
+        self._loaded_signature = self._signature()
         data = _load_json(self.auth_file)
         if "username" not in data or "password_hash" not in data:
             raise AuthConfigError(
@@ -115,13 +124,58 @@ class AuthManager:
     def reload(self) -> None:
         self._data = self._load()
 
+    # --- API tokens ---
+    @property
+    def api_tokens(self) -> List[Dict[str, Any]]:
+        """Return the name and creation time of each API token (never the secret)."""
+        return [
+            {"name": entry["name"], "created_at": entry.get("created_at")}
+            for entry in self._data.get("api_tokens", [])
+        ]
+
+    def create_api_token(self, name: str) -> str:
+        """Create a named API token and return it; only its hash is stored."""
+        if not name:
+            raise ValueError("Token name must not be empty.")
+        tokens = self._data.setdefault("api_tokens", [])
+        if any(entry["name"] == name for entry in tokens):
+            raise ValueError(f"An API token named '{name}' already exists.")
+        token = API_TOKEN_PREFIX + secrets.token_urlsafe(32)
+        tokens.append({"name": name, "sha256": _hash_token(token), "created_at": int(time.time())})
+        self._write()
+        return token
+
+    def revoke_api_token(self, name: str) -> bool:
+        tokens = self._data.get("api_tokens", [])
+        kept = [entry for entry in tokens if entry["name"] != name]
+        if len(kept) == len(tokens):
+            return False
+        self._data["api_tokens"] = kept
+        self._write()
+        return True
+
+    def verify_api_token(self, token: str) -> Optional[str]:
+        """Return the token's name when ``token`` is valid.
+
+        auth.json is re-read when it changed on disk, so tokens created or
+        revoked from the CLI apply to a running server.
+        """
+        if not token or not token.startswith(API_TOKEN_PREFIX):
+            return None
+        if self._signature() != self._loaded_signature:
+            try:
+                self.reload()
+            except AuthConfigError:
+                pass
+        digest = _hash_token(token)
+        for entry in self._data.get("api_tokens", []):
+            if hmac.compare_digest(entry.get("sha256", ""), digest):
+                return entry["name"]
+        return None
+
     def _write(self) -> None:
-        self.auth_file.parent.mkdir(parents=True, exist_ok=True)
-        with self.auth_file.open("w", encoding="utf-8") as handle:
-            json.dump(self._data, handle, indent=4)
-            handle.write("\n")
-        try:
-            os.chmod(self.auth_file, 0o600)
-        except OSError:
-            # Non-critical: skip if the platform does not support chmod.
-            pass
+        # Atomic: a crash mid-write must not leave a truncated auth.json that
+        # locks everyone out. The temp file is created 0600 before any secret
+        # is written to it.
+        write_file(str(self.auth_file), json.dumps(self._data, indent=4) + "\n", mode=0o600)
+        self._loaded_signature = self._signature()
@@ -1,12 +1,18 @@
-import sys
+import hmac
+import json
 import asyncio
+import logging
 from typing import Iterable
 
 from aiohttp import web
 from aiohttp_session import get_session
 import aiohttp_jinja2
 
-from ..services import gost, haproxy, iptables, status as status_module, xray
+from ..services import actions, haproxy_config, metrics, ports
+from ..services.results import ActionResult
+from .api import setup_api_routes
+
+logger = logging.getLogger(__name__)
 
 
 def _command_prefix(app: web.Application) -> str:
@@ -44,16 +50,20 @@ async def _require_auth(request: web.Request):
     return session
 
 
-async def _run_cli_command(command_parts):
-    command = [sys.executable, "-m", "shifter"] + command_parts
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    output = stdout.decode().strip() + "\n" + stderr.decode().strip()
-    return process.returncode, output.strip()
+async def _run_action(app: web.Application, service: str, action: str, params) -> ActionResult:
+    """Run a service action in-process on the app's worker pool.
+
+    The reload is queued rather than awaited, so clicking through several
+    changes leads to one reload; the dashboard shows it as pending until then.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            app["action_executor"], actions.run_action, service, action, dict(params), False
+        )
+    except Exception as exc:  # pragma: no cover - defensive, surfaces bugs as flash errors
+        logger.exception("Action %s %s crashed", service, action)
+        return ActionResult().fail(f"Unexpected error: {exc}")
 
 
 async def _handle_form_action(request: web.Request, redirect_path: str = "/configure"):
@@ -65,15 +75,12 @@ async def _handle_form_action(request: web.Request, redirect_path: str = "/confi
         raise web.HTTPBadRequest()
     service, action = segments[0], segments[1]
 
-    command = [service, action]
-    for key, value in post_data.items():
-        if value:
-            command.append(f"--{key.replace('_', '-')}")
-            command.append(str(value))
+    result = await _run_action(request.app, service, action, post_data)
+    message_type = "success" if result.success else "error"
+    session["flash"] = {"type": message_type, "message": result.text()}
 
-    return_code, output = await _run_cli_command(command)
-    message_type = "success" if return_code == 0 else "error"
-    session["flash"] = {"type": message_type, "message": output}
+    # Refresh before redirecting so the next page already reflects the change.
+    await request.app["status_snapshot"].refresh()
 
     raise web.HTTPFound(_with_base_path(request.app, redirect_path))
 
@@ -81,9 +88,11 @@ async def _handle_form_action(request: web.Request, redirect_path: str = "/confi
 @aiohttp_jinja2.template("index.html")
 async def dashboard(request: web.Request):
     session = await _require_auth(request)
-    status_data = status_module.get_all_services_status()
+    snapshot = request.app["status_snapshot"]
+    await snapshot.wait_ready()
     return {
-        "services": status_data,
+        "services": snapshot.services,
+        "reloads": snapshot.reloads,
         "request": request,
         "base_path": request.app["base_path"],
         "base_path_prefix": request.app["base_path_prefix"],
@@ -96,17 +105,16 @@ async def configure_page(request: web.Request):
     session = await _require_auth(request)
     flash_message = session.pop("flash", None)
 
-    status_data = status_module.get_all_services_status()
-    removable_items = {
-        "gost": gost.list_rules(),
-        "xray": xray.list_inbounds(),
-        "haproxy": haproxy.list_tunnels(),
-    }
+    snapshot = request.app["status_snapshot"]
+    await snapshot.wait_ready()
+    suggested = await asyncio.to_thread(ports.suggest)
 
     return {
         "flash": flash_message,
-        "services": status_data,
-        "removable_items": removable_items,
+        "services": snapshot.services,
+        "removable_items": snapshot.removable_items,
+        "suggested_port": suggested[0] if suggested else None,
+        "balance_algorithms": haproxy_config.BALANCE_ALGORITHMS,
         "request": request,
         "base_path": request.app["base_path"],
         "base_path_prefix": request.app["base_path_prefix"],
@@ -114,6 +122,58 @@ async def configure_page(request: web.Request):
     }
 
 
+async def status_events(request: web.Request):
+    """Stream snapshot updates to the browser as server-sent events."""
+    await _require_auth(request)
+    snapshot = request.app["status_snapshot"]
+    await snapshot.wait_ready()
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+
+    queue = snapshot.subscribe()
+    try:
+        payload = snapshot.as_dict()
+        while payload is not None:
+            await response.write(f"id: {payload['version']}\ndata: {json.dumps(payload)}\n\n".encode())
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), 15)
+                    break
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream.
+                    await response.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        pass
+    finally:
+        snapshot.unsubscribe(queue)
+    return response
+
+
+async def metrics_endpoint(request: web.Request):
+    """Prometheus scrape target, authenticated by bearer token or Web UI session."""
+    token = request.app["metrics_token"]
+    if token:
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            raise web.HTTPUnauthorized(headers={"WWW-Authenticate": 'Bearer realm="shifter-metrics"'})
+    else:
+        session = await get_session(request)
+        if not session.get("user"):
+            raise web.HTTPUnauthorized()
+
+    snapshot = request.app["status_snapshot"]
+    await snapshot.wait_ready()
+    text = await asyncio.get_running_loop().run_in_executor(
+        request.app["action_executor"], request.app["metrics_collector"].render, snapshot.services
+    )
+    return web.Response(body=text.encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
 async def gost_install_action(request: web.Request):
     return await _handle_form_action(request)
 
@@ -126,6 +186,14 @@ async def gost_remove_action(request: web.Request):
     return await _handle_form_action(request)
 
 
+async def gost_add_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def gost_remove_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
 async def gost_uninstall_action(request: web.Request):
     return await _handle_form_action(request)
 
@@ -142,6 +210,26 @@ async def haproxy_remove_action(request: web.Request):
     return await _handle_form_action(request)
 
 
+async def haproxy_add_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def haproxy_remove_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def haproxy_add_server_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def haproxy_remove_server_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def haproxy_set_balance_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
 async def haproxy_uninstall_action(request: web.Request):
     return await _handle_form_action(request)
 
@@ -158,6 +246,14 @@ async def xray_remove_action(request: web.Request):
     return await _handle_form_action(request)
 
 
+async def xray_add_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
+async def xray_remove_bulk_action(request: web.Request):
+    return await _handle_form_action(request)
+
+
 async def xray_uninstall_action(request: web.Request):
     return await _handle_form_action(request)
 
@@ -277,6 +373,10 @@ def setup_routes(app: web.Application, base_path: str = "/") -> None:
     logout_route = route_path("/logout")
     change_credentials_route = route_path("/auth/change")
 
+    app.router.add_get(route_path("/events"), status_events)
+    app.router.add_get(route_path("/metrics"), metrics_endpoint)
+    setup_api_routes(app, route_path)
+
     app.router.add_get(login_route, login_page)
     app.router.add_post(login_route, login_action)
     app.router.add_post(logout_route, logout_action)
@@ -285,16 +385,25 @@ def setup_routes(app: web.Application, base_path: str = "/") -> None:
     app.router.add_post(route_path("/gost/install"), gost_install_action)
     app.router.add_post(route_path("/gost/add"), gost_add_action)
     app.router.add_post(route_path("/gost/remove"), gost_remove_action)
+    app.router.add_post(route_path("/gost/add-bulk"), gost_add_bulk_action)
+    app.router.add_post(route_path("/gost/remove-bulk"), gost_remove_bulk_action)
     app.router.add_post(route_path("/gost/uninstall"), gost_uninstall_action)
 
     app.router.add_post(route_path("/haproxy/install"), haproxy_install_action)
     app.router.add_post(route_path("/haproxy/add"), haproxy_add_action)
     app.router.add_post(route_path("/haproxy/remove"), haproxy_remove_action)
+    app.router.add_post(route_path("/haproxy/add-bulk"), haproxy_add_bulk_action)
+    app.router.add_post(route_path("/haproxy/remove-bulk"), haproxy_remove_bulk_action)
+    app.router.add_post(route_path("/haproxy/add-server"), haproxy_add_server_action)
+    app.router.add_post(route_path("/haproxy/remove-server"), haproxy_remove_server_action)
+    app.router.add_post(route_path("/haproxy/set-balance"), haproxy_set_balance_action)
     app.router.add_post(route_path("/haproxy/uninstall"), haproxy_uninstall_action)
 
     app.router.add_post(route_path("/xray/install"), xray_install_action)
     app.router.add_post(route_path("/xray/add"), xray_add_action)
     app.router.add_post(route_path("/xray/remove"), xray_remove_action)
+    app.router.add_post(route_path("/xray/add-bulk"), xray_add_bulk_action)
+    app.router.add_post(route_path("/xray/remove-bulk"), xray_remove_bulk_action)
     app.router.add_post(route_path("/xray/uninstall"), xray_uninstall_action)
 
     app.router.add_post(route_path("/iptables/install"), iptables_install_action)
@@ -0,0 +1,189 @@
+"""Shared in-memory view of service state for the Web UI.
+
+Page handlers read the snapshot instead of re-parsing configuration files and
+forking ``systemctl`` on every request. A background task refreshes it on a
+fixed interval and immediately after any watched configuration file changes;
+each refresh that changes the state is pushed to subscribed browsers. With a
+probe engine attached, a second task probes the tunnel destinations every
+``probe_interval`` seconds (see services.probes) and puts the rolling results
+under each service's ``probes`` key.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from ..services import gost, haproxy, probes as probes_module, reload, status as status_module, xray
+from ..services.config import (
+    GOST_CONFIG_PATH,
+    GOST_SERVICE_PATH,
+    HAPROXY_CONFIG_PATH,
+    IPTABLES_RULES_PATH,
+    XRAY_CONFIG_PATH,
+)
+from .watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+WATCHED_PATHS = (GOST_SERVICE_PATH, GOST_CONFIG_PATH, HAPROXY_CONFIG_PATH, XRAY_CONFIG_PATH, IPTABLES_RULES_PATH)
+
+# Bursts of file events (editor saves, rename-into-place) collapse into one refresh.
+_DEBOUNCE_SECONDS = 0.2
+
+
+class StatusSnapshot:
+    """Periodically refreshed service status plus the removable-item listings."""
+
+    def __init__(self, refresh_interval: float = 30.0, poll_interval: float = 1.0,
+                 probe_engine: Optional[probes_module.ProbeEngine] = None,
+                 probe_interval: float = probes_module.DEFAULT_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self.probe_engine = probe_engine
+        self.probe_interval = probe_interval
+        self.probes: Dict[str, Any] = {}
+        self.services: Dict[str, Any] = {}
+        self.removable_items: Dict[str, Any] = {"gost": [], "xray": [], "haproxy": []}
+        self.reloads: Dict[str, Any] = {}
+        self.version = 0
+        self.updated_at: Optional[float] = None
+        self._subscribers: Set["asyncio.Queue[Optional[Dict[str, Any]]]"] = set()
+        self._invalidated: Optional[asyncio.Event] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._probe_task: Optional["asyncio.Task[None]"] = None
+        self._watcher: Optional[FileWatcher] = None
+
+    # --- lifecycle, wired to aiohttp's on_startup/on_shutdown/on_cleanup ---
+    async def start(self, _app=None) -> None:
+        self._invalidated = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._refresh_lock = asyncio.Lock()
+        self._watcher = FileWatcher(WATCHED_PATHS, self.invalidate, poll_interval=self.poll_interval)
+        await self._watcher.start()
+        self._task = asyncio.create_task(self._refresh_loop())
+        if self.probe_engine is not None and self.probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def close_subscribers(self, _app=None) -> None:
+        for queue in list(self._subscribers):
+            queue.put_nowait(None)
+
+    async def stop(self, _app=None) -> None:
+        if self._watcher is not None:
+            await self._watcher.stop()
+        for task in (self._task, self._probe_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    # --- reading ---
+    async def wait_ready(self) -> None:
+        """Block until the first refresh has completed."""
+        if self._ready is not None:
+            await self._ready.wait()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "updated_at": self.updated_at,
+            "services": self.services,
+            "removable_items": self.removable_items,
+            "reloads": self.reloads,
+        }
+
+    # --- updating ---
+    def invalidate(self) -> None:
+        """Schedule an immediate refresh (safe to call from loop callbacks)."""
+        if self._invalidated is not None:
+            self._invalidated.set()
+
+    async def refresh(self) -> None:
+        """Re-collect every service's state and notify subscribers on change."""
+        async with self._refresh_lock:
+            services, gost_rules, xray_inbounds, haproxy_tunnels = await asyncio.gather(
+                status_module.gather_all_services_status(),
+                asyncio.to_thread(gost.list_rules),
+                asyncio.to_thread(xray.list_inbounds),
+                asyncio.to_thread(haproxy.list_tunnels),
+            )
+            self._attach_probes(services)
+            removable_items = {"gost": gost_rules, "xray": xray_inbounds, "haproxy": haproxy_tunnels}
+            scheduler = reload.current()
+            reloads = scheduler.state() if scheduler is not None else {}
+            changed = services != self.services or removable_items != self.removable_items or reloads != self.reloads
+            self.services = services
+            self.removable_items = removable_items
+            self.reloads = reloads
+            self.updated_at = time.time()
+            if changed:
+                self.version += 1
+            self._ready.set()
+        if changed:
+            self._publish()
+
+    def _attach_probes(self, services: Dict[str, Any]) -> None:
+        if self.probe_engine is not None:
+            for name, data in services.items():
+                data["probes"] = self.probes.get(name, [])
+
+    async def probe(self) -> None:
+        """Run one destination probe round and publish its results."""
+        summaries = await self.probe_engine.run_round()
+        async with self._refresh_lock:
+            changed = summaries != self.probes
+            self.probes = summaries
+            if changed and self.services:
+                self.services = {name: dict(data) for name, data in self.services.items()}
+                self._attach_probes(self.services)
+                self.version += 1
+        if changed:
+            self._publish()
+
+    async def _probe_loop(self) -> None:
+        # Let the first refresh finish so the first round is not competing with it.
+        await self.wait_ready()
+        while True:
+            try:
+                await self.probe()
+            except Exception:  # pragma: no cover - keep the loop alive on probe bugs
+                logger.exception("Destination probe round failed")
+            await asyncio.sleep(self.probe_interval)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:  # pragma: no cover - keep the loop alive on refresh bugs
+                logger.exception("Status snapshot refresh failed")
+                self._ready.set()
+            try:
+                await asyncio.wait_for(self._invalidated.wait(), self.refresh_interval)
+                await asyncio.sleep(_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._invalidated.clear()
+
+    # --- push updates ---
+    def subscribe(self) -> "asyncio.Queue[Optional[Dict[str, Any]]]":
+        queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=8)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: "asyncio.Queue[Optional[Dict[str, Any]]]") -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self) -> None:
+        payload = self.as_dict()
+        for queue in list(self._subscribers):
+            if queue.full():
+                # A stalled browser only needs the latest state.
+                queue.get_nowait()
+            queue.put_nowait(payload)
@@ -0,0 +1,139 @@
+"""Change notification for the configuration files the Web UI reports on."""
+
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# inotify(7) event masks. Installers replace files by rename, so watch the
+# parent directory rather than the file itself.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    name = ctypes.util.find_library("c")
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """Invoke ``on_change`` whenever one of ``paths`` is written, replaced or removed.
+
+    Uses inotify when every parent directory exists; otherwise it falls back
+    to polling ``os.stat`` once per ``poll_interval`` seconds, which also
+    notices files whose directories appear after start-up.
+    """
+
+    def __init__(
+        self,
+        paths: Iterable[str],
+        on_change: Callable[[], None],
+        poll_interval: float = 1.0,
+    ):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mode: Optional[str] = None
+        self._fd: Optional[int] = None
+        self._watch_dirs: Dict[int, str] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        if self._start_inotify():
+            self.mode = "inotify"
+            return
+        self.mode = "poll"
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- inotify ---
+    def _start_inotify(self) -> bool:
+        directories = {os.path.dirname(path) for path in self.paths}
+        if not all(os.path.isdir(directory) for directory in directories):
+            return False
+        libc = _load_libc()
+        if libc is None:
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, directory.encode(), _WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                self._watch_dirs.clear()
+                return False
+            self._watch_dirs[wd] = directory
+        self._fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._read_events)
+        return True
+
+    def _read_events(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        changed = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            directory = self._watch_dirs.get(wd)
+            if directory and os.path.join(directory, name) in self.paths:
+                changed = True
+        if changed:
+            self.on_change()
+
+    # --- polling fallback ---
+    def _signature(self) -> Tuple[Optional[Tuple[int, int, int]], ...]:
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(signature)
+
+    async def _poll_loop(self) -> None:
+        previous = self._signature()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = self._signature()
+            if current != previous:
+                previous = current
+                self.on_change()
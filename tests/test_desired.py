@@ -0,0 +1,128 @@
+"""Planning and applying desired state with stand-in services."""
+
+import pytest
+
+from shifter.services import desired
+from shifter.services.desired import Existing
+from shifter.services.results import ActionResult
+
+
+class FakePorts:
+    """A port index where the listed ports are held by someone else."""
+
+    def __init__(self, held=()):
+        self.held = set(held)
+
+    def conflict(self, port, service):
+        return "in use by another backend" if port in self.held else None
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """Current tunnels per service, read by desired.CURRENT; appliers record their calls."""
+    current = {service: {} for service in desired.SERVICES}
+    calls = []
+
+    def applier(service):
+        def apply(changes, wanted):
+            calls.append((service, [(change.action, change.key) for change in changes]))
+            state = current[service]
+            for change in changes:
+                if change.action == desired.REMOVE:
+                    del state[change.key]
+                else:
+                    state[change.key] = Existing(change.key, change.wanted.destination, change.wanted.protocols_label)
+            return ActionResult().ok(f"{service} applied")
+        return apply
+
+    monkeypatch.setattr(desired, "CURRENT", {service: (lambda s=service: dict(current[s])) for service in desired.SERVICES})
+    monkeypatch.setattr(desired, "APPLIERS", {service: applier(service) for service in desired.SERVICES})
+    monkeypatch.setattr(desired.ports, "scan", lambda: FakePorts())
+    return current, calls
+
+
+def test_changing_a_load_balanced_tunnel_is_a_conflict(services):
+    current, calls = services
+    current["haproxy"]["9443"] = Existing("tunnel-9443", "203.0.113.7:443", pool=True)
+    plan = desired.plan(desired.validate({"haproxy": [{"port": 9443, "destination": "203.0.113.9:443"}]}))
+    assert plan.conflicts == [
+        "haproxy 9443: tunnel-9443 is load-balanced (managed with add-server/remove-server); not changed by apply"
+    ]
+    assert not desired.apply(plan).success
+    assert calls == []
+
+
+def test_load_balanced_tunnels_can_be_kept_or_removed(services):
+    current, calls = services
+    current["haproxy"]["9443"] = Existing("tunnel-9443", "203.0.113.7:443", pool=True)
+    current["haproxy"]["9444"] = Existing("tunnel-9444", "203.0.113.7:443", pool=True)
+    plan = desired.plan(desired.validate({"haproxy": [{"port": 9443, "destination": "203.0.113.7:443"}]}))
+    assert plan.conflicts == []
+    assert desired.apply(plan).success
+    assert calls == [("haproxy", [("remove", "9444")])]
+
+
+DOCUMENT = {
+    "gost": [{"port": 8443, "destination": "example.com:443"}],
+    "haproxy": [{"port": 9443, "destination": "203.0.113.7:443"}, {"port": 9444, "destination": "203.0.113.8:443"}],
+    "xray": [{"port": 10000, "destination": "203.0.113.7"}],
+    "iptables": [{"destination": "203.0.113.9", "ports": "80,443", "protocols": ["tcp"]}],
+}
+
+
+def test_reapplying_an_unchanged_document_calls_no_applier(services):
+    _, calls = services
+    wanted = desired.validate(DOCUMENT)
+    assert desired.apply(desired.plan(wanted)).success
+    calls.clear()
+    again = desired.plan(wanted)
+    assert again.changes == []
+    result = desired.apply(again)
+    assert result.success
+    assert result.message == "Nothing to apply."
+    assert calls == []
+
+
+def test_a_mixed_plan_calls_each_service_once(services):
+    current, calls = services
+    current["gost"]["8443"] = Existing("8443", "old.example.com:443", "TCP/UDP")
+    current["gost"]["8444"] = Existing("8444", "gone.example.com:443", "TCP/UDP")
+    current["haproxy"]["9443"] = Existing("tunnel-9443", "203.0.113.7:443")
+    current["xray"]["10001"] = Existing("10001", "203.0.113.1:10001")
+    plan = desired.plan(desired.validate(DOCUMENT))
+    assert {change.service for change in plan.changes} == set(desired.SERVICES)
+    assert desired.apply(plan).success
+    assert [service for service, _ in calls] == list(desired.SERVICES)
+    changes = dict(calls)
+    assert sorted(changes["gost"]) == [("change", "8443"), ("remove", "8444")]
+    assert changes["haproxy"] == [("add", "9444")]
+    assert sorted(changes["xray"]) == [("add", "10000"), ("remove", "10001")]
+    assert sorted(changes["iptables"]) == [("add", "tcp/443"), ("add", "tcp/80")]
+
+
+def test_services_without_changes_are_skipped(services):
+    current, calls = services
+    current["haproxy"]["9443"] = Existing("tunnel-9443", "203.0.113.7:443")
+    current["haproxy"]["9444"] = Existing("tunnel-9444", "203.0.113.8:443")
+    assert desired.apply(desired.plan(desired.validate(DOCUMENT))).success
+    assert "haproxy" not in dict(calls)
+
+
+def test_a_port_conflict_applies_nothing(services, monkeypatch):
+    _, calls = services
+    monkeypatch.setattr(desired.ports, "scan", lambda: FakePorts(held={10000}))
+    plan = desired.plan(desired.validate(DOCUMENT))
+    assert plan.conflicts == ["xray 10000: port 10000 is in use by another backend"]
+    result = desired.apply(plan)
+    assert not result.success
+    assert calls == []
+
+
+def test_a_port_freed_by_the_same_plan_is_not_a_conflict(services, monkeypatch):
+    current, calls = services
+    current["gost"]["10000"] = Existing("10000", "example.com:10000", "TCP/UDP")
+    monkeypatch.setattr(desired.ports, "scan", lambda: FakePorts(held={10000}))
+    plan = desired.plan(desired.validate({"gost": [], "xray": [{"port": 10000, "destination": "203.0.113.7"}]}))
+    assert plan.conflicts == []
+    assert desired.apply(plan).success
+    assert [service for service, _ in calls] == ["gost", "xray"]
@@ -0,0 +1,169 @@
+"""RuntimeClient against a stand-in for HAProxy's admin socket."""
+
+import shutil
+import socketserver
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+from shifter.services.haproxy_runtime import HAProxyRuntimeError, RuntimeClient
+
+STAT = (
+    "# pxname,svname,status,weight\n"
+    "tunnel-443,FRONTEND,OPEN,\n"
+    "tunnel-1.2.3.4-443,target_server,UP,1\n"
+    "\n"
+)
+
+
+class StubRuntime(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers one command per connection, like HAProxy's non-interactive mode."""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.commands = []
+        self.replies = {}
+        super().__init__(path, StubHandler)
+
+    def reply(self, command):
+        for prefix, answer in self.replies.items():
+            if command.startswith(prefix):
+                # A list is a sequence of answers; the last one repeats.
+                if isinstance(answer, list):
+                    return answer.pop(0) if len(answer) > 1 else answer[0]
+                return answer
+        return "\n"
+
+
+class StubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        command = self.rfile.readline().decode().strip()
+        self.server.commands.append(command)
+        self.wfile.write(self.server.reply(command).encode())
+
+
+@pytest.fixture
+def runtime():
+    # Unix socket paths are limited to ~108 bytes, so stay out of deep tmp_path dirs.
+    directory = tempfile.mkdtemp(prefix="shf-")
+    server = StubRuntime(str(Path(directory) / "admin.sock"))
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def client(runtime):
+    return RuntimeClient(runtime.server_address, timeout=2.0)
+
+
+def test_set_server_address(runtime, client):
+    client.set_server_address("tunnel-1.2.3.4-443", "target_server", "5.6.7.8", 8443)
+    client.set_server_address("tunnel-1.2.3.4-443", "target_server", "5.6.7.9")
+    assert runtime.commands == [
+        "set server tunnel-1.2.3.4-443/target_server addr 5.6.7.8 port 8443",
+        "set server tunnel-1.2.3.4-443/target_server addr 5.6.7.9",
+    ]
+
+
+@pytest.mark.parametrize("method, state", [
+    ("enable_server", "ready"),
+    ("disable_server", "maint"),
+    ("drain_server", "drain"),
+])
+def test_server_states(runtime, client, method, state):
+    getattr(client, method)("be", "srv")
+    assert runtime.commands == [f"set server be/srv state {state}"]
+
+
+def test_unknown_state_is_rejected_locally(runtime, client):
+    with pytest.raises(ValueError):
+        client.set_server_state("be", "srv", "down")
+    assert runtime.commands == []
+
+
+def test_show_stat(runtime, client):
+    runtime.replies["show stat"] = STAT
+    rows = client.show_stat()
+    assert [row["svname"] for row in rows] == ["FRONTEND", "target_server"]
+    assert rows[1] == {"pxname": "tunnel-1.2.3.4-443", "svname": "target_server", "status": "UP", "weight": "1"}
+
+
+def test_show_stat_rejects_other_output(runtime, client):
+    runtime.replies["show stat"] = "Permission denied\n"
+    with pytest.raises(HAProxyRuntimeError, match="Unexpected 'show stat'"):
+        client.show_stat()
+
+
+@pytest.mark.parametrize("answer", [
+    "No such backend.\n",
+    "Require 'backend/server'.\n",
+    "Permission denied\n",
+    "Unknown command. Please enter one of the following commands only :\n",
+])
+def test_error_replies_raise(runtime, client, answer):
+    runtime.replies["set server"] = answer
+    with pytest.raises(HAProxyRuntimeError, match="HAProxy rejected"):
+        client.set_server_address("missing", "target_server", "5.6.7.8")
+
+
+def _sessions(count):
+    return f"# pxname,svname,scur\npool-tunnel-443,target_server_2,{count}\n"
+
+
+def test_add_server(runtime, client):
+    client.add_server("pool-tunnel-443", "target_server_2", "5.6.7.8:443", ["weight", "5", "check", "inter", "2s"])
+    assert runtime.commands == [
+        "add server pool-tunnel-443/target_server_2 5.6.7.8:443 weight 5 check inter 2s",
+        "enable health pool-tunnel-443/target_server_2",
+        "set server pool-tunnel-443/target_server_2 state ready",
+    ]
+
+
+def test_delete_server_drains_until_sessions_finish(runtime, client):
+    runtime.replies["show stat"] = [_sessions(2), _sessions(1), _sessions(0)]
+    assert client.delete_server("pool-tunnel-443", "target_server_2", drain_timeout=5, poll_interval=0.01) == 0
+    assert runtime.commands == [
+        "set server pool-tunnel-443/target_server_2 state drain",
+        "show stat pool-tunnel-443 4 -1",
+        "show stat pool-tunnel-443 4 -1",
+        "show stat pool-tunnel-443 4 -1",
+        "set server pool-tunnel-443/target_server_2 state maint",
+        "del server pool-tunnel-443/target_server_2",
+    ]
+
+
+def test_delete_server_cuts_sessions_left_after_the_timeout(runtime, client):
+    runtime.replies["show stat"] = [_sessions(3)]
+    assert client.delete_server("pool-tunnel-443", "target_server_2", drain_timeout=0.05, poll_interval=0.01) == 3
+    assert runtime.commands[0] == "set server pool-tunnel-443/target_server_2 state drain"
+    assert runtime.commands[-3:] == [
+        "set server pool-tunnel-443/target_server_2 state maint",
+        "shutdown sessions server pool-tunnel-443/target_server_2",
+        "del server pool-tunnel-443/target_server_2",
+    ]
+
+
+def test_delete_unknown_server(runtime, client):
+    runtime.replies["show stat"] = _sessions(0)
+    with pytest.raises(HAProxyRuntimeError, match="not found"):
+        client.delete_server("pool-tunnel-443", "target_server_9")
+    assert "del server pool-tunnel-443/target_server_9" not in runtime.commands
+
+
+def test_unreachable_socket(tmp_path):
+    client = RuntimeClient(str(tmp_path / "missing.sock"))
+    assert not client.is_available()
+    with pytest.raises(HAProxyRuntimeError, match="unavailable"):
+        client.execute("show info")
+
+
+def test_is_available(runtime, client):
+    assert client.is_available()
+    assert runtime.commands == ["show info"]
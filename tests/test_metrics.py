@@ -0,0 +1,22 @@
+"""Prometheus families built from HAProxy's ``show stat``."""
+
+from shifter.services import metrics
+
+
+def test_server_up_counts_servers_without_checks(monkeypatch):
+    rows = [
+        {"pxname": "tunnel-443", "svname": "FRONTEND", "status": "OPEN", "bin": "10", "bout": "20", "stot": "3", "scur": "1"},
+        {"pxname": "tunnel-1.2.3.4-443", "svname": "target_server", "status": "no check"},
+        {"pxname": "pool-tunnel-8443", "svname": "target_server", "status": "UP 2/3"},
+        {"pxname": "pool-tunnel-8443", "svname": "target_server_2", "status": "DOWN"},
+        {"pxname": "pool-tunnel-8443", "svname": "target_server_3", "status": "MAINT"},
+        {"pxname": "pool-tunnel-8443", "svname": "BACKEND", "status": "UP"},
+    ]
+    monkeypatch.setattr(metrics.RuntimeClient, "show_stat", lambda self: rows)
+    families = {family.name: family for family in metrics.haproxy_families(1.0)}
+    text = "\n".join(families["shifter_haproxy_server_up"].render())
+    assert 'shifter_haproxy_server_up{backend="tunnel-1.2.3.4-443",server="target_server"} 1' in text
+    assert 'shifter_haproxy_server_up{backend="pool-tunnel-8443",server="target_server"} 1' in text
+    assert 'shifter_haproxy_server_up{backend="pool-tunnel-8443",server="target_server_2"} 0' in text
+    assert 'shifter_haproxy_server_up{backend="pool-tunnel-8443",server="target_server_3"} 0' in text
+    assert 'server="BACKEND"' not in text
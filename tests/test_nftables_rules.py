@@ -0,0 +1,97 @@
+"""Rendering and re-reading Shifter's nftables ruleset."""
+
+import pytest
+
+from shifter.services.nftables_rules import NftRuleset
+
+
+def test_empty_ruleset():
+    text = NftRuleset().render()
+    assert text.startswith("#!/usr/sbin/nft -f\n")
+    # Declare-then-delete makes "nft -f" replace the table whether or not it exists.
+    assert "table ip shifter\ndelete table ip shifter\n" in text
+    assert "elements" not in text
+    assert "\t\tdnat to tcp dport map @tcp_forwards\n" in text
+    assert "\t\tdnat to udp dport map @udp_forwards\n" in text
+    assert "\t\tct status dnat tcp dport @tcp_ports masquerade\n" in text
+    assert "\t\tct status dnat udp dport @udp_ports masquerade\n" in text
+
+
+def test_ports_and_ranges_render_as_map_and_set_elements():
+    ruleset = NftRuleset()
+    ruleset.add("203.0.113.8", "1000:2000")
+    ruleset.add("203.0.113.7", "80,443")
+    text = ruleset.render()
+    assert (
+        "\tmap tcp_forwards {\n"
+        "\t\ttype inet_service : ipv4_addr\n"
+        "\t\tflags interval\n"
+        "\t\telements = {\n"
+        "\t\t\t80 : 203.0.113.7,\n"
+        "\t\t\t443 : 203.0.113.7,\n"
+        "\t\t\t1000-2000 : 203.0.113.8\n"
+        "\t\t}\n"
+        "\t}\n"
+    ) in text
+    assert (
+        "\tset tcp_ports {\n"
+        "\t\ttype inet_service\n"
+        "\t\tflags interval\n"
+        "\t\telements = { 80, 443, 1000-2000 }\n"
+        "\t}\n"
+    ) in text
+
+
+def test_protocols_are_kept_apart():
+    ruleset = NftRuleset()
+    ruleset.add("203.0.113.7", "53", protocols=["udp"])
+    ruleset.add("203.0.113.8", "53", protocols=["tcp"])
+    text = ruleset.render()
+    assert "\t\t\t53 : 203.0.113.8\n" in text.split("map udp_forwards")[0]
+    assert "\t\t\t53 : 203.0.113.7\n" in text.split("map udp_forwards")[1]
+    assert ruleset.entries() == [("53", "tcp", "203.0.113.8"), ("53", "udp", "203.0.113.7")]
+
+
+def test_round_trip():
+    ruleset = NftRuleset()
+    ruleset.add("203.0.113.7", "80,8000:8100")
+    ruleset.add("203.0.113.9", "5353", protocols=["udp"])
+    assert NftRuleset.from_text(ruleset.render()).forwards == ruleset.forwards
+
+
+def test_thousands_of_ports_stay_one_rule_per_protocol():
+    ruleset = NftRuleset()
+    ports = list(range(10000, 15000, 2))
+    ruleset.add("203.0.113.7", ",".join(map(str, ports)))
+    text = ruleset.render()
+    assert text.count("dnat to") == 2
+    assert text.count(" : 203.0.113.7") == 2 * len(ports)
+    reread = NftRuleset.from_text(text)
+    assert [first for first, _, _ in reread.forwards["tcp"]] == ports
+    assert reread.forwards == ruleset.forwards
+
+
+def test_adding_the_same_forward_twice_is_a_no_op():
+    ruleset = NftRuleset()
+    ruleset.add("203.0.113.7", "80")
+    ruleset.add("203.0.113.7", "80")
+    assert ruleset.entries() == [("80", "tcp", "203.0.113.7"), ("80", "udp", "203.0.113.7")]
+
+
+@pytest.mark.parametrize("ports", ["80", "70:90", "90:100"])
+def test_overlapping_intervals_are_rejected(ports):
+    ruleset = NftRuleset()
+    ruleset.add("203.0.113.7", "80:90")
+    with pytest.raises(ValueError, match="conflict with 80-90 -> 203.0.113.7"):
+        ruleset.add("203.0.113.8", ports)
+
+
+@pytest.mark.parametrize("destination, ports", [
+    ("not-an-ip", "80"),
+    ("203.0.113.7", "0"),
+    ("203.0.113.7", "2000:1000"),
+    ("203.0.113.7", ""),
+])
+def test_invalid_input_is_rejected(destination, ports):
+    with pytest.raises(ValueError):
+        NftRuleset().add(destination, ports)
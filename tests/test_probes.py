@@ -0,0 +1,92 @@
+"""Probe rounds with a slow resolver and a local TCP listener."""
+
+import asyncio
+import socket
+
+from shifter.services.probes import ProbeEngine, Resolver, Target
+
+
+class SlowResolver(Resolver):
+    """Answers after ``delay`` seconds, counting the lookups it had to make."""
+
+    def __init__(self, delay, address="127.0.0.1"):
+        super().__init__()
+        self.delay = delay
+        self.address = address
+        self.lookups = 0
+
+    async def _lookup(self, host):
+        self.lookups += 1
+        await asyncio.sleep(self.delay)
+        answer = [(socket.AF_INET, self.address)]
+        self._cache[host] = (float("inf"), answer)
+        return answer
+
+
+def _targets(count, port, host="slow.example"):
+    return [Target("gost", str(port + n), f"{host}:{port}", host, port, "TCP") for n in range(count)]
+
+
+def test_a_timed_out_waiter_does_not_cancel_the_shared_lookup():
+    async def scenario():
+        resolver = SlowResolver(delay=0.3)
+        engine = ProbeEngine(checks=("tcp",), concurrency=2, timeout=0.1, resolver=resolver)
+        summaries = await engine.run_round(_targets(3, 9))
+        # The lookup outlived every waiter and still completed for the next round.
+        await asyncio.sleep(0.4)
+        return resolver, summaries
+
+    resolver, summaries = asyncio.run(scenario())
+    entries = summaries["gost"]
+    assert len(entries) == 3
+    assert all(entry["last_ok"] is False for entry in entries)
+    assert all(entry["last_error"] == "timed out after 0.1s" for entry in entries)
+    assert resolver.lookups == 1
+    assert "slow.example" in resolver._cache
+
+
+def test_a_later_waiter_gets_the_answer_after_the_first_one_gave_up():
+    async def scenario():
+        resolver = SlowResolver(delay=0.2)
+        first = asyncio.ensure_future(asyncio.wait_for(resolver.resolve("slow.example"), 0.05))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(asyncio.wait_for(resolver.resolve("slow.example"), 1.0))
+        return resolver, await asyncio.gather(first, second, return_exceptions=True)
+
+    resolver, (first, second) = asyncio.run(scenario())
+    assert isinstance(first, asyncio.TimeoutError)
+    assert second == [(socket.AF_INET, "127.0.0.1")]
+    assert resolver.lookups == 1
+
+
+def test_concurrent_lookups_share_one_query():
+    async def scenario():
+        resolver = SlowResolver(delay=0.05)
+        answers = await asyncio.gather(*(resolver.resolve("slow.example") for _ in range(5)))
+        return resolver, answers
+
+    resolver, answers = asyncio.run(scenario())
+    assert resolver.lookups == 1
+    assert answers == [[(socket.AF_INET, "127.0.0.1")]] * 5
+
+
+def test_tcp_round_against_a_listener():
+    async def scenario():
+        server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            refused = closed.getsockname()[1]
+        engine = ProbeEngine(checks=("tcp",), timeout=2.0)
+        targets = [
+            Target("haproxy", "tunnel-open", f"127.0.0.1:{port}", "127.0.0.1", port, "TCP"),
+            Target("haproxy", "tunnel-closed", f"127.0.0.1:{refused}", "127.0.0.1", refused, "TCP"),
+        ]
+        async with server:
+            return await engine.run_round(targets)
+
+    entries = {entry["tunnel"]: entry for entry in asyncio.run(scenario())["haproxy"]}
+    assert entries["tunnel-open"]["last_ok"] is True
+    assert entries["tunnel-open"]["p50_ms"] is not None
+    assert entries["tunnel-closed"]["last_ok"] is False
+    assert entries["tunnel-closed"]["last_error"] == "connection refused"
@@ -0,0 +1,128 @@
+"""Native configs rendered from the tunnel registry."""
+
+import json
+
+import pytest
+
+from shifter.services import registry, safe_write
+
+HAPROXY_CFG = """global
+    daemon
+
+defaults
+    mode tcp
+
+frontend tunnel-8443
+    bind *:8443
+    default_backend tunnel-203.0.113.7-443
+
+backend tunnel-203.0.113.7-443
+    server target_server 203.0.113.7:443
+"""
+
+HAND_EDIT = """
+frontend by-hand
+    bind *:9000
+    default_backend by-hand
+
+backend by-hand
+    server target_server 203.0.113.9:9000
+"""
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    paths = {
+        "haproxy": tmp_path / "haproxy.cfg",
+        "xray": tmp_path / "xray.json",
+        "gost": tmp_path / "gost.json",
+    }
+    monkeypatch.setenv(registry.PATH_ENV, str(tmp_path / "tunnels.db"))
+    monkeypatch.setattr(registry, "HAPROXY_CONFIG_PATH", str(paths["haproxy"]))
+    monkeypatch.setattr(registry, "XRAY_CONFIG_PATH", str(paths["xray"]))
+    monkeypatch.setattr(registry, "GOST_CONFIG_PATH", str(paths["gost"]))
+    monkeypatch.setattr(registry, "GOST_SERVICE_PATH", str(tmp_path / "gost.service"))
+    paths["haproxy"].write_text(HAPROXY_CFG)
+    paths["xray"].write_text(json.dumps({"log": {}, "inbounds": [
+        {"tag": "api", "port": 10085, "protocol": "dokodemo-door", "settings": {"address": "127.0.0.1"}},
+    ]}))
+    paths["gost"].write_text(json.dumps({"services": []}))
+    return paths
+
+
+def _stored(service):
+    conn = registry._connect()
+    return registry.CODECS[service].render(*registry._document(conn, service))
+
+
+def test_write_renders_the_file_from_the_rows(files):
+    cfg = registry.load("haproxy")
+    cfg.add_tunnel(8444, "203.0.113.8", 443)
+    registry.write("haproxy", cfg)
+    text = files["haproxy"].read_text()
+    assert text.startswith(HAPROXY_CFG)
+    assert "frontend tunnel-8444" in text
+    assert _stored("haproxy") == text
+    assert [t["frontend"] for t in registry.entries("haproxy")] == ["tunnel-8443", "tunnel-8444"]
+
+    data = registry.load("xray")
+    data["inbounds"].append({"tag": "inbound-9443", "port": 9443, "protocol": "dokodemo-door",
+                             "settings": {"address": "203.0.113.7", "port": 443}})
+    registry.write("xray", data)
+    assert json.loads(files["xray"].read_text()) == data
+    # The API inbound is rendered but is not a tunnel.
+    assert [i["tag"] for i in registry.entries("xray")] == ["inbound-9443"]
+
+    cfg = registry.load("gost")
+    cfg.add_rule("example.com", 8080)
+    registry.write("gost", cfg)
+    assert json.loads(files["gost"].read_text()) == cfg.data
+    assert registry.entries("gost") == [{"port": "8080", "domain": "example.com:8080", "protocols": "TCP/UDP"}]
+
+
+def test_hand_edits_are_imported_before_a_change(files):
+    registry.entries("haproxy")
+    with open(files["haproxy"], "a") as f:
+        f.write(HAND_EDIT)
+    cfg = registry.load("haproxy")
+    cfg.remove_section(cfg.frontends["tunnel-8443"])
+    registry.write("haproxy", cfg)
+    text = files["haproxy"].read_text()
+    assert "frontend by-hand" in text and "frontend tunnel-8443" not in text
+    assert [t["frontend"] for t in registry.entries("haproxy")] == ["by-hand"]
+    assert registry.lookup(9000)[0]["key"] == "by-hand"
+    assert registry.lookup(8443) == []
+
+
+def test_a_rejected_config_changes_neither_file_nor_rows(files):
+    before = files["haproxy"].read_text()
+    cfg = registry.load("haproxy")
+    cfg.add_tunnel(8444, "203.0.113.8", 443)
+
+    def reject(path):
+        raise safe_write.ValidationError("rejected")
+
+    with pytest.raises(safe_write.ValidationError):
+        registry.write("haproxy", cfg, reject)
+    assert files["haproxy"].read_text() == before
+    assert _stored("haproxy") == before
+    assert registry.lookup(8444) == []
+
+
+def test_rebuild_restores_rows_from_the_files(files):
+    registry.entries("haproxy")
+    conn = registry._connect()
+    conn.execute("DELETE FROM tunnels WHERE service = 'haproxy'")
+    assert registry.rebuild(("haproxy",)) == {"haproxy": 1}
+    assert _stored("haproxy") == HAPROXY_CFG
+
+
+def test_write_without_a_usable_database_writes_the_file(files, monkeypatch, tmp_path):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setenv(registry.PATH_ENV, str(blocker / "tunnels.db"))
+    cfg = registry.load("haproxy")
+    cfg.add_tunnel(8444, "203.0.113.8", 443)
+    registry.write("haproxy", cfg)
+    assert "frontend tunnel-8444" in files["haproxy"].read_text()
+    assert [t["frontend"] for t in registry.entries("haproxy")] == ["tunnel-8443", "tunnel-8444"]
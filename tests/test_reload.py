@@ -0,0 +1,71 @@
+"""Coalesced reloads that fail and roll back every change they carried."""
+
+import pytest
+
+from shifter.services import reload, safe_write
+from shifter.services.results import ActionResult
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """A config file whose service refuses any config but the last working one."""
+    path = tmp_path / "svc.cfg"
+    path.write_text("good\n")
+    safe_write.remember_good(str(path))
+    monkeypatch.setattr(safe_write.systemd, "is_active", lambda _name: path.read_text() == "good\n")
+    monkeypatch.setattr(safe_write, "run_command", lambda command, result: True)
+    return path
+
+
+def _change(path, line, label):
+    """Append ``line`` to the config and queue its reload, as an action does."""
+    with reload.collecting(label) as tickets:
+        safe_write.write_file(str(path), path.read_text() + line)
+        result = ActionResult().ok(f"Added {label}.")
+        reload.request("svc", result, lambda r: safe_write.reload_checked(r, "svc", str(path), lambda _r: None))
+    return result, tickets
+
+
+def test_failed_reload_rolls_back_every_coalesced_change(service):
+    scheduler = reload.ReloadScheduler(window=60)
+    previous = reload.install(scheduler)
+    try:
+        first, first_tickets = _change(service, "a\n", "svc add a")
+        second, second_tickets = _change(service, "b\n", "svc add b")
+        # Both writes landed; neither is live until the queued reload runs.
+        assert service.read_text() == "good\na\nb\n"
+        assert first.success and second.success
+        scheduler.flush()
+    finally:
+        reload.install(previous)
+
+    assert service.read_text() == "good\n"
+    outcome = first_tickets[0].future.result(0)
+    assert outcome is second_tickets[0].future.result(0)
+    assert not outcome.success
+    assert outcome.rolled_back
+    assert outcome.applied == ["svc add a", "svc add b"]
+
+    first = reload.wait(first, first_tickets, 0)
+    second = reload.wait(second, second_tickets, 0)
+    assert not first.success and not second.success
+    assert "this change was rolled back. Rolled back with it: svc add b." in first.message
+    assert "this change was rolled back. Rolled back with it: svc add a." in second.message
+    assert first.data["reload"][0]["applied"] == ["svc add a", "svc add b"]
+
+
+def test_failed_reload_without_a_working_config_is_not_called_a_rollback(service):
+    (service.parent / ("svc.cfg" + safe_write.GOOD_SUFFIX)).unlink()
+    scheduler = reload.ReloadScheduler(window=60)
+    previous = reload.install(scheduler)
+    try:
+        result, tickets = _change(service, "a\n", "svc add a")
+        scheduler.flush()
+    finally:
+        reload.install(previous)
+
+    assert service.read_text() == "good\na\n"
+    result = reload.wait(result, tickets, 0)
+    assert not result.success
+    assert not result.data["reload"][0]["rolled_back"]
+    assert "the change is written but svc is not running it" in result.message
@@ -0,0 +1,201 @@
+"""XrayAPIClient and xray._apply_live against a stand-in ``xray`` binary.
+
+The client shells out to ``xray api <command>``, so the stub is an executable
+that records its arguments and stdin, prints ``reply.txt`` and exits non-zero
+while ``fail`` exists. A listening socket stands in for the API inbound.
+"""
+
+import functools
+import json
+import socket
+import sys
+
+import pytest
+
+from shifter.services.results import ActionResult
+from shifter.services import xray
+from shifter.services.xray_api import XrayAPIClient, XrayAPIError
+
+STUB = """#!{python}
+import json, os, sys
+here = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(here, "calls.jsonl"), "a") as f:
+    f.write(json.dumps({{"argv": sys.argv[1:], "stdin": sys.stdin.read()}}) + "\\n")
+args = sys.argv[1:]
+if args[:2] == ["api", "rmi"]:
+    # Like the real command: without -tags, positional arguments are config files to read.
+    positional = args[6:]
+    if "-tags" not in positional and not all(os.path.isfile(path) for path in positional):
+        sys.stderr.write("failed to read config: open %s: no such file or directory\\n" % positional[0])
+        sys.exit(1)
+if os.path.exists(os.path.join(here, "fail")):
+    sys.stderr.write("rpc error: code = Unavailable\\n")
+    sys.exit(1)
+reply = os.path.join(here, "reply.txt")
+if os.path.exists(reply):
+    sys.stdout.write(open(reply).read())
+"""
+
+
+class StubXray:
+    def __init__(self, directory):
+        self.directory = directory
+        self.binary = directory / "xray"
+        self.binary.write_text(STUB.format(python=sys.executable))
+        self.binary.chmod(0o755)
+
+    @property
+    def calls(self):
+        path = self.directory / "calls.jsonl"
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    def reply(self, text):
+        (self.directory / "reply.txt").write_text(text)
+
+    def fail(self):
+        (self.directory / "fail").write_text("")
+
+
+@pytest.fixture
+def stub(tmp_path):
+    return StubXray(tmp_path)
+
+
+@pytest.fixture
+def api_server():
+    """A listening socket, so ``is_available`` sees the API inbound as up."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(8)
+        yield "127.0.0.1:%d" % sock.getsockname()[1]
+
+
+@pytest.fixture
+def client(stub, api_server):
+    return XrayAPIClient(api_server, binary=str(stub.binary), timeout=5.0)
+
+
+def test_add_inbounds(stub, client, api_server):
+    inbound = {"tag": "inbound-8443", "port": 8443, "protocol": "dokodemo-door"}
+    client.add_inbounds([inbound])
+    client.add_inbounds([])
+    [call] = stub.calls
+    assert call["argv"] == ["api", "adi", "-s", api_server, "-t", "5"]
+    assert json.loads(call["stdin"]) == {"inbounds": [inbound]}
+
+
+def test_remove_inbounds(stub, client, api_server):
+    client.remove_inbounds(["inbound-8443", "inbound-8444"])
+    client.remove_inbounds([])
+    assert [call["argv"] for call in stub.calls] == [
+        ["api", "rmi", "-s", api_server, "-t", "5", "-tags", "inbound-8443", "inbound-8444"],
+    ]
+
+
+def test_stub_rejects_bare_tags(stub, api_server):
+    """The stub reads bare rmi arguments as config files, as xray does."""
+    client = XrayAPIClient(api_server, binary=str(stub.binary))
+    with pytest.raises(XrayAPIError, match="failed to read config"):
+        client._call("rmi", ["inbound-8443"])
+
+
+def test_query_stats(stub, client, api_server):
+    stub.reply(json.dumps({"stat": [
+        {"name": "inbound>>>inbound-8443>>>traffic>>>uplink", "value": "1024"},
+        {"name": "inbound>>>inbound-8443>>>traffic>>>downlink"},
+    ]}))
+    stats = client.query_stats("inbound>>>", reset=True)
+    assert stats == {
+        "inbound>>>inbound-8443>>>traffic>>>uplink": 1024,
+        "inbound>>>inbound-8443>>>traffic>>>downlink": 0,
+    }
+    assert stub.calls[0]["argv"] == ["api", "statsquery", "-s", api_server, "-t", "5", "-pattern", "inbound>>>", "-reset"]
+
+
+def test_query_stats_empty_and_malformed(stub, client):
+    assert client.query_stats() == {}
+    stub.reply("not json")
+    with pytest.raises(XrayAPIError, match="Unexpected statsquery"):
+        client.query_stats()
+
+
+def test_rejected_call_raises(stub, client):
+    stub.fail()
+    with pytest.raises(XrayAPIError, match="rpc error"):
+        client.remove_inbounds(["inbound-8443"])
+
+
+def test_missing_binary_raises(tmp_path, api_server):
+    client = XrayAPIClient(api_server, binary=str(tmp_path / "missing"))
+    with pytest.raises(XrayAPIError, match="failed"):
+        client.add_inbounds([{"port": 1}])
+
+
+def test_is_available(stub, api_server):
+    assert XrayAPIClient(api_server, binary=str(stub.binary)).is_available()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed = "127.0.0.1:%d" % sock.getsockname()[1]
+    assert not XrayAPIClient(closed, binary=str(stub.binary)).is_available()
+
+
+# --- xray._apply_live ---
+
+@pytest.fixture
+def live(stub, monkeypatch, tmp_path):
+    """Point xray._apply_live at the stub and record restarts instead of running systemctl."""
+    restarts = []
+
+    def restart(result):
+        restarts.append(result)
+        return True
+
+    monkeypatch.setattr(xray, "XrayAPIClient", functools.partial(XrayAPIClient, binary=str(stub.binary)))
+    monkeypatch.setattr(xray, "XRAY_CONFIG_PATH", str(tmp_path / "config.json"))
+    monkeypatch.setattr(xray, "_restart_xray", restart)
+    return restarts
+
+
+def _config(api_server):
+    host, _, port = api_server.rpartition(":")
+    return {
+        "api": {"tag": "api"},
+        "inbounds": [{"tag": "api", "listen": host, "port": int(port), "protocol": "dokodemo-door"}],
+    }
+
+
+def test_apply_live_uses_the_api(stub, live, api_server):
+    added = {"tag": "inbound-8443", "port": 8443}
+    result = ActionResult()
+    assert xray._apply_live(result, _config(api_server), added=[added], removed=[{"tag": "inbound-8000", "port": 8000}])
+    assert [call["argv"][1] for call in stub.calls] == ["rmi", "adi"]
+    assert live == []
+    assert not result.errors
+
+
+def test_apply_live_restarts_when_the_api_rejects(stub, live, api_server):
+    stub.fail()
+    result = ActionResult()
+    assert xray._apply_live(result, _config(api_server), added=[{"tag": "inbound-8443", "port": 8443}])
+    assert live == [result]
+    assert any("rpc error" in warning for warning in result.errors)
+
+
+def test_apply_live_restarts_when_the_api_is_down(stub, live, api_server):
+    config = _config(api_server)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        config["inbounds"][0]["port"] = sock.getsockname()[1]
+    result = ActionResult()
+    assert xray._apply_live(result, config, added=[{"tag": "inbound-8443", "port": 8443}])
+    assert live == [result]
+    assert stub.calls == []
+
+
+def test_apply_live_restarts_for_untagged_removals(stub, live, api_server):
+    result = ActionResult()
+    assert xray._apply_live(result, _config(api_server), removed=[{"port": 8000}])
+    assert live == [result]
+    assert stub.calls == []